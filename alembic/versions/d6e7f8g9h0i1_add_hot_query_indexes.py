@@ -0,0 +1,36 @@
+"""Alembic migration for secondary indexes on hot query columns."""
+
+from alembic import op
+
+revision = 'd6e7f8g9h0i1'
+down_revision = 'c5d6e7f8g9h0'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns) - mirrors the __table_args__ in database.py
+INDEXES = [
+    ('ix_contacts_role_name', 'contacts', ['role', 'name']),
+    ('ix_financial_ledger_date', 'financial_ledger', ['date']),
+    ('ix_financial_ledger_direction_category', 'financial_ledger', ['direction', 'category']),
+    ('ix_financial_ledger_contact_id', 'financial_ledger', ['contact_id']),
+    ('ix_inventory_logs_item_name_date', 'inventory_logs', ['item_name', 'date']),
+    ('ix_inventory_logs_date', 'inventory_logs', ['date']),
+    ('ix_inventory_logs_ledger_id', 'inventory_logs', ['ledger_id']),
+    ('ix_audit_logs_timestamp', 'audit_logs', ['timestamp']),
+    ('ix_inventory_items_type_quantity', 'inventory_items', ['type', 'quantity']),
+    ('ix_inventory_items_name', 'inventory_items', ['name']),
+    ('ix_flocks_status', 'flocks', ['status']),
+    ('ix_vaccination_records_flock_id', 'vaccination_records', ['flock_id']),
+    ('ix_vaccination_records_next_due_date', 'vaccination_records', ['next_due_date']),
+    ('ix_vaccination_records_date', 'vaccination_records', ['date']),
+    ('ix_daily_feed_usage_daily_entry_id', 'daily_feed_usage', ['daily_entry_id']),
+    ('ix_daily_feed_usage_feed_item_id', 'daily_feed_usage', ['feed_item_id']),
+]
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
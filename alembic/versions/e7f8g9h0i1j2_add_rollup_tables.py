@@ -0,0 +1,73 @@
+"""Alembic migration for DAY/WEEK/MONTH rollup tables (with backfill)."""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'e7f8g9h0i1j2'
+down_revision = 'd6e7f8g9h0i1'
+branch_labels = None
+depends_on = None
+
+# SQLite expressions for the bucket start of a date column (Monday weeks)
+PERIOD_STARTS = {
+    'DAY': "date({col})",
+    'WEEK': "date({col}, '-6 days', 'weekday 1')",
+    'MONTH': "date({col}, 'start of month')",
+}
+
+def upgrade():
+    op.create_table(
+        'production_rollups',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('period', sa.String(), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('days', sa.Integer(), server_default='0'),
+        sa.Column('eggs_collected', sa.Integer(), server_default='0'),
+        sa.Column('eggs_broken', sa.Integer(), server_default='0'),
+        sa.Column('feed_used_kg', sa.Float(), server_default='0'),
+        sa.Column('feed_cost', sa.Float(), server_default='0'),
+        sa.Column('income', sa.Float(), server_default='0'),
+        sa.Column('mortality_count', sa.Integer(), server_default='0'),
+        sa.Column('flock_total', sa.Integer(), server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint('period', 'period_start', name='uq_production_rollups_period')
+    )
+    op.create_table(
+        'ledger_rollups',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('period', sa.String(), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('direction', sa.String(), nullable=False),
+        sa.Column('category', sa.String(), nullable=False),
+        sa.Column('amount', sa.Float(), server_default='0'),
+        sa.Column('entries', sa.Integer(), server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint('period', 'period_start', 'direction', 'category', name='uq_ledger_rollups_bucket')
+    )
+
+    # Backfill from existing history
+    for period, expr in PERIOD_STARTS.items():
+        start = expr.format(col='date')
+        op.execute(f"""
+            INSERT INTO production_rollups
+                (period, period_start, days, eggs_collected, eggs_broken, feed_used_kg,
+                 feed_cost, income, mortality_count, flock_total)
+            SELECT '{period}', {start}, COUNT(*),
+                   SUM(COALESCE(eggs_collected, 0)), SUM(COALESCE(eggs_broken, 0)),
+                   SUM(COALESCE(feed_used_kg, 0)), SUM(COALESCE(feed_cost, 0)),
+                   SUM(COALESCE(income, 0)), SUM(COALESCE(mortality_count, 0)),
+                   SUM(COALESCE(flock_total, 0))
+            FROM daily_entries
+            GROUP BY {start}
+        """)
+        op.execute(f"""
+            INSERT INTO ledger_rollups (period, period_start, direction, category, amount, entries)
+            SELECT '{period}', {start}, direction, COALESCE(category, 'Other'), SUM(amount), COUNT(*)
+            FROM financial_ledger
+            WHERE date IS NOT NULL
+            GROUP BY {start}, direction, COALESCE(category, 'Other')
+        """)
+
+def downgrade():
+    op.drop_table('ledger_rollups')
+    op.drop_table('production_rollups')
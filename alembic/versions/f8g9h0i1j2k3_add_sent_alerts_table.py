@@ -0,0 +1,21 @@
+"""Alembic migration for the alert scheduler's sent_alerts table."""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'f8g9h0i1j2k3'
+down_revision = 'e7f8g9h0i1j2'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'sent_alerts',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('alert_key', sa.String(), unique=True, nullable=False),
+        sa.Column('message', sa.String(), server_default=''),
+        sa.Column('sent_at', sa.DateTime(), nullable=False, server_default=sa.func.now())
+    )
+
+def downgrade():
+    op.drop_table('sent_alerts')
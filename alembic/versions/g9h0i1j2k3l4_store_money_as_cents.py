@@ -0,0 +1,67 @@
+"""Alembic migration storing money columns as integer cents."""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'g9h0i1j2k3l4'
+down_revision = 'f8g9h0i1j2k3'
+branch_labels = None
+depends_on = None
+
+# table -> [(column, nullable)]
+MONEY_COLUMNS = {
+    'financial_ledger': [('amount', False)],
+    'daily_entries': [('income', True), ('feed_cost', True)],
+    'inventory_items': [('cost_per_unit', True)],
+    'production_rollups': [('feed_cost', True), ('income', True)],
+    'ledger_rollups': [('amount', True)],
+}
+
+# Same bucket expressions as the rollup backfill (Monday weeks)
+PERIOD_STARTS = {
+    'DAY': "date({col})",
+    'WEEK': "date({col}, '-6 days', 'weekday 1')",
+    'MONTH': "date({col}, 'start of month')",
+}
+
+def _alter(table, columns, from_type, to_type):
+    with op.batch_alter_table(table) as batch:
+        for column, nullable in columns:
+            batch.alter_column(column, type_=to_type, existing_type=from_type, existing_nullable=nullable)
+
+def upgrade():
+    for table, columns in MONEY_COLUMNS.items():
+        if table.endswith('_rollups'):
+            continue
+        for column, _ in columns:
+            op.execute(f"UPDATE {table} SET {column} = CAST(ROUND({column} * 100) AS INTEGER) WHERE {column} IS NOT NULL")
+        _alter(table, columns, sa.Float(), sa.Integer())
+
+    # Re-add the rollups from the converted cents so they match the source rows exactly
+    for table in ('production_rollups', 'ledger_rollups'):
+        _alter(table, MONEY_COLUMNS[table], sa.Float(), sa.Integer())
+    for period, expr in PERIOD_STARTS.items():
+        start = expr.format(col='d.date')
+        op.execute(f"""
+            UPDATE production_rollups SET
+                feed_cost = (SELECT COALESCE(SUM(d.feed_cost), 0) FROM daily_entries d
+                             WHERE {start} = production_rollups.period_start),
+                income = (SELECT COALESCE(SUM(d.income), 0) FROM daily_entries d
+                          WHERE {start} = production_rollups.period_start)
+            WHERE period = '{period}'
+        """)
+        start = expr.format(col='f.date')
+        op.execute(f"""
+            UPDATE ledger_rollups SET
+                amount = (SELECT COALESCE(SUM(f.amount), 0) FROM financial_ledger f
+                          WHERE {start} = ledger_rollups.period_start
+                            AND f.direction = ledger_rollups.direction
+                            AND COALESCE(f.category, 'Other') = ledger_rollups.category)
+            WHERE period = '{period}'
+        """)
+
+def downgrade():
+    for table, columns in MONEY_COLUMNS.items():
+        _alter(table, columns, sa.Integer(), sa.Float())
+        for column, _ in columns:
+            op.execute(f"UPDATE {table} SET {column} = {column} / 100.0 WHERE {column} IS NOT NULL")
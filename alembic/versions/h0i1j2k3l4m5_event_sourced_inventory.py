@@ -0,0 +1,59 @@
+"""Alembic migration keying inventory logs by item id, with snapshots."""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'h0i1j2k3l4m5'
+down_revision = 'g9h0i1j2k3l4'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('inventory_logs') as batch:
+        batch.add_column(sa.Column('item_id', sa.Integer(), nullable=True))
+        batch.create_foreign_key('fk_inventory_logs_item_id', 'inventory_items', ['item_id'], ['id'])
+        batch.create_index('ix_inventory_logs_item_id', ['item_id'])
+
+    op.create_table(
+        'inventory_snapshots',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('item_id', sa.Integer(), sa.ForeignKey('inventory_items.id'), nullable=False),
+        sa.Column('last_log_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('quantity', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now())
+    )
+    op.create_index('ix_inventory_snapshots_item_date', 'inventory_snapshots', ['item_id', 'date'])
+
+    # Logs only had names until now; attach them to the (first) item of that name
+    op.execute("""
+        UPDATE inventory_logs SET item_id = (
+            SELECT MIN(i.id) FROM inventory_items i WHERE i.name = inventory_logs.item_name
+        )
+    """)
+
+    # Quantities were sometimes changed without a log. Record the difference as
+    # an opening balance so the log reproduces today's stock exactly. It is
+    # dated the day before the item's first log (today for items without
+    # logs) so it precedes every logged event: dated today it would count
+    # only from today, and every earlier day's stock would be off by it.
+    op.execute("""
+        INSERT INTO inventory_logs (date, item_name, quantity_change, item_id, created_at)
+        SELECT COALESCE((SELECT date(MIN(l.date), '-1 day') FROM inventory_logs l WHERE l.item_id = i.id),
+                        date('now')),
+               i.name,
+               COALESCE(i.quantity, 0) - COALESCE((SELECT SUM(l.quantity_change) FROM inventory_logs l
+                                                   WHERE l.item_id = i.id), 0),
+               i.id, CURRENT_TIMESTAMP
+        FROM inventory_items i
+        WHERE ABS(COALESCE(i.quantity, 0) - COALESCE((SELECT SUM(l.quantity_change) FROM inventory_logs l
+                                                      WHERE l.item_id = i.id), 0)) > 0.000001
+    """)
+
+def downgrade():
+    op.drop_index('ix_inventory_snapshots_item_date', table_name='inventory_snapshots')
+    op.drop_table('inventory_snapshots')
+    with op.batch_alter_table('inventory_logs') as batch:
+        batch.drop_index('ix_inventory_logs_item_id')
+        batch.drop_constraint('fk_inventory_logs_item_id', type_='foreignkey')
+        batch.drop_column('item_id')
@@ -0,0 +1,32 @@
+"""Alembic migration adding a running balance to inventory logs."""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'i1j2k3l4m5n6'
+down_revision = 'h0i1j2k3l4m5'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('inventory_logs') as batch:
+        batch.add_column(sa.Column('balance_after', sa.Float(), nullable=True))
+        batch.drop_index('ix_inventory_logs_item_id')
+        batch.create_index('ix_inventory_logs_item_id_date', ['item_id', 'date'])
+
+    # Running balance in (date, id) order, the order stock.py reads it in;
+    # the opening balances of h0i1j2k3l4m5 have high ids but early dates
+    op.execute("""
+        UPDATE inventory_logs SET balance_after = (
+            SELECT SUM(l.quantity_change) FROM inventory_logs l
+            WHERE l.item_id = inventory_logs.item_id
+              AND (l.date < inventory_logs.date OR (l.date = inventory_logs.date AND l.id <= inventory_logs.id))
+        )
+        WHERE item_id IS NOT NULL
+    """)
+
+def downgrade():
+    with op.batch_alter_table('inventory_logs') as batch:
+        batch.drop_index('ix_inventory_logs_item_id_date')
+        batch.create_index('ix_inventory_logs_item_id', ['item_id'])
+        batch.drop_column('balance_after')
@@ -0,0 +1,23 @@
+"""Alembic migration for the anomaly detector's anomaly_states table."""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'j2k3l4m5n6o7'
+down_revision = 'i1j2k3l4m5n6'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'anomaly_states',
+        sa.Column('metric', sa.String(), primary_key=True),
+        sa.Column('last_date', sa.Date(), nullable=False),
+        sa.Column('mean', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('var', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now())
+    )
+
+def downgrade():
+    op.drop_table('anomaly_states')
@@ -0,0 +1,58 @@
+"""Alembic migration for the per-flock vaccination_schedule table."""
+
+from datetime import date, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'k3l4m5n6o7p8'
+down_revision = 'j2k3l4m5n6o7'
+branch_labels = None
+depends_on = None
+
+# vaccinations.DEFAULT_SCHEDULE at the time of this migration
+DEFAULT_SCHEDULE = {
+    7: "Newcastle (1st)",
+    10: "Gumboro (1st)",
+    14: "Newcastle Booster",
+    18: "Gumboro (2nd)",
+    21: "Newcastle (1st) - Kienyeji",
+    28: "Newcastle + IB",
+    42: "Fowl Pox",
+    56: "Fowl Typhoid",
+    112: "Deworming",
+    126: "Newcastle + IB (Layer Boost)",
+}
+
+def upgrade():
+    schedule = op.create_table(
+        'vaccination_schedule',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('flock_id', sa.Integer(), sa.ForeignKey('flocks.id'), nullable=False),
+        sa.Column('vaccine_name', sa.String(), nullable=False),
+        sa.Column('age_days', sa.Integer(), nullable=False),
+        sa.Column('due_date', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False, server_default='PENDING'),
+        sa.Column('record_id', sa.Integer(), sa.ForeignKey('vaccination_records.id'), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now())
+    )
+    op.create_index('ix_vaccination_schedule_status_due', 'vaccination_schedule', ['status', 'due_date'])
+    op.create_index('ix_vaccination_schedule_flock_id', 'vaccination_schedule', ['flock_id'])
+
+    # Plan the remaining doses of existing active flocks; past ones are skipped
+    today = date.today()
+    flocks = op.get_bind().execute(sa.text("SELECT id, hatch_date FROM flocks WHERE status = 'ACTIVE'")).all()
+    rows = []
+    for flock_id, hatch in flocks:
+        hatch = date.fromisoformat(str(hatch)[:10])
+        for age, vaccine in DEFAULT_SCHEDULE.items():
+            due = hatch + timedelta(days=age)
+            rows.append({'flock_id': flock_id, 'vaccine_name': vaccine, 'age_days': age, 'due_date': due,
+                         'status': 'PENDING' if due >= today else 'SKIPPED'})
+    if rows:
+        op.bulk_insert(schedule, rows)
+
+def downgrade():
+    op.drop_index('ix_vaccination_schedule_flock_id', table_name='vaccination_schedule')
+    op.drop_index('ix_vaccination_schedule_status_due', table_name='vaccination_schedule')
+    op.drop_table('vaccination_schedule')
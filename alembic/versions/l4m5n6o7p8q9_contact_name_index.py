@@ -0,0 +1,14 @@
+"""Alembic migration for the name index behind the paginated contact list."""
+
+from alembic import op
+
+revision = 'l4m5n6o7p8q9'
+down_revision = 'k3l4m5n6o7p8'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_contacts_name', 'contacts', ['name'])
+
+def downgrade():
+    op.drop_index('ix_contacts_name', table_name='contacts')
@@ -0,0 +1,19 @@
+"""Alembic migration for case-insensitive contact name indexes (paging and prefix search)."""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'm5n6o7p8q9r0'
+down_revision = 'l4m5n6o7p8q9'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.drop_index('ix_contacts_name', table_name='contacts')
+    op.create_index('ix_contacts_role_name_nocase', 'contacts', ['role', sa.text('name COLLATE NOCASE')])
+    op.create_index('ix_contacts_name_nocase', 'contacts', [sa.text('name COLLATE NOCASE')])
+
+def downgrade():
+    op.drop_index('ix_contacts_name_nocase', table_name='contacts')
+    op.drop_index('ix_contacts_role_name_nocase', table_name='contacts')
+    op.create_index('ix_contacts_name', 'contacts', ['name'])
@@ -0,0 +1,263 @@
+"""
+Deterministic synthetic farm history for benchmarks.
+
+Fills every table with `days` of plausible daily operation ending today:
+flocks replaced every few hundred days, daily entries with per-feed usage
+and inventory moves, feed restocks, egg sales and expenses spread over a
+pool of contacts, vaccinations, audit events and users. Rollups, inventory
+snapshots and vaccination schedules are then derived from that data the
+same way the bot does. The same seed and scale always produce the same rows
+(dates are relative to the end date).
+
+Source rows are written with executemany INSERTs in batches; most of the
+time (under a minute for the default five years) goes into
+`rebuild_rollups`, so reuse a generated file with `run.py --db` when
+comparing runs.
+
+Usage:
+    python benchmarks/datagen.py farm.db [--years 5] [--ledger-per-day 12] [--contacts 200] [--seed 42]
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import func, insert
+
+from database import (
+    Base, AuditLog, Contact, DailyEntry, DailyFeedUsage, FinancialLedger, Flock, InventoryItem,
+    InventoryLog, SentAlert, SystemSettings, User, VaccinationRecord,
+)
+
+BATCH = 5000
+FEEDS = [("Chick Mash", 0, 56), ("Growers Mash", 56, 126), ("Layers Mash", 126, 10_000), ("Layers Pellets", 126, 10_000)]
+MEDICATIONS = ["Newcastle Lasota", "Gumboro Vaccine", "Fowl Pox Vaccine", "Dewormer"]
+EXPENSES = [("Labor", 0.25, 600, 1500), ("Meds", 0.1, 300, 4000), ("Utilities", 0.1, 200, 2500),
+            ("Transport", 0.2, 150, 1200), ("Packaging", 0.1, 100, 900)]
+FIRST_NAMES = ["Wanjiru", "Otieno", "Achieng", "Kamau", "Njeri", "Mutua", "Atieno", "Kiprop", "Wambui", "Omondi"]
+
+
+def _flush(db, model, rows: list):
+    if rows:
+        db.execute(insert(model), rows)
+        rows.clear()
+
+
+def _add(db, model, rows: list, row: dict):
+    rows.append(row)
+    if len(rows) >= BATCH:
+        _flush(db, model, rows)
+
+
+def generate(db, days: int = 5 * 365, ledger_per_day: int = 12, contacts: int = 200,
+             seed: int = 42, end: Optional[date] = None) -> Dict[str, int]:
+    """Populate an empty database. Commits; returns {table: row count}."""
+    from anomaly import detect
+    from rollups import rebuild_rollups
+    from stock import take_snapshots
+    from vaccinations import DEFAULT_SCHEDULE, generate_schedule
+
+    rng = random.Random(seed)
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+
+    # --- Reference data ---
+    db.execute(insert(SystemSettings), [
+        {"key": "price_per_egg", "value": "15"}, {"key": "price_per_crate", "value": "420"},
+        {"key": "feed_bag_weight", "value": "70"}, {"key": "feed_low_threshold", "value": "80"},
+    ])
+    db.execute(insert(User), [
+        {"telegram_id": 1000 + i, "name": FIRST_NAMES[i], "role": role, "is_active": True}
+        for i, role in enumerate(["ADMIN", "ADMIN", "MANAGER", "STAFF", "STAFF"])
+    ])
+    roles = ["CUSTOMER"] * 6 + ["SUPPLIER"] * 3 + ["VET"]
+    db.execute(insert(Contact), [
+        {"name": f"{rng.choice(FIRST_NAMES)} {i:04d}", "role": rng.choice(roles),
+         "phone": f"07{rng.randrange(10**8):08d}", "trust_score": rng.randint(10, 100)}
+        for i in range(contacts)
+    ])
+    contact_ids = {role: [cid for (cid,) in db.query(Contact.id).filter_by(role=role)] for role in set(roles)}
+
+    feed_items, med_items = {}, {}
+    for name, _, _ in FEEDS:
+        feed_items[name] = InventoryItem(name=name, type="FEED", quantity=0.0, unit="kg",
+                                         cost_per_unit=rng.randint(45, 70), bag_weight=70.0)
+    for name in MEDICATIONS:
+        med_items[name] = InventoryItem(name=name, type="MEDICATION", quantity=0.0, unit="doses", cost_per_unit=2)
+    eggs_item = InventoryItem(name="Eggs", type="EGGS", quantity=0.0, unit="eggs", cost_per_unit=15)
+    db.add_all([*feed_items.values(), *med_items.values(), eggs_item])
+    db.flush()
+    balances = {item.id: 0.0 for item in (*feed_items.values(), *med_items.values(), eggs_item)}
+
+    # --- Flocks: a new batch every ~300 days, the last two stay active ---
+    flocks = []
+    hatch = start - timedelta(days=140)
+    while hatch <= end - timedelta(days=30):
+        size = rng.randint(500, 1500)
+        flocks.append(Flock(name=f"Flock {hatch:%b %Y}", breed=rng.choice(["Layers", "Kenbro", "Kuroiler"]),
+                            hatch_date=hatch, initial_count=size, current_count=size,
+                            hens_count=int(size * 0.95), roosters_count=size - int(size * 0.95), status="SOLD"))
+        hatch += timedelta(days=rng.randint(270, 330))
+    for flock in flocks[-2:]:
+        flock.status = "ACTIVE"
+    db.add_all(flocks)
+    db.flush()
+
+    entries, usages, logs, ledger, audits, vaccinations = [], [], [], [], [], []
+
+    def move(item, delta, day, ledger_id=None, flock_id=None):
+        balances[item.id] += delta
+        _add(db, InventoryLog, logs, {
+            "date": day, "item_id": item.id, "item_name": item.name, "quantity_change": delta,
+            "balance_after": balances[item.id], "ledger_id": ledger_id, "flock_id": flock_id,
+            "created_at": datetime.combine(day, datetime.min.time()),
+        })
+
+    ledger_id = 0
+    def spend(day, amount, direction, category, description, contact_pool=None):
+        nonlocal ledger_id
+        ledger_id += 1
+        _add(db, FinancialLedger, ledger, {
+            "id": ledger_id, "date": day, "description": description, "amount": round(amount, 2),
+            "direction": direction, "category": category, "payment_method": rng.choice(["CASH", "MPESA", "CREDIT"]),
+            "contact_id": rng.choice(contact_ids[contact_pool]) if contact_pool and contact_ids.get(contact_pool) else None,
+        })
+        return ledger_id
+
+    # Opening stock
+    for item in feed_items.values():
+        move(item, 1400.0, start, spend(start, 1400 * item.cost_per_unit, "OUT", "Feed", f"Opening {item.name}", "SUPPLIER"))
+    for item in med_items.values():
+        move(item, 2000.0, start)
+
+    entry_id = 0
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        alive = []
+        for flock in flocks:
+            age = (day - flock.hatch_date).days
+            if 0 <= age < 600:
+                alive.append((flock, age))
+        birds = sum(f.current_count for f, _ in alive)
+
+        # Production follows the layer curve with noise
+        eggs = 0
+        for flock, age in alive:
+            weeks = age / 7
+            rate = 0 if weeks < 19 else min(0.93, (weeks - 19) * 0.15) if weeks < 26 else max(0.55, 0.93 - (weeks - 30) * 0.005)
+            eggs += int(flock.hens_count * rate * rng.uniform(0.9, 1.05))
+        broken = int(eggs * rng.uniform(0, 0.03))
+        deaths = rng.choices([0, 1, 2, 5], weights=[80, 14, 5, 1])[0] if birds else 0
+        if deaths and alive:
+            alive[0][0].current_count = max(alive[0][0].current_count - deaths, 0)
+
+        # Feed: one or two feeds depending on the oldest flock's age
+        feed_kg = round(birds * rng.uniform(0.11, 0.13), 1)
+        entry_id += 1
+        day_usages = []
+        if alive and feed_kg:
+            age = max(a for _, a in alive)
+            names = [n for n, lo, hi in FEEDS if lo <= age < hi] or ["Layers Mash"]
+            split = rng.uniform(0.5, 0.8) if len(names) > 1 else 1.0
+            day_usages = [(names[0], round(feed_kg * split, 1))] + ([(names[1], round(feed_kg * (1 - split), 1))] if len(names) > 1 else [])
+        feed_cost = 0.0
+        for name, kg in day_usages:
+            item = feed_items[name]
+            if balances[item.id] < kg * 3:  # Restock about ten days' worth
+                bags = rng.randint(12, 25)
+                lid = spend(day, bags * 70 * item.cost_per_unit, "OUT", "Feed", f"{bags} bags {name}", "SUPPLIER")
+                move(item, bags * 70.0, day, lid)
+            move(item, -kg, day)
+            feed_cost += kg * float(item.cost_per_unit)
+            _add(db, DailyFeedUsage, usages, {"daily_entry_id": entry_id, "feed_item_id": item.id, "quantity_kg": kg})
+
+        # Sales and expenses
+        income = 0.0
+        sales = max(1, ledger_per_day // 2)
+        for _ in range(sales if eggs else 0):
+            crates = rng.randint(1, max(1, eggs // (30 * sales)))
+            amount = crates * 420.0
+            income += amount
+            spend(day, amount, "IN", "Egg Sales", f"{crates} crates", "CUSTOMER")
+        for _ in range(ledger_per_day - sales):
+            category, _, lo, hi = rng.choices(EXPENSES, weights=[w for _, w, _, _ in EXPENSES])[0]
+            spend(day, rng.uniform(lo, hi), "OUT", category, category, "VET" if category == "Meds" else "SUPPLIER")
+        move(eggs_item, eggs - broken, day)
+        if income:
+            move(eggs_item, -min(balances[eggs_item.id], income / 420 * 30), day)
+
+        _add(db, DailyEntry, entries, {
+            "id": entry_id, "date": day, "eggs_collected": eggs, "eggs_broken": broken, "eggs_good": eggs - broken,
+            "eggs_sold": int(income / 420 * 30), "crates_sold": int(income / 420), "income": round(income, 2),
+            "feed_used_kg": sum(kg for _, kg in day_usages), "feed_cost": round(feed_cost, 2),
+            "mortality_count": deaths, "mortality_reasons": "Unknown" if deaths else "",
+            "flock_total": birds, "flock_added": 0, "flock_removed": 0,
+        })
+        for action in rng.sample(["eggs_added", "feed_recorded", "sale", "expense", "flock_mortality"], 3):
+            _add(db, AuditLog, audits, {"timestamp": datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randint(6, 20)),
+                                        "user_id": 1000 + rng.randrange(5), "action": action, "details": f"{action} on {day}"})
+
+        # Vaccinations on schedule for flocks alive today
+        for flock, age in alive:
+            vaccine = DEFAULT_SCHEDULE.get(age)
+            if vaccine:
+                item = rng.choice(list(med_items.values()))
+                if balances[item.id] < flock.current_count:
+                    lid = spend(day, 5000 * float(item.cost_per_unit), "OUT", "Meds", f"5000 doses {item.name}", "VET")
+                    move(item, 5000.0, day, lid)
+                move(item, -float(flock.current_count), day, flock_id=str(flock.id))
+                _add(db, VaccinationRecord, vaccinations, {
+                    "flock_id": flock.id, "vaccine_name": vaccine, "doses_used": flock.current_count,
+                    "birds_vaccinated": flock.current_count, "date": day,
+                })
+
+    for model, rows in ((DailyEntry, entries), (DailyFeedUsage, usages), (FinancialLedger, ledger),
+                        (InventoryLog, logs), (AuditLog, audits), (VaccinationRecord, vaccinations)):
+        _flush(db, model, rows)
+    for item in (*feed_items.values(), *med_items.values(), eggs_item):
+        item.quantity = balances[item.id]
+    db.add_all(SentAlert(alert_key=f"feed_low:{end - timedelta(days=i)}", message="Feed low",
+                         sent_at=datetime.combine(end - timedelta(days=i), datetime.min.time())) for i in range(5))
+    for flock in flocks:
+        if flock.status == "ACTIVE":
+            generate_schedule(db, flock)
+    db.commit()
+
+    rebuild_rollups(db)
+    take_snapshots(db)
+    detect(db, end)
+    db.commit()
+    return {table.name: db.query(func.count()).select_from(table).scalar() for table in Base.metadata.sorted_tables}
+
+
+def main():
+    from sqlalchemy.orm import sessionmaker
+    from database import create_db_engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="SQLite file to create (must not exist)")
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--ledger-per-day", type=int, default=12)
+    parser.add_argument("--contacts", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} already exists")
+    engine = create_db_engine(f"sqlite:///{args.path}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(autoflush=False, bind=engine)()
+    try:
+        counts = generate(db, int(args.years * 365), args.ledger_per_day, args.contacts, args.seed)
+    finally:
+        db.close()
+    for table, count in counts.items():
+        print(f"{table:<24}{count:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Stand-ins for the aiogram objects handlers touch, so they can be driven
+without Telegram. Each records what the handler sent instead of sending it.
+"""
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int = 1000):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.sent: List[Dict[str, Any]] = []
+
+    async def edit_text(self, text: str = "", **kwargs):
+        self.sent.append({"text": text, **kwargs})
+        return self
+
+    async def answer(self, text: str = "", **kwargs):
+        self.sent.append({"text": text, **kwargs})
+        return self
+
+
+class FakeCallbackQuery:
+    def __init__(self, data: str, user_id: int = 1000):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, full_name="Bench")
+        self.message = FakeMessage(user_id)
+        self.answers: List[Optional[str]] = []
+
+    async def answer(self, text: Optional[str] = None, **kwargs):
+        self.answers.append(text)
+
+
+class FakeState:
+    """Minimal FSMContext."""
+
+    def __init__(self):
+        self.state = None
+        self.data: Dict[str, Any] = {}
+
+    async def set_state(self, state=None):
+        self.state = state
+
+    async def get_state(self):
+        return self.state
+
+    async def get_data(self) -> Dict[str, Any]:
+        return dict(self.data)
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        self.data.update(data or {}, **kwargs)
+        return dict(self.data)
+
+    async def clear(self):
+        self.state = None
+        self.data = {}
+
+
+class FakeBot:
+    """Consumes uploaded documents chunk by chunk, like the real upload would."""
+
+    def __init__(self):
+        self.documents: List[Dict[str, Any]] = []
+
+    async def send_document(self, chat_id: int, document, caption: Optional[str] = None, **kwargs):
+        size = 0
+        async for chunk in document.read(self):
+            size += len(chunk)
+        self.documents.append({"chat_id": chat_id, "filename": document.filename, "bytes": size, "caption": caption})
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        pass
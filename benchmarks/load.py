@@ -0,0 +1,325 @@
+"""
+Concurrent load test for the whole update path.
+
+Builds the dispatcher the way bot.py does (routers, role and metrics
+middlewares, keyed update workers, SQLite FSM storage) around a Bot whose
+session is `transport.FakeSession`, then has `--users` simulated farm
+workers each replay `--sessions` scripted wizard sessions at once:
+
+- daily:  daily wizard - eggs, broken eggs, one feed, no deaths, save
+- feed:   feed purchase - supplier, one feed, bags, price, cash
+- sale:   egg sale - walk-in customer, crates, cash
+
+Every step is a real Update passed to `dp.feed_update`, so FSM transitions,
+filters, `run_db` and the Bot API round trip all take part. A generated
+farm's history ends yesterday, so the first saves of the run race to create
+today's daily entry just as a morning's first users would. Reports
+updates/sec, per-update latency percentiles, unhandled/failed updates and
+the slowest handlers, and optionally writes them as JSON.
+
+Usage:
+    python benchmarks/load.py [--users 20] [--sessions 5] [--scripts daily,feed,sale] [--think 0]
+                              [--latency 0.05] [--workers 4] [--db farm.db] [--days 90] [--output load.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import count
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")  # Handlers import config
+
+import sqlalchemy
+from aiogram import Bot
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+from sqlalchemy.orm import sessionmaker
+
+import database
+from database import Base, Contact, InventoryItem, User, create_db_engine
+from transport import FakeSession
+
+USER_ID_BASE = 700_000
+Step = Tuple[str, str]  # ("cb", callback data) or ("msg", text)
+
+
+# --- Scripts ---
+
+def daily_wizard(ctx: Dict, rng: random.Random) -> List[Step]:
+    eggs = rng.randint(300, 900)
+    return [
+        ("cb", "menu_daily_wizard"), ("msg", str(eggs)), ("msg", str(rng.randint(0, 10))),
+        ("cb", "dailyfeed_single"), ("cb", f"feedwizard_{ctx['feed_id']}"),
+        ("msg", f"{rng.uniform(0.5, 3):.1f}"), ("cb", "mort_zero"), ("cb", "wizard_save"),
+    ]
+
+
+def feed_purchase(ctx: Dict, rng: random.Random) -> List[Step]:
+    return [
+        ("cb", "fin_expense_start"), ("cb", "cat_feed"), ("cb", f"supp_{rng.choice(ctx['suppliers'])}"),
+        ("cb", "feedmode_single"), ("cb", f"feedsel_{ctx['feed_id']}"),
+        ("msg", str(rng.randint(1, 10))), ("msg", str(rng.randint(3000, 4200))), ("cb", "feedpay_CASH"),
+    ]
+
+
+def egg_sale(ctx: Dict, rng: random.Random) -> List[Step]:
+    return [
+        ("cb", "fin_income_start"), ("cb", "cust_generic"), ("cb", "sale_eggs"),
+        ("cb", "mode_crate"), ("msg", str(rng.randint(1, 3))), ("cb", "pay_CASH"),
+    ]
+
+
+SCRIPTS: Dict[str, Callable[[Dict, random.Random], List[Step]]] = {
+    "daily": daily_wizard,
+    "feed": feed_purchase,
+    "sale": egg_sale,
+}
+
+
+# --- Setup ---
+
+_dispatcher = None
+
+
+def build_dispatcher(workers: int, fsm_path: str):
+    """Dispatcher wired like bot.main(). Routers can only be attached once per process."""
+    global _dispatcher
+    from fsm_storage import SQLiteStorage
+    from middlewares import MetricsMiddleware, RoleMiddleware
+    from update_pool import KeyedDispatcher
+
+    if _dispatcher is None:
+        from modules.reports import router as reports_router
+        from modules.settings import router as settings_router
+        from modules.alerts import router as alerts_router
+        from modules.finance import router as finance_router
+        from modules.inventory import router as inventory_router
+        from modules.contacts import router as contacts_router
+        from modules.demo import router as demo_router
+        from modules.health import router as health_router
+        from modules.daily_wizard import router as wizard_router
+
+        dp = KeyedDispatcher(storage=SQLiteStorage(fsm_path), workers=workers)
+        for r in [reports_router, settings_router, alerts_router, finance_router,
+                  inventory_router, contacts_router, demo_router, health_router, wizard_router]:
+            dp.include_router(r)
+        dp.update.outer_middleware(RoleMiddleware())
+        dp.message.middleware(MetricsMiddleware())
+        dp.callback_query.middleware(MetricsMiddleware())
+        _dispatcher = dp
+    else:
+        # Reuse the routers with fresh storage and workers
+        from update_pool import UpdateWorkerPool
+        _dispatcher.fsm.storage = SQLiteStorage(fsm_path)
+        _dispatcher.pool = UpdateWorkerPool(workers) if workers > 0 else None
+    return _dispatcher
+
+
+def prepare(db, users: int) -> Dict:
+    """Register the simulated users and pick the ids the scripts need. Commits."""
+    existing = {tid for (tid,) in db.query(User.telegram_id).filter(User.telegram_id >= USER_ID_BASE)}
+    db.add_all(User(telegram_id=USER_ID_BASE + i, name=f"Load {i}", role="STAFF")
+               for i in range(users) if USER_ID_BASE + i not in existing)
+    feed = (db.query(InventoryItem).filter_by(type="FEED")
+            .order_by(InventoryItem.quantity.desc()).first())
+    if feed is None:
+        raise SystemExit("No feed items in the database - generate one with benchmarks/datagen.py")
+    feed.quantity = max(feed.quantity, 1_000_000.0)  # Daily wizards must never run out
+    eggs = db.query(InventoryItem).filter_by(name="Eggs").first()
+    if eggs is not None:
+        eggs.quantity = max(eggs.quantity, 1_000_000.0)
+    suppliers = [cid for (cid,) in db.query(Contact.id).filter_by(role="SUPPLIER").limit(20)] or ["generic"]
+    db.commit()
+    return {"feed_id": feed.id, "suppliers": suppliers}
+
+
+# --- Driving ---
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.failed = 0
+        self.errors: Dict[str, int] = {}
+        self.unhandled = 0
+        self.sessions: Dict[str, int] = {}
+        self._update_id = count(1)
+        self._message_id = count(1)
+
+    def update(self, user_id: int, kind: str, value: str) -> Update:
+        user = {"id": user_id, "is_bot": False, "first_name": f"Load {user_id - USER_ID_BASE}"}
+        chat = {"id": user_id, "type": "private"}
+        now = int(time.time())
+        if kind == "msg":
+            payload = {"message": {"message_id": next(self._message_id), "date": now, "chat": chat,
+                                   "from": user, "text": value}}
+        else:
+            bot_message = {"message_id": next(self._message_id), "date": now, "chat": chat,
+                           "from": {"id": 1, "is_bot": True, "first_name": "Avionyx"}, "text": "..."}
+            payload = {"callback_query": {"id": str(next(self._update_id)), "from": user, "chat_instance": "load",
+                                          "message": bot_message, "data": value}}
+        return Update.model_validate({"update_id": next(self._update_id), **payload})
+
+
+async def _simulate_user(dp, bot, ctx, recorder: Recorder, user_id: int, scripts: List[str],
+                         sessions: int, think: float, rng: random.Random):
+    for n in range(sessions):
+        name = scripts[(user_id + n) % len(scripts)]
+        ok = True
+        for kind, value in SCRIPTS[name](ctx, rng):
+            update = recorder.update(user_id, kind, value)
+            started = time.perf_counter()
+            try:
+                result = await dp.feed_update(bot, update)
+                if result is UNHANDLED:
+                    recorder.unhandled += 1
+                    ok = False
+            except Exception as e:
+                recorder.failed += 1
+                error = f"{value}: {type(e).__name__}: {e}"[:200]
+                recorder.errors[error] = recorder.errors.get(error, 0) + 1
+                ok = False
+            recorder.latencies.append(time.perf_counter() - started)
+            if think:
+                await asyncio.sleep(rng.uniform(0, 2 * think))
+        if ok:
+            recorder.sessions[name] = recorder.sessions.get(name, 0) + 1
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+async def _run(Session, users: int, sessions: int, scripts: List[str], think: float,
+               latency: float, workers: int, fsm_path: str, seed: int) -> Dict:
+    import metrics
+
+    db = Session()
+    try:
+        ctx = prepare(db, users)
+    finally:
+        db.close()
+
+    dp = build_dispatcher(workers, fsm_path)
+    session = FakeSession(latency=latency)
+    bot = Bot(token="0:load", session=session)
+    recorder = Recorder()
+    metrics.reset()
+    rng = random.Random(seed)
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _simulate_user(dp, bot, ctx, recorder, USER_ID_BASE + i, scripts, sessions, think,
+                           random.Random(rng.random()))
+            for i in range(users)
+        ))
+        elapsed = time.perf_counter() - started
+    finally:
+        if dp.pool:
+            await dp.pool.stop()
+        await dp.storage.close()
+        await bot.session.close()
+
+    ordered = sorted(recorder.latencies)
+    return {
+        "updates": len(ordered),
+        "elapsed": elapsed,
+        "updates_per_sec": len(ordered) / elapsed if elapsed else 0.0,
+        "latency": {"p50": _percentile(ordered, 50), "p95": _percentile(ordered, 95),
+                    "p99": _percentile(ordered, 99), "max": ordered[-1] if ordered else 0.0},
+        "failed": recorder.failed,
+        "errors": recorder.errors,
+        "unhandled": recorder.unhandled,
+        "sessions_completed": recorder.sessions,
+        "api_calls": dict(session.calls),
+        "workers": dp.pool.stats() if dp.pool else [],
+        "handlers": metrics.summary(),
+    }
+
+
+def run_load(Session, users: int = 20, sessions: int = 5, scripts: Optional[List[str]] = None,
+             think: float = 0.0, latency: float = 0.0, workers: int = 4, seed: int = 42) -> Dict:
+    """Replay the scripted sessions against `Session`'s database and return the report."""
+    previous = database.ProdSessionLocal, database.IS_DEMO_MODE
+    database.ProdSessionLocal, database.IS_DEMO_MODE = Session, False
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(_run(Session, users, sessions, scripts or list(SCRIPTS), think,
+                                    latency, workers, os.path.join(tmp, "fsm.db"), seed))
+    finally:
+        database.ProdSessionLocal, database.IS_DEMO_MODE = previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=5, help="Scripted sessions per user")
+    parser.add_argument("--scripts", default=",".join(SCRIPTS), help="Comma-separated, rotated per user")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean pause between a user's steps (s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated Bot API round trip (s)")
+    parser.add_argument("--workers", type=int, default=4, help="Update workers (0 = task per update)")
+    parser.add_argument("--db", help="Farm database to use (default: a fresh generated one)")
+    parser.add_argument("--days", type=int, default=90, help="History to generate when --db is not given")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    scripts = [s.strip() for s in args.scripts.split(",") if s.strip()]
+    unknown = set(scripts) - set(SCRIPTS)
+    if unknown:
+        parser.error(f"unknown scripts: {', '.join(sorted(unknown))} (choose from {', '.join(SCRIPTS)})")
+
+    tmp = None
+    path = args.db
+    if not path:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "load.db")
+    engine = create_db_engine(f"sqlite:///{path}", tuned=True)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    try:
+        if not sqlalchemy.inspect(engine).has_table("daily_entries"):
+            from datagen import generate
+            Base.metadata.create_all(engine)
+            db = Session()
+            try:
+                generate(db, args.days, seed=args.seed, end=date.today() - timedelta(days=1))
+            finally:
+                db.close()
+        report = run_load(Session, args.users, args.sessions, scripts, args.think,
+                          args.latency, args.workers, args.seed)
+    finally:
+        engine.dispose()
+        if tmp:
+            tmp.cleanup()
+
+    lat = report["latency"]
+    print(f"{args.users} users x {args.sessions} sessions ({', '.join(scripts)}), "
+          f"{args.workers} workers, {args.latency * 1000:.0f}ms API latency")
+    print(f"{report['updates']} updates in {report['elapsed']:.2f}s = {report['updates_per_sec']:.1f} updates/s")
+    print(f"latency p50 {lat['p50'] * 1000:.1f}ms  p95 {lat['p95'] * 1000:.1f}ms  "
+          f"p99 {lat['p99'] * 1000:.1f}ms  max {lat['max'] * 1000:.1f}ms")
+    print(f"failed {report['failed']}, unhandled {report['unhandled']}, completed {report['sessions_completed']}")
+    for error, n in report["errors"].items():
+        print(f"  x{n} {error}")
+    print("slowest handlers (p95):")
+    for r in report["handlers"][:5]:
+        print(f"  {r['handler']:<28}{r['p95'] * 1000:>8.1f}ms  {r['queries_p95']:>4.0f} queries  x{r['count']}")
+
+    if args.output:
+        report["meta"] = {"timestamp": datetime.now().isoformat(timespec="seconds"), "args": vars(args)}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
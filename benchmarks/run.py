@@ -0,0 +1,242 @@
+"""
+End-to-end benchmarks for the heaviest report handlers.
+
+Generates (or reuses) a synthetic farm database, then drives each handler
+the way a button press would - fake CallbackQuery/Bot/FSM objects, real
+`run_db`, real sessions - and times it. Each scenario runs once to warm
+caches and connections, then `--repeat` times; the SQL statement count and
+time spent in SQL come from the metrics listeners. The report cache is
+cleared before every timed run, so the numbers are the queries and
+rendering, comparable with reports from before the cache existed. `--warm`
+also times each scenario served from the cache and records those numbers
+under "warm" next to the cold ones.
+
+Results are written as JSON so runs can be compared: pass a previous
+report with `--compare` to print the change per scenario.
+
+Usage:
+    python benchmarks/run.py [--years 5] [--ledger-per-day 12] [--contacts 200] [--seed 42]
+                             [--repeat 5] [--warm] [--db farm.db] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")  # Handlers import config
+
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+import database
+from database import Base, create_db_engine
+from datagen import generate
+from fakes import FakeBot, FakeCallbackQuery, FakeState
+
+
+async def _pnl(cb, state, bot):
+    from modules.reports import show_pnl
+    await show_pnl(cb)
+
+
+async def _production(cb, state, bot):
+    from modules.reports import show_production
+    await show_production(cb)
+
+
+async def _monthly(cb, state, bot):
+    from modules.reports import show_monthly_report
+    await show_monthly_report(cb)
+
+
+async def _export(cb, state, bot):
+    from modules.reports import export_data
+    await export_data(cb, state, bot)
+
+
+async def _trust(cb, state, bot):
+    from modules.contacts import trust_report
+    await trust_report(cb)
+
+
+async def _alerts(cb, state, bot):
+    from modules.alerts import show_alerts  # Runs run_all_checks
+    await show_alerts(cb)
+
+
+# name: (handler driver, callback data)
+SCENARIOS = {
+    "show_pnl": (_pnl, "report_pnl"),
+    "show_production": (_production, "report_prod"),
+    "show_monthly_report": (_monthly, "report_month"),
+    "export_data": (_export, "export_all"),
+    "trust_report": (_trust, "contacts_trust_report"),
+    "run_all_checks": (_alerts, "menu_alerts"),
+}
+
+
+async def _time_once(driver, data: str, cold: bool = True) -> Dict[str, float]:
+    import metrics
+    import report_cache
+
+    if cold:
+        report_cache.invalidate()
+    cb, state, bot = FakeCallbackQuery(data), FakeState(), FakeBot()
+    token = metrics.begin_request()
+    started = time.perf_counter()
+    failed = True
+    try:
+        await driver(cb, state, bot)
+        failed = False
+    finally:
+        wall = time.perf_counter() - started
+        stats = metrics.end_request(token, f"bench:{data}", wall, failed)
+    if not cb.message.sent and not bot.documents:
+        raise RuntimeError(f"{data}: handler produced no output")
+    return {"wall": wall, "queries": stats.queries, "db_time": stats.db_time}
+
+
+def _stats(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    walls = [r["wall"] for r in runs]
+    return {
+        "runs": len(runs),
+        "min": min(walls),
+        "median": statistics.median(walls),
+        "mean": statistics.fmean(walls),
+        "max": max(walls),
+        "queries": statistics.median(r["queries"] for r in runs),
+        "db_time": statistics.median(r["db_time"] for r in runs),
+    }
+
+
+async def _run_all(repeat: int, only: List[str], warm: bool) -> Dict[str, dict]:
+    results = {}
+    for name in only:
+        driver, data = SCENARIOS[name]
+        await _time_once(driver, data)  # Warm-up
+        results[name] = _stats([await _time_once(driver, data) for _ in range(repeat)])
+        if warm:  # The last cold run left its screen in the report cache
+            results[name]["warm"] = _stats([await _time_once(driver, data, cold=False) for _ in range(repeat)])
+    return results
+
+
+def run_benchmarks(Session, repeat: int = 5, only: List[str] = None, warm: bool = False) -> Dict[str, dict]:
+    """Time each scenario against `Session`'s database. Returns {scenario: stats in seconds}.
+
+    Every run starts with an empty report cache; with `warm`, each
+    scenario's stats also hold a "warm" entry timed from the cache.
+    """
+    previous = database.ProdSessionLocal, database.IS_DEMO_MODE
+    database.ProdSessionLocal, database.IS_DEMO_MODE = Session, False
+    try:
+        return asyncio.run(_run_all(repeat, only or list(SCENARIOS), warm))
+    finally:
+        database.ProdSessionLocal, database.IS_DEMO_MODE = previous
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict]) -> List[str]:
+    """One line per scenario: median now vs baseline."""
+    lines = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            lines.append(f"{name:<22}{now['median'] * 1000:>9.1f}ms  (new)")
+            continue
+        change = (now["median"] - before["median"]) / before["median"] * 100 if before["median"] else 0.0
+        lines.append(
+            f"{name:<22}{before['median'] * 1000:>9.1f}ms -> {now['median'] * 1000:>9.1f}ms  {change:+6.1f}%"
+            f"  queries {before['queries']:.0f} -> {now['queries']:.0f}"
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--ledger-per-day", type=int, default=12)
+    parser.add_argument("--contacts", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warm", action="store_true", help="Also time each scenario served from the report cache")
+    parser.add_argument("--db", help="Reuse this database file (generated on first use)")
+    parser.add_argument("--only", action="append", choices=list(SCENARIOS), help="Run just this scenario (repeatable)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Previous results JSON to diff against")
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.db
+    if not path:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "bench.db")
+    engine = create_db_engine(f"sqlite:///{path}", tuned=True)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    params = {"years": args.years, "ledger_per_day": args.ledger_per_day, "contacts": args.contacts, "seed": args.seed}
+    try:
+        if not sqlalchemy.inspect(engine).has_table("daily_entries"):
+            Base.metadata.create_all(engine)
+            print(f"Generating {args.years:g} years of data...")
+            started = time.perf_counter()
+            db = Session()
+            try:
+                counts = generate(db, int(args.years * 365), args.ledger_per_day, args.contacts, args.seed)
+            finally:
+                db.close()
+            print(f"  done in {time.perf_counter() - started:.1f}s")
+        else:
+            params = {"db": path}
+            with engine.connect() as conn:
+                counts = {t.name: conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(t)).scalar()
+                          for t in Base.metadata.sorted_tables}
+
+        results = run_benchmarks(Session, args.repeat, args.only, args.warm)
+    finally:
+        engine.dispose()
+        if tmp:
+            tmp.cleanup()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "params": params,
+            "repeat": args.repeat,
+            "warm": args.warm,
+            "rows": counts,
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, r in results.items():
+        print(f"{name:<22}median {r['median'] * 1000:>9.1f}ms  min {r['min'] * 1000:>9.1f}ms  "
+              f"{r['queries']:>5.0f} queries  {r['db_time'] * 1000:>8.1f}ms in SQL")
+        if "warm" in r:
+            w = r["warm"]
+            print(f"{'  (warm)':<22}median {w['median'] * 1000:>9.1f}ms  min {w['min'] * 1000:>9.1f}ms  "
+                  f"{w['queries']:>5.0f} queries")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print(f"\nvs {args.compare}:")
+        print("\n".join(compare(results, baseline)))
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+In-process stand-in for the Telegram Bot API.
+
+`FakeSession` is an aiogram session: pass it as `Bot(token, session=FakeSession())`
+and every API call the handlers make is answered locally. Requests are
+serialised the way the real aiohttp session does it (fields prepared, uploads
+read chunk by chunk) and replies go through `check_response`, so handlers get
+the same bound `Message` objects back. An optional `latency` adds a fixed
+round-trip delay per call to mimic the network.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import InputFile
+
+
+class FakeSession(BaseSession):
+    """Answers Bot API calls locally and counts them per method."""
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.uploaded_bytes = 0
+        self._message_id = 0
+
+    async def close(self) -> None:
+        pass
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType],
+                           timeout: Optional[int] = None) -> TelegramType:
+        files: Dict[str, InputFile] = {}
+        fields = {}
+        for key, value in method.model_dump(warnings=False).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if value:
+                fields[key] = value
+        for file in files.values():
+            async for chunk in file.read(bot):
+                self.uploaded_bytes += len(chunk)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        name = method.__api_method__
+        self.calls[name] += 1
+        content = json.dumps({"ok": True, "result": self._result(bot, name, method.__returning__, fields)})
+        return self.check_response(bot=bot, method=method, status_code=200, content=content).result
+
+    def _result(self, bot: Bot, name: str, returning, fields: Dict[str, Any]):
+        if returning is bool:
+            return True
+        if name == "getMe":
+            return {"id": bot.id, "is_bot": True, "first_name": "Avionyx"}
+        # Everything the bot sends or edits comes back as a Message
+        self._message_id += 1
+        chat_id = int(fields.get("chat_id") or 0)
+        message = {
+            "message_id": int(fields.get("message_id") or self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": bot.id, "is_bot": True, "first_name": "Avionyx"},
+        }
+        if name == "sendDocument":
+            message["document"] = {"file_id": f"doc{self._message_id}", "file_unique_id": f"u{self._message_id}"}
+            message["caption"] = fields.get("caption")
+        else:
+            message["text"] = fields.get("text", "")
+        return message
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
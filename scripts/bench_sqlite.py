@@ -0,0 +1,118 @@
+"""
+Concurrent read/write throughput benchmark for the SQLite engine settings.
+
+Runs the same mixed workload (report-style reads + finance-style writes)
+against a default engine (rollback journal, no pragmas) and against the
+tuned engine from `database.create_db_engine` (WAL + pragmas + pool),
+then prints ops/sec for each.
+
+Usage:
+    python scripts/bench_sqlite.py [--readers 4] [--writers 2] [--seconds 5] [--seed-days 365]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from database import Base, DailyEntry, FinancialLedger, create_db_engine
+
+
+def seed(Session, days: int):
+    db = Session()
+    start = date.today() - timedelta(days=days)
+    for i in range(days):
+        day = start + timedelta(days=i)
+        db.add(DailyEntry(date=day, eggs_collected=400 + i % 50, feed_used_kg=45.0, income=6000.0, flock_total=500))
+        db.add(FinancialLedger(date=day, amount=6000.0, direction="IN", category="Sales"))
+        db.add(FinancialLedger(date=day, amount=3500.0, direction="OUT", category="Feed"))
+    db.commit()
+    db.close()
+
+
+def reader(Session, stop, counts, errors):
+    since = date.today() - timedelta(days=30)
+    while not stop.is_set():
+        db = Session()
+        try:
+            db.query(func.sum(DailyEntry.eggs_collected)).filter(DailyEntry.date >= since).scalar()
+            db.query(FinancialLedger.direction, func.sum(FinancialLedger.amount)).group_by(FinancialLedger.direction).all()
+            counts["reads"] += 1
+        except OperationalError:
+            errors["reads"] += 1
+        finally:
+            db.close()
+
+
+def writer(Session, stop, counts, errors):
+    while not stop.is_set():
+        db = Session()
+        try:
+            db.add(FinancialLedger(amount=450.0, direction="IN", category="Sales", description="bench"))
+            entry = db.query(DailyEntry).order_by(DailyEntry.date.desc()).first()
+            entry.income += 450.0
+            db.commit()
+            counts["writes"] += 1
+        except OperationalError:
+            db.rollback()
+            errors["writes"] += 1
+        finally:
+            db.close()
+
+
+def run(tuned: bool, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="avionyx_bench_")
+    engine = create_db_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}", tuned=tuned)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    seed(Session, args.seed_days)
+
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0}
+    errors = {"reads": 0, "writes": 0}
+    threads = [threading.Thread(target=reader, args=(Session, stop, counts, errors)) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(Session, stop, counts, errors)) for _ in range(args.writers)]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+
+    return {
+        "mode": "tuned (WAL)" if tuned else "default",
+        "reads_per_sec": counts["reads"] / elapsed,
+        "writes_per_sec": counts["writes"] / elapsed,
+        "read_errors": errors["reads"],
+        "write_errors": errors["writes"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--seed-days", type=int, default=365)
+    args = parser.parse_args()
+
+    print(f"Readers: {args.readers}  Writers: {args.writers}  Duration: {args.seconds}s  Seed: {args.seed_days} days\n")
+    print(f"{'Mode':<14}{'Reads/s':>10}{'Writes/s':>10}{'Errors (r/w)':>15}")
+    for tuned in (False, True):
+        r = run(tuned, args)
+        print(f"{r['mode']:<14}{r['reads_per_sec']:>10.1f}{r['writes_per_sec']:>10.1f}{r['read_errors']:>10}/{r['write_errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Post a fake Telegram update to a locally running webhook.
+
+Lets you drive the bot in webhook mode without Telegram: start it with
+WEBHOOK_URL / WEBHOOK_SECRET set, then send it a command or a button press.
+Replies go to the real Bot API, so use your own chat ID to see them.
+
+Usage:
+    python scripts/post_update.py --user-id 123456789 --text /start
+    python scripts/post_update.py --user-id 123456789 --callback main_menu
+    python scripts/post_update.py --url http://127.0.0.1:8080/webhook --secret s3cret --text /start
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import aiohttp
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    """Minimal private-chat message update."""
+    user = {"id": user_id, "is_bot": False, "first_name": "Local"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else [],
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    """Inline button press on a (fake) bot message."""
+    user = {"id": user_id, "is_bot": False, "first_name": "Local"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Avionyx"},
+                "text": "menu",
+            },
+        },
+    }
+
+
+async def post(url: str, secret: str, update: dict) -> tuple[int, str]:
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=update, headers=headers) as resp:
+            return resp.status, await resp.text()
+
+
+def main():
+    port = os.getenv("WEBHOOK_PORT", "8080")
+    path = os.getenv("WEBHOOK_PATH", "/webhook")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"http://127.0.0.1:{port}{path}")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    parser.add_argument("--user-id", type=int, required=True)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--text", help="message text, e.g. /start")
+    group.add_argument("--callback", help="callback data, e.g. main_menu")
+    args = parser.parse_args()
+
+    update_id = int(time.time() * 1000) % 2_000_000_000
+    if args.text:
+        update = message_update(update_id, args.user_id, args.text)
+    else:
+        update = callback_update(update_id, args.user_id, args.callback)
+
+    status, body = asyncio.run(post(args.url, args.secret, update))
+    print(f"{status} {body}")
+
+
+if __name__ == "__main__":
+    main()
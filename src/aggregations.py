@@ -0,0 +1,66 @@
+"""SQL-side aggregation helpers for reports.
+
+Reports used to load whole tables and sum in Python. These helpers push the
+GROUP BY / SUM into SQLite so a report costs a handful of result rows no
+matter how many years of transactions are stored.
+"""
+from datetime import date
+from typing import Dict, Optional
+
+from sqlalchemy import and_, case, func
+
+from database import FinancialLedger
+from money import ZERO
+
+
+def bucket_sum(value_col, date_col, start: Optional[date] = None, end: Optional[date] = None):
+    """SUM(value) restricted to start <= date <= end, as a single SELECT column.
+
+    With no bounds this is a plain SUM, so several date buckets can share one
+    scan of the table.
+    """
+    conditions = []
+    if start is not None:
+        conditions.append(date_col >= start)
+    if end is not None:
+        conditions.append(date_col <= end)
+    if not conditions:
+        return func.coalesce(func.sum(value_col), 0)
+    return func.coalesce(func.sum(case((and_(*conditions), value_col), else_=0)), 0)
+
+
+def ledger_breakdown(db, buckets: Dict[str, Optional[date]]) -> Dict[str, dict]:
+    """Income/expense totals per date bucket, grouped by direction and category.
+
+    `buckets` maps a label to the first day it covers (None = all time), e.g.
+    {'in_month': date(2025, 12, 1), 'all_time': None}. Returns, per label:
+        {'in': Decimal, 'out': Decimal, 'cats': {category: Decimal}}
+    Amounts come back from the Money column as Decimal; empty buckets are
+    Decimal('0.00'). Only expenses are broken down by category, matching
+    the P&L layout.
+    """
+    labels = list(buckets)
+    columns = [
+        bucket_sum(FinancialLedger.amount, FinancialLedger.date, start=buckets[label]).label(label)
+        for label in labels
+    ]
+    rows = (
+        db.query(FinancialLedger.direction, FinancialLedger.category, *columns)
+        .group_by(FinancialLedger.direction, FinancialLedger.category)
+        .all()
+    )
+
+    result = {label: {'in': ZERO, 'out': ZERO, 'cats': {}} for label in labels}
+    for row in rows:
+        cat = row.category or "Other"
+        for label in labels:
+            amt = getattr(row, label) or 0
+            if not amt:
+                continue
+            bucket = result[label]
+            if row.direction == "IN":
+                bucket['in'] += amt
+            else:
+                bucket['out'] += amt
+                bucket['cats'][cat] = bucket['cats'].get(cat, ZERO) + amt
+    return result
@@ -0,0 +1,145 @@
+"""Vectorized production KPIs.
+
+`load_series` reads the DAY production rollups for a date range with one
+column query into NumPy arrays (one slot per calendar day, zero-filled), and
+the functions below compute KPIs over them without Python loops:
+
+    series = load_series(db, start, end)
+    hen_day_production(series, window=7)   # % per day, rolling 7-day
+    summary(series)                        # whole-range totals and ratios
+
+Rolling windows are calendar days ending on each day; days without a daily
+entry contribute nothing (they are neither zero-egg nor zero-bird days).
+Ratios with an empty denominator are 0.
+"""
+import os
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict
+
+import numpy as np
+
+from database import ProductionRollup
+
+EGG_WEIGHT_KG = float(os.getenv("EGG_WEIGHT_KG", "0.06"))  # Average egg mass for FCR
+
+
+@dataclass(frozen=True)
+class ProductionSeries:
+    start: date
+    recorded: np.ndarray  # bool, a daily entry exists
+    eggs: np.ndarray
+    broken: np.ndarray
+    feed_kg: np.ndarray
+    mortality: np.ndarray
+    flock: np.ndarray  # Birds on the day (hen-days when summed)
+
+    def __len__(self):
+        return len(self.eggs)
+
+    @property
+    def dates(self) -> np.ndarray:
+        return np.arange(np.datetime64(self.start, "D"), np.datetime64(self.start, "D") + len(self))
+
+    def window(self, start: date, end: date) -> "ProductionSeries":
+        """Sub-series for start..end inclusive (clipped to the loaded range)."""
+        lo = max((start - self.start).days, 0)
+        hi = max((end - self.start).days + 1, lo)
+        return ProductionSeries(
+            max(start, self.start), self.recorded[lo:hi], self.eggs[lo:hi], self.broken[lo:hi],
+            self.feed_kg[lo:hi], self.mortality[lo:hi], self.flock[lo:hi],
+        )
+
+
+def load_series(db, start: date, end: date) -> ProductionSeries:
+    """Daily series for start..end inclusive from the DAY rollups (one query)."""
+    n = (end - start).days + 1
+    rows = db.query(
+        ProductionRollup.period_start,
+        ProductionRollup.eggs_collected,
+        ProductionRollup.eggs_broken,
+        ProductionRollup.feed_used_kg,
+        ProductionRollup.mortality_count,
+        ProductionRollup.flock_total,
+    ).filter(
+        ProductionRollup.period == "DAY",
+        ProductionRollup.period_start >= start,
+        ProductionRollup.period_start <= end,
+        ProductionRollup.days > 0,
+    ).all()
+
+    data = np.zeros((5, n))
+    recorded = np.zeros(n, dtype=bool)
+    if rows:
+        days, *columns = zip(*rows)
+        idx = np.fromiter(((d - start).days for d in days), dtype=np.int64, count=len(days))
+        data[:, idx] = np.array(columns, dtype=float)
+        np.nan_to_num(data, copy=False)  # NULL columns
+        recorded[idx] = True
+    eggs, broken, feed_kg, mortality, flock = data
+    return ProductionSeries(start, recorded, eggs, broken, feed_kg, mortality, flock)
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum over the `window` days ending on each day (shorter at the start)."""
+    csum = np.cumsum(values, dtype=float)
+    out = csum.copy()
+    out[window:] -= csum[:-window]
+    return out
+
+
+def _ratio(num: np.ndarray, den: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    return np.divide(num * scale, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+
+def laying_rate(series: ProductionSeries, window: int = 1) -> np.ndarray:
+    """Mean of the daily laying % (eggs / birds) over recorded days in each window."""
+    daily = _ratio(series.eggs, series.flock, 100.0)
+    with_birds = series.recorded & (series.flock > 0)
+    return _ratio(rolling_sum(np.where(with_birds, daily, 0.0), window), rolling_sum(with_birds, window))
+
+
+def hen_day_production(series: ProductionSeries, window: int = 1) -> np.ndarray:
+    """Eggs per 100 hen-days in each window (weights days by flock size)."""
+    return _ratio(rolling_sum(series.eggs, window), rolling_sum(series.flock, window), 100.0)
+
+
+def feed_per_egg(series: ProductionSeries, window: int = 1) -> np.ndarray:
+    """Grams of feed per egg collected in each window."""
+    return _ratio(rolling_sum(series.feed_kg, window), rolling_sum(series.eggs, window), 1000.0)
+
+
+def fcr(series: ProductionSeries, window: int = 1, egg_weight_kg: float = EGG_WEIGHT_KG) -> np.ndarray:
+    """Feed conversion ratio: kg feed per kg of eggs in each window."""
+    return _ratio(rolling_sum(series.feed_kg, window), rolling_sum(series.eggs, window) * egg_weight_kg)
+
+
+def mortality_rate(series: ProductionSeries, window: int = 1) -> np.ndarray:
+    """Deaths as % of the average flock over recorded days in each window."""
+    recorded_days = rolling_sum(series.recorded, window)
+    avg_flock = _ratio(rolling_sum(series.flock, window), recorded_days)
+    return _ratio(rolling_sum(series.mortality, window), avg_flock, 100.0)
+
+
+def summary(series: ProductionSeries, egg_weight_kg: float = EGG_WEIGHT_KG) -> Dict[str, float]:
+    """Totals and KPIs over the whole series."""
+    n = max(len(series), 1)
+    days = int(series.recorded.sum())
+    eggs = float(series.eggs.sum())
+    kpis = {
+        "days": days,
+        "eggs_collected": eggs,
+        "eggs_broken": float(series.broken.sum()),
+        "feed_used_kg": float(series.feed_kg.sum()),
+        "mortality_count": float(series.mortality.sum()),
+        "avg_flock": float(series.flock.sum()) / days if days else 0.0,
+        "broken_pct": float(_ratio(series.broken.sum(), eggs, 100.0)),
+    }
+    for name, fn in (("laying_rate", laying_rate), ("hen_day_production", hen_day_production),
+                     ("feed_per_egg", feed_per_egg), ("mortality_rate", mortality_rate)):
+        kpis[name] = float(fn(series, n)[-1]) if len(series) else 0.0
+    kpis["fcr"] = float(fcr(series, n, egg_weight_kg)[-1]) if len(series) else 0.0
+    return kpis
+
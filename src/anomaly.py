@@ -0,0 +1,155 @@
+"""Egg-production anomaly detection.
+
+The tracked metric is the daily laying rate (eggs / birds, %) minus the rate
+expected on a standard layer curve for the flocks present that day, each at
+its own age, so the normal rise to peak and slow post-peak decline are not
+reported as anomalies.
+
+An exponentially weighted mean and variance of that residual is kept in
+`anomaly_states` and advanced one completed day at a time (O(1) per day).
+Each check reads only the entries after the stored state in a single range
+query, folds the finished days in, and scores today's entry against the
+baseline without folding it (it may still be edited). Two conditions are
+flagged:
+
+- drop: today's residual is more than `z_threshold` standard deviations
+  below the baseline (a sudden fall)
+- shortfall: the baseline itself sits more than `shortfall_pct` points
+  below the curve (a slow decline that a day-over-day check never sees)
+"""
+import math
+import os
+from datetime import date, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from database import AnomalyState, DailyEntry, Flock
+
+ANOMALY_WINDOW_DAYS = int(os.getenv("ANOMALY_WINDOW_DAYS", "30"))  # History read when the state is missing or stale
+ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.2"))  # Weight of each new day
+ANOMALY_MIN_DAYS = 7  # Days folded in before anything is flagged
+ANOMALY_MIN_STD = 2.0  # Percentage points; keeps z sane on very steady flocks
+METRIC = "laying_rate"
+
+# Typical commercial layer curve: (age in weeks, laying %)
+LAYING_CURVE_WEEKS = (18, 20, 22, 25, 30, 40, 50, 60, 72, 90)
+LAYING_CURVE_RATE = (0, 30, 70, 90, 93, 89, 84, 79, 71, 60)
+
+
+class Anomaly(NamedTuple):
+    kind: str  # "drop" or "shortfall"
+    day: date
+    rate: float  # Actual laying %
+    expected: Optional[float]  # Curve laying % (None without active flocks)
+    baseline: float  # EWMA residual before today
+    z: float
+
+
+def expected_laying_rate(age_days) -> np.ndarray:
+    """Curve laying % at the given flock age(s) in days."""
+    return np.interp(np.asarray(age_days, dtype=float) / 7, LAYING_CURVE_WEEKS, LAYING_CURVE_RATE)
+
+
+def flock_mix(db) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """(hatch date ordinals, hens, birds) of the active flocks, or None without any birds."""
+    rows = db.query(Flock.hatch_date, Flock.hens_count, Flock.current_count).filter_by(status="ACTIVE").all()
+    birds = np.array([(b or h or 0) for _, h, b in rows], dtype=float)
+    if not rows or not birds.sum():
+        return None
+    hatch = np.array([d.toordinal() for d, _, _ in rows], dtype=float)
+    hens = np.array([(h or b or 0) for _, h, b in rows], dtype=float)
+    return hatch, hens, birds
+
+
+def expected_rates(days: np.ndarray, mix: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+    """Curve laying % per bird on each day (date ordinals) for that day's own flock mix.
+
+    Each flock counts from its hatch date at its age on that day, weighted
+    by its hens, so a flock placed last week does not lower the expected
+    rate of the months before it. The day's flock_total is shared across
+    the flocks present in proportion to their birds, which makes the
+    expected eggs per bird their hen-weighted curve over their birds.
+    """
+    hatch, hens, birds = mix
+    ages = days[:, None] - hatch[None, :]  # (day, flock)
+    present = ages >= 0
+    eggs = (expected_laying_rate(np.where(present, ages, 0)) * hens * present).sum(axis=1)
+    total = (birds * present).sum(axis=1)
+    return np.divide(eggs, total, out=np.zeros_like(eggs), where=total > 0)
+
+
+def residuals(entries: List[Tuple[date, int, int]], mix) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(actual laying %, expected %) for (date, eggs, flock_total) rows; expected is None without flocks.
+
+    The actual rate divides each day's eggs by that day's own flock_total.
+    """
+    eggs = np.array([e or 0 for _, e, _ in entries], dtype=float)
+    birds = np.array([b or 0 for _, _, b in entries], dtype=float)
+    rate = np.divide(eggs * 100, birds, out=np.zeros_like(eggs), where=birds > 0)
+    if mix is None:
+        return rate, None
+    return rate, expected_rates(np.array([d.toordinal() for d, _, _ in entries], dtype=float), mix)
+
+
+def fold(state: AnomalyState, value: float, alpha: float = ANOMALY_EWMA_ALPHA):
+    """Advance the EWMA mean/variance by one observation."""
+    if not state.count:
+        state.mean, state.var = value, 0.0
+    else:
+        diff = value - state.mean
+        incr = alpha * diff
+        state.mean += incr
+        state.var = (1 - alpha) * (state.var + diff * incr)
+    state.count += 1
+
+
+def detect(db, today: Optional[date] = None, z_threshold: float = 3.0,
+           shortfall_pct: float = 10.0) -> List[Anomaly]:
+    """Advance the stored state to yesterday and score today's entry.
+
+    The state row is added/updated in the caller's transaction; the caller
+    must commit it or the next run refolds the whole window.
+    """
+    today = today or date.today()
+    state = db.get(AnomalyState, METRIC)
+    floor = today - timedelta(days=ANOMALY_WINDOW_DAYS + 1)
+    if state is None:
+        state = AnomalyState(metric=METRIC, last_date=floor, mean=0.0, var=0.0, count=0)
+        db.add(state)
+    elif state.last_date < floor or state.last_date >= today:
+        # Stale (bot was down for weeks) or from the future (clock change): start over
+        state.last_date, state.mean, state.var, state.count = floor, 0.0, 0.0, 0
+
+    entries = (
+        db.query(DailyEntry.date, DailyEntry.eggs_collected, DailyEntry.flock_total)
+        .filter(DailyEntry.date > state.last_date, DailyEntry.date <= today)
+        .order_by(DailyEntry.date)
+        .all()
+    )
+    if not entries:
+        return []
+
+    rate, expected = residuals(entries, flock_mix(db))
+    residual = rate - expected if expected is not None else rate
+
+    for (day, _, birds), value in zip(entries, residual):
+        if day >= today:
+            break
+        if birds:
+            fold(state, float(value))
+        state.last_date = day
+
+    current = entries[-1]
+    if current[0] != today or not current[2] or state.count < ANOMALY_MIN_DAYS:
+        return []
+
+    std = max(math.sqrt(state.var), ANOMALY_MIN_STD)
+    z = (float(residual[-1]) - state.mean) / std
+    exp_today = float(expected[-1]) if expected is not None else None
+    found = []
+    if z <= -z_threshold:
+        found.append(Anomaly("drop", today, float(rate[-1]), exp_today, state.mean, z))
+    if expected is not None and state.mean <= -shortfall_pct:
+        found.append(Anomaly("shortfall", today, float(rate[-1]), exp_today, state.mean, z))
+    return found
@@ -1,9 +1,11 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, types, F
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramNetworkError
 from config import cfg
+from fsm_storage import SQLiteStorage
+from update_pool import KeyedDispatcher
 from tenacity import retry, stop_never, wait_exponential, retry_if_exception_type, before_sleep_log
 
 # Configure logging
@@ -12,7 +14,7 @@ logger = logging.getLogger(__name__)
 
 # Initialize bot and dispatcher
 bot = Bot(token=cfg.TELEGRAM_TOKEN)
-dp = Dispatcher()
+dp = KeyedDispatcher(storage=SQLiteStorage())  # Wizard state survives restarts; per-chat ordered workers
 
 VERSION = "3.0.0"
 
@@ -25,6 +27,7 @@ VERSION = "3.0.0"
 async def resilient_polling():
     """Start polling with automatic retry on network errors."""
     logger.info("Starting polling...")
+    await bot.delete_webhook()  # Polling is refused while a webhook is set (e.g. after webhook mode)
     await dp.start_polling(bot)
 
 async def main():
@@ -44,16 +47,23 @@ async def main():
               inventory_router, contacts_router, demo_router, health_router, wizard_router]:
         dp.include_router(r)
 
+    # Resolve the sender's role once per update (cached) and inject it as `role`
+    from middlewares import RoleMiddleware, MetricsMiddleware
+    dp.update.outer_middleware(RoleMiddleware())
+
+    # Per-handler latency / query metrics (inner, so the chosen handler is known)
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+
     # Main Menu Handler
-    from utils import get_main_menu_keyboard, get_user_role
+    from utils import get_main_menu_keyboard
     
     @dp.message(Command("start"))
-    async def cmd_start(message: types.Message):
+    async def cmd_start(message: types.Message, role: str):
         if message.from_user.id not in cfg.ADMIN_IDS:
              await message.answer("⛔ Access Denied.")
              return
         
-        role = get_user_role(message.from_user.id)
         await message.answer(
             "🐔 **Avionyx Manager**\nSelect an option below:",
             reply_markup=get_main_menu_keyboard(role),
@@ -61,8 +71,7 @@ async def main():
         )
         
     @dp.callback_query(F.data == "main_menu")
-    async def cb_main_menu(callback: types.CallbackQuery):
-        role = get_user_role(callback.from_user.id)
+    async def cb_main_menu(callback: types.CallbackQuery, role: str):
         await callback.message.edit_text(
             "🐔 **Avionyx Manager**\nSelect an option below:",
             reply_markup=get_main_menu_keyboard(role),
@@ -70,8 +79,79 @@ async def main():
         )
         await callback.answer()
 
+    @dp.message(Command("workers"))
+    async def cmd_workers(message: types.Message, role: str):
+        """Admin: update worker queue depth and latency."""
+        if role != "ADMIN":
+            await message.answer("⛔ Admins only.")
+            return
+        if not dp.pool:
+            await message.answer("Update workers are disabled (UPDATE_WORKERS=0).")
+            return
+
+        text = "⚙️ **Update Workers**\n\n"
+        for i, s in enumerate(dp.pool.stats()):
+            text += (
+                f"#{i}: queue {s['queue_depth']} (max {s['max_depth']}) | "
+                f"{s['processed']} done, {s['errors']} failed | "
+                f"wait {s['avg_wait'] * 1000:.0f}ms, run {s['avg_run'] * 1000:.0f}ms, "
+                f"max {s['max_latency'] * 1000:.0f}ms\n"
+            )
+        await message.answer(text, parse_mode="Markdown")
+
+    @dp.message(Command("perf"))
+    async def cmd_perf(message: types.Message, role: str):
+        """Admin: slowest handlers by p95 latency since start."""
+        if role != "ADMIN":
+            await message.answer("⛔ Admins only.")
+            return
+        from metrics import summary
+        rows = summary()
+        if not rows:
+            await message.answer("No handler timings recorded yet.")
+            return
+
+        text = "⏱️ **Handler Latency** (p50 / p95 / p99)\n\n"
+        for r in rows[:15]:
+            text += (
+                f"`{r['handler']}` ×{r['count']}: "
+                f"{r['p50'] * 1000:.0f} / {r['p95'] * 1000:.0f} / {r['p99'] * 1000:.0f}ms | "
+                f"db p95 {r['db_p95'] * 1000:.0f}ms, {r['queries_p95']:.0f} queries"
+            )
+            text += f", {r['errors']} failed\n" if r['errors'] else "\n"
+
+        from report_cache import stats as report_cache_stats
+        cache = report_cache_stats()
+        text += f"\n📦 Report cache: {cache['hits']} hits, {cache['misses']} misses, {cache['entries']} screens"
+        await message.answer(text, parse_mode="Markdown")
+
+    # Push alerts to admins and snapshot inventory in the background
+    from scheduler import start_alert_scheduler, start_snapshot_scheduler
+    alert_task = start_alert_scheduler(bot, cfg.ADMIN_IDS)
+    snapshot_task = start_snapshot_scheduler()
+
+    # Webhook mode when a public URL is configured, long polling otherwise
+    from webhook import WEBHOOK_URL, run_webhook
+    from metrics import METRICS_PORT, start_metrics_server
+
+    # The webhook server already serves /metrics; polling needs its own port
+    metrics_runner = None
+    if METRICS_PORT and not WEBHOOK_URL:
+        metrics_runner = await start_metrics_server()
+
     print(f"Avionyx Bot Started (v{VERSION})! Authorized UIDs: {cfg.ADMIN_IDS}")
-    await resilient_polling()
+    try:
+        if WEBHOOK_URL:
+            await run_webhook(dp, bot)
+        else:
+            await resilient_polling()
+    finally:
+        for task in (alert_task, snapshot_task):
+            if task:
+                task.cancel()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await dp.storage.close()  # Flush pending wizard state
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,77 @@
+"""Run cache invalidation once a transaction that wrote certain models ends.
+
+In-process caches (settings, user roles, feed forecasts, report screens)
+register the models they are built from with `on_commit` instead of each
+listening to the session themselves. Writes are collected per session as
+they are flushed, and from bulk INSERT/UPDATE/DELETE statements
+(stock.apply_movements, rollup rebuilds), which skip the unit of work.
+
+The callback runs only after COMMIT, so a concurrent reader cannot
+re-cache the old rows between the flush and the commit; caches pair this
+with a generation counter so a read that was already in flight is not
+cached either. It also runs after ROLLBACK, because a reader in the same
+session may have cached the flushed-but-discarded values.
+"""
+from typing import Callable, Hashable, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class _Tracker(NamedTuple):
+    info_key: str  # session.info entry collecting this tracker's notes
+    models: tuple
+    tables: frozenset
+    note: Callable[[object], Hashable]
+    callback: Callable
+    bulk: bool
+
+
+_trackers: List[_Tracker] = []
+
+
+def _table_name(obj) -> str:
+    return obj.__tablename__
+
+
+def on_commit(models: Iterable, callback: Callable, note: Optional[Callable[[object], Hashable]] = None,
+              bulk: bool = True):
+    """Call `callback(engine, notes)` after a transaction that wrote any of `models` commits or rolls back.
+
+    `notes` is the set of `note(obj)` for every flushed instance (default:
+    its table name). With `bulk`, a bulk statement on one of the models'
+    tables adds that table's name.
+    """
+    models = tuple(models)
+    _trackers.append(_Tracker(
+        f"commit_hooks.{len(_trackers)}", models, frozenset(m.__tablename__ for m in models),
+        note or _table_name, callback, bulk,
+    ))
+
+
+@event.listens_for(Session, "after_flush")
+def _note_flushed(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        for tracker in _trackers:
+            if isinstance(obj, tracker.models):
+                session.info.setdefault(tracker.info_key, set()).add(tracker.note(obj))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_bulk(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(getattr(orm_execute_state.statement, "table", None), "name", None)
+        for tracker in _trackers:
+            if tracker.bulk and table in tracker.tables:
+                orm_execute_state.session.info.setdefault(tracker.info_key, set()).add(table)
+
+
+def _run_callbacks(session):
+    for tracker in _trackers:
+        notes = session.info.pop(tracker.info_key, None)
+        if notes:
+            tracker.callback(session.get_bind(), notes)
+
+
+event.listen(Session, "after_commit", _run_callbacks)
+event.listen(Session, "after_rollback", _run_callbacks)
@@ -0,0 +1,164 @@
+"""
+Paginated contact pickers.
+
+Contacts are listed a page at a time with keyset pagination over
+(name COLLATE NOCASE, id): the next page starts after the last contact
+shown, so every page is one index range scan
+(`ix_contacts_role_name_nocase` when filtered by role,
+`ix_contacts_name_nocase` otherwise) no matter how deep the user pages.
+The cursor carried in callback_data is just the boundary contact's id,
+which keeps it well inside Telegram's 64-byte limit; its name is looked
+up by primary key when the page is fetched.
+
+A picker is registered once by the module that owns the screen (which
+callback a contact button sends, how it is labelled, extra rows such as
+"Walk-in / Generic"); the shared `cpg:` navigation handler in
+modules.contacts pages any of them.
+"""
+import difflib
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy import tuple_
+
+from database import Contact, run_db
+
+CONTACT_PAGE_SIZE = int(os.getenv("CONTACT_PAGE_SIZE", "8"))  # Contacts per picker page
+FUZZY_CUTOFF = 0.6  # difflib ratio a name (or one of its words) needs to count as a match
+FUZZY_CANDIDATES = int(os.getenv("FUZZY_CANDIDATES", "200"))  # Names scored with difflib per search
+PREFIX_END = "\U0010ffff"  # Sorts after any character, so [p, p + PREFIX_END) is every name starting with p
+
+
+@dataclass(frozen=True)
+class Picker:
+    role: Optional[str]  # None lists every contact
+    item_prefix: str  # callback_data of a contact button is item_prefix + id
+    label: Callable[[Contact], str]
+    extra_rows: Tuple[Tuple[Tuple[str, str], ...], ...] = ()  # Rows of (text, callback_data) below the page
+
+
+PICKERS: Dict[str, Picker] = {}
+
+
+def register(name: str, picker: Picker):
+    """Make a picker available to the shared page navigation handler."""
+    PICKERS[name] = picker
+
+
+def fetch_page(db, role: Optional[str] = None, after: Optional[int] = None, before: Optional[int] = None,
+               limit: Optional[int] = None) -> Tuple[List[Contact], bool, bool]:
+    """One page of contacts ordered by name. Returns (contacts, has_prev, has_next).
+
+    Names sort ignoring case. `after`/`before` are the ids of the
+    last/first contact of the page being left. A cursor whose contact has
+    since been deleted restarts from the first page.
+    """
+    limit = limit or CONTACT_PAGE_SIZE
+    query = db.query(Contact)
+    if role:
+        query = query.filter(Contact.role == role)
+    anchor = db.get(Contact, after or before) if (after or before) else None
+    name = Contact.name.collate("NOCASE")
+    key = tuple_(name, Contact.id)
+
+    if anchor is not None and before:
+        rows = (query.filter(key < (anchor.name, anchor.id))
+                .order_by(name.desc(), Contact.id.desc()).limit(limit + 1).all())
+        has_prev = len(rows) > limit
+        return list(reversed(rows[:limit])), has_prev, True
+
+    if anchor is not None:
+        query = query.filter(key > (anchor.name, anchor.id))
+    rows = query.order_by(name, Contact.id).limit(limit + 1).all()
+    return rows[:limit], anchor is not None, len(rows) > limit
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fuzzy_score(query: str, name: str) -> float:
+    name = name.lower()
+    if query in name:
+        return 1.0
+    return max(difflib.SequenceMatcher(None, query, word).ratio() for word in (name, *name.split()))
+
+
+def _starting_with(query, prefix: str):
+    name = Contact.name.collate("NOCASE")
+    return query.filter(name >= prefix, name < prefix + PREFIX_END).order_by(name, Contact.id)
+
+
+def search(db, text: str, role: Optional[str] = None, limit: Optional[int] = None) -> List[Contact]:
+    """Contacts whose name starts with `text`, then contains it, then close matches.
+
+    Matching ignores case. The prefix pass is a range scan of the NOCASE
+    name index. Surnames ("kamau" for "John Kamau") come from a substring
+    LIKE, which SQLite scans but stops as soon as the remaining slots are
+    filled. Typos are scored with difflib, but only over at most
+    FUZZY_CANDIDATES names sharing the query's first letter, also read off
+    the index, so a search never loads the whole contact list.
+    """
+    limit = limit or CONTACT_PAGE_SIZE
+    text = text.strip()
+    if not text:
+        return []
+    query = db.query(Contact)
+    if role:
+        query = query.filter(Contact.role == role)
+    found = _starting_with(query, text).limit(limit).all()
+    if len(found) >= limit:
+        return found
+
+    seen = [c.id for c in found]
+    contains = Contact.name.like(f"%{_escape_like(text)}%", escape="\\")
+    found += (query.filter(contains, Contact.id.notin_(seen))
+              .order_by(Contact.name.collate("NOCASE"), Contact.id).limit(limit - len(found)).all())
+    if len(found) >= limit:
+        return found
+
+    needle = text.lower()
+    seen = {c.id for c in found}
+    candidates = _starting_with(query, text[0]).limit(FUZZY_CANDIDATES).all()
+    scored = sorted(
+        ((score, c) for c in candidates
+         if c.id not in seen and (score := _fuzzy_score(needle, c.name)) >= FUZZY_CUTOFF),
+        key=lambda s: (-s[0], s[1].name.lower(), s[1].id),
+    )
+    found += [c for _, c in scored[:limit - len(found)]]
+    return found
+
+
+def build_keyboard(name: str, contacts: List[Contact], has_prev: bool = False,
+                   has_next: bool = False) -> InlineKeyboardMarkup:
+    """Contact buttons, a Prev/Next row when there is more, then the picker's extra rows."""
+    picker = PICKERS[name]
+    keyboard = [[InlineKeyboardButton(text=picker.label(c), callback_data=f"{picker.item_prefix}{c.id}")]
+                for c in contacts]
+    nav = []
+    if has_prev and contacts:
+        nav.append(InlineKeyboardButton(text="⬅️ Prev", callback_data=f"cpg:{name}:p:{contacts[0].id}"))
+    if has_next and contacts:
+        nav.append(InlineKeyboardButton(text="Next ➡️", callback_data=f"cpg:{name}:n:{contacts[-1].id}"))
+    if nav:
+        keyboard.append(nav)
+    for row in picker.extra_rows:
+        keyboard.append([InlineKeyboardButton(text=text, callback_data=data) for text, data in row])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+async def page_keyboard(name: str, after: Optional[int] = None,
+                        before: Optional[int] = None) -> Tuple[InlineKeyboardMarkup, int]:
+    """Keyboard for one page of a registered picker, and how many contacts it shows."""
+    picker = PICKERS[name]
+    contacts, has_prev, has_next = await run_db(fetch_page, picker.role, after, before)
+    return build_keyboard(name, contacts, has_prev, has_next), len(contacts)
+
+
+async def search_keyboard(name: str, text: str) -> Tuple[InlineKeyboardMarkup, int]:
+    """Keyboard of a registered picker's search results, and how many it found."""
+    picker = PICKERS[name]
+    contacts = await run_db(search, text, picker.role)
+    return build_keyboard(name, contacts), len(contacts)
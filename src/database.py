@@ -1,8 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import create_engine, event, text, Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Enum, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
+import asyncio
+import contextvars
 import os
 import shutil
+import threading
+
+from money import Money, to_money
 
 # Database paths
 PROD_DB_PATH = os.getenv("DB_PATH", "sqlite:///avionyx.db")
@@ -25,13 +31,20 @@ class Contact(Base):
     notes = Column(String, default="")
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_contacts_role_name', 'role', 'name'),  # Pickers filter by role, list by name
+        # Contact pickers page and search by case-insensitive name (contact_picker.py)
+        Index('ix_contacts_role_name_nocase', 'role', text('name COLLATE NOCASE')),
+        Index('ix_contacts_name_nocase', text('name COLLATE NOCASE')),
+    )
+
 class FinancialLedger(Base):
     __tablename__ = 'financial_ledger'
     
     id = Column(Integer, primary_key=True)
     date = Column(Date, default=date.today)
     description = Column(String)
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)  # Stored as cents
     direction = Column(String, nullable=False) # IN, OUT
     payment_method = Column(String, default="CASH") # CASH, MPESA, CREDIT
     transaction_ref = Column(String) # M-Pesa Code
@@ -42,6 +55,12 @@ class FinancialLedger(Base):
     
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_financial_ledger_date', 'date'),
+        Index('ix_financial_ledger_direction_category', 'direction', 'category'),
+        Index('ix_financial_ledger_contact_id', 'contact_id'),
+    )
+
 class InventoryLog(Base):
     __tablename__ = 'inventory_logs'
     
@@ -49,6 +68,8 @@ class InventoryLog(Base):
     date = Column(Date, default=date.today)
     item_name = Column(String, nullable=False) # 'Growers Mash', 'Kenbro Chick'
     quantity_change = Column(Float, nullable=False) # +50 or -10
+    item_id = Column(Integer, ForeignKey('inventory_items.id'), nullable=True)  # None for untracked items (e.g. sold crates)
+    balance_after = Column(Float, nullable=True)  # Item stock once this row is applied (running balance)
     
     flock_id = Column(String, nullable=True) # Optional link to flock ID string
     
@@ -57,6 +78,13 @@ class InventoryLog(Base):
     
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_inventory_logs_item_name_date', 'item_name', 'date'),
+        Index('ix_inventory_logs_date', 'date'),
+        Index('ix_inventory_logs_ledger_id', 'ledger_id'),
+        Index('ix_inventory_logs_item_id_date', 'item_id', 'date'),  # Per-item history; rowid is the implicit last key
+    )
+
 class DailyEntry(Base):
     __tablename__ = 'daily_entries'
 
@@ -71,11 +99,11 @@ class DailyEntry(Base):
     # Sales (Metrics only - financial detail in Ledger)
     eggs_sold = Column(Integer, default=0)
     crates_sold = Column(Integer, default=0)
-    income = Column(Float, default=0.0)
+    income = Column(Money, default=0)
     
     # Feed (Metrics only)
     feed_used_kg = Column(Float, default=0.0)
-    feed_cost = Column(Float, default=0.0)
+    feed_cost = Column(Money, default=0)
     
     # Mortality & Flock
     mortality_count = Column(Integer, default=0)
@@ -104,6 +132,10 @@ class AuditLog(Base):
     action = Column(String, nullable=False)  # e.g., "eggs_added", "feed_recorded", "flock_mortality"
     details = Column(String, default="")  # JSON or human-readable details
 
+    __table_args__ = (
+        Index('ix_audit_logs_timestamp', 'timestamp'),
+    )
+
 class User(Base):
     """Bot users with role-based access control."""
     __tablename__ = 'users'
@@ -118,7 +150,8 @@ class User(Base):
 class InventoryItem(Base):
     """
     Kept for 'Current Stock' definition and pricing cache.
-    Real-time stock could be calculated from logs, but this is faster for 'Select Item' menus.
+    `quantity` is a running total of this item's InventoryLog rows, which are the
+    source of truth (see stock.py); it just saves 'Select Item' menus a SUM.
     """
     __tablename__ = 'inventory_items'
     
@@ -127,13 +160,18 @@ class InventoryItem(Base):
     type = Column(String, nullable=False)  # FEED, MEDICATION, EQUIPMENT, LIVESTOCK
     quantity = Column(Float, default=0.0)
     unit = Column(String, default="units")
-    cost_per_unit = Column(Float, default=0.0)
+    cost_per_unit = Column(Money, default=0)
     # New fields for enhanced tracking
     expiry_date = Column(Date, nullable=True)  # For medications/vaccines
     bag_weight = Column(Float, nullable=True)  # Weight per bag in kg (for FEED type)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        Index('ix_inventory_items_type_quantity', 'type', 'quantity'),  # "in stock" menus
+        Index('ix_inventory_items_name', 'name'),
+    )
+
 
 class Flock(Base):
     __tablename__ = 'flocks'
@@ -149,6 +187,10 @@ class Flock(Base):
     status = Column(String, default="ACTIVE")  # ACTIVE, SOLD, ARCHIVED
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_flocks_status', 'status'),
+    )
+
 
 class VaccinationRecord(Base):
     """Track vaccination events per flock with scheduling for next dose."""
@@ -166,6 +208,32 @@ class VaccinationRecord(Base):
     notes = Column(String, default="")
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_vaccination_records_flock_id', 'flock_id'),
+        Index('ix_vaccination_records_next_due_date', 'next_due_date'),
+        Index('ix_vaccination_records_date', 'date'),
+    )
+
+
+class VaccinationSchedule(Base):
+    """Planned doses per flock, generated when the flock is created (see vaccinations.py)."""
+    __tablename__ = 'vaccination_schedule'
+
+    id = Column(Integer, primary_key=True)
+    flock_id = Column(Integer, ForeignKey('flocks.id'), nullable=False)
+    flock = relationship("Flock")
+    vaccine_name = Column(String, nullable=False)
+    age_days = Column(Integer, nullable=False)  # Flock age the dose is due at
+    due_date = Column(Date, nullable=False)
+    status = Column(String, default="PENDING", nullable=False)  # PENDING, DONE, SKIPPED
+    record_id = Column(Integer, ForeignKey('vaccination_records.id'), nullable=True)  # Set when DONE
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_vaccination_schedule_status_due', 'status', 'due_date'),  # due/overdue lookups
+        Index('ix_vaccination_schedule_flock_id', 'flock_id'),
+    )
+
 
 class DailyFeedUsage(Base):
     """Track multiple feed types used per day (linked to DailyEntry)."""
@@ -179,14 +247,145 @@ class DailyFeedUsage(Base):
     quantity_kg = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_daily_feed_usage_daily_entry_id', 'daily_entry_id'),
+        Index('ix_daily_feed_usage_feed_item_id', 'feed_item_id'),
+    )
+
+
+
+class ProductionRollup(Base):
+    """Pre-aggregated DailyEntry totals per DAY / WEEK / MONTH (see rollups.py)."""
+    __tablename__ = 'production_rollups'
+
+    id = Column(Integer, primary_key=True)
+    period = Column(String, nullable=False)  # DAY, WEEK, MONTH
+    period_start = Column(Date, nullable=False)  # Day itself / Monday / 1st of month
+
+    days = Column(Integer, default=0)  # Daily entries folded into this bucket
+    eggs_collected = Column(Integer, default=0)
+    eggs_broken = Column(Integer, default=0)
+    feed_used_kg = Column(Float, default=0.0)
+    feed_cost = Column(Money, default=0)
+    income = Column(Money, default=0)
+    mortality_count = Column(Integer, default=0)
+    flock_total = Column(Integer, default=0)  # Sum of daily flock_total; divide by days for the average
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('period', 'period_start', name='uq_production_rollups_period'),
+    )
+
+
+class LedgerRollup(Base):
+    """Pre-aggregated FinancialLedger totals per period, direction and category."""
+    __tablename__ = 'ledger_rollups'
+
+    id = Column(Integer, primary_key=True)
+    period = Column(String, nullable=False)  # DAY, WEEK, MONTH
+    period_start = Column(Date, nullable=False)
+    direction = Column(String, nullable=False)  # IN, OUT
+    category = Column(String, nullable=False)
+    amount = Column(Money, default=0)
+    entries = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('period', 'period_start', 'direction', 'category', name='uq_ledger_rollups_bucket'),
+    )
+
+
+class InventorySnapshot(Base):
+    """Stock of one item after every InventoryLog up to (`date`, `last_log_id`) in (date, id) order (see stock.py)."""
+    __tablename__ = 'inventory_snapshots'
+
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey('inventory_items.id'), nullable=False)
+    last_log_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)  # Date of that last log (the newest one covered)
+    quantity = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_inventory_snapshots_item_date', 'item_id', 'date'),
+    )
+
+
+class SentAlert(Base):
+    """Alerts already pushed by the scheduler, keyed by condition (see alerts.collect_alerts)."""
+    __tablename__ = 'sent_alerts'
+
+    id = Column(Integer, primary_key=True)
+    alert_key = Column(String, unique=True, nullable=False)  # e.g. "feed_low:2025-12-18"
+    message = Column(String, default="")
+    sent_at = Column(DateTime, default=datetime.now, nullable=False)
+
+
+class AnomalyState(Base):
+    """Running EWMA mean/variance of a daily metric, folded up to `last_date` (see anomaly.py)."""
+    __tablename__ = 'anomaly_states'
+
+    metric = Column(String, primary_key=True)  # e.g. "laying_rate"
+    last_date = Column(Date, nullable=False)
+    mean = Column(Float, nullable=False, default=0.0)
+    var = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)  # Days folded in
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# Money attributes always hold Decimals in Python, even before a flush/reload,
+# so handler arithmetic never mixes a just-assigned float with a loaded Decimal
+MONEY_ATTRIBUTES = (
+    FinancialLedger.amount, DailyEntry.income, DailyEntry.feed_cost, InventoryItem.cost_per_unit,
+    ProductionRollup.income, ProductionRollup.feed_cost, LedgerRollup.amount,
+)
+
+def _coerce_money(target, value, oldvalue, initiator):
+    return None if value is None else to_money(value)
+
+for _attr in MONEY_ATTRIBUTES:
+    event.listen(_attr, "set", _coerce_money, retval=True)
+
+# SQLite tuning - WAL lets report/alert readers run alongside wizard/finance writers
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),  # Safe with WAL, far fewer fsyncs
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),  # Wait for locks instead of failing
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-16000")),  # Negative = KiB (~16MB)
+}
+
+# Connection pool (file databases only)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def apply_sqlite_pragmas(engine, pragmas: dict = SQLITE_PRAGMAS):
+    """Run the PRAGMAs on every new DBAPI connection of this engine."""
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def create_db_engine(url: str, tuned: bool = True):
+    """Create an engine for `url`; `tuned=False` gives SQLite defaults (used by benchmarks)."""
+    kwargs = {"echo": False, "connect_args": {"check_same_thread": False}}
+    if tuned and ":memory:" not in url:
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    engine = create_engine(url, **kwargs)
+    if tuned and url.startswith("sqlite"):
+        apply_sqlite_pragmas(engine)
+    return engine
 
 # Engine Instances
-prod_engine = create_engine(PROD_DB_PATH, echo=False, connect_args={"check_same_thread": False})
+prod_engine = create_db_engine(PROD_DB_PATH)
 ProdSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=prod_engine)
 
 # Placeholder for Demo Engine (Lazy load)
 demo_engine = None
 DemoSessionLocal = None
+_demo_lock = threading.Lock()  # get_db runs on the pool; first demo sessions may race to create it
 
 def init_db():
     # Mainly for manual init, ALembic handles migration usually
@@ -194,27 +393,38 @@ def init_db():
     return sessionmaker(bind=prod_engine)()
 
 def init_demo_db():
+    """Create the demo engine and schema once; later calls reuse it. Returns the session factory."""
     global demo_engine, DemoSessionLocal
-    demo_engine = create_engine(DEMO_DB_PATH, echo=False, connect_args={"check_same_thread": False})
-    Base.metadata.create_all(demo_engine)
-    DemoSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=demo_engine)
+    with _demo_lock:
+        if DemoSessionLocal is None:
+            engine = create_db_engine(DEMO_DB_PATH)
+            Base.metadata.create_all(engine)
+            demo_engine = engine
+            DemoSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        return DemoSessionLocal
 
 def wipe_demo_db():
     global demo_engine, DemoSessionLocal, IS_DEMO_MODE
-    if demo_engine:
-        demo_engine.dispose()
-    demo_engine = None
-    DemoSessionLocal = None
-    IS_DEMO_MODE = False
+    with _demo_lock:
+        IS_DEMO_MODE = False
+        if demo_engine:
+            demo_engine.dispose()
+        demo_engine = None
+        DemoSessionLocal = None
     
-    if os.path.exists(DEMO_FILE):
-        os.remove(DEMO_FILE)
+    # WAL mode leaves -wal/-shm side files next to the database
+    for path in (DEMO_FILE, f"{DEMO_FILE}-wal", f"{DEMO_FILE}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+# Thread pool for blocking SQLite work, so handlers don't stall the event loop.
+# Kept small: SQLite serializes writers anyway.
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="avionyx-db")
 
 def get_db():
     if IS_DEMO_MODE:
-        if not DemoSessionLocal:
-            init_demo_db()
-        db = DemoSessionLocal()
+        db = init_demo_db()()
     else:
         db = ProdSessionLocal()
         
@@ -222,3 +432,24 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Async replacement for `next(get_db())` inside handlers.
+    Runs `fn(db, *args, **kwargs)` on the DB thread pool with a fresh session,
+    closes the session afterwards and returns fn's result.
+    Return plain values (or objects loaded without a commit) - the session is
+    closed by the time the caller sees the result.
+    """
+    def work():
+        gen = get_db()
+        db = next(gen)
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            gen.close()
+
+    # Carry the caller's context (e.g. per-handler metrics) into the DB thread
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, ctx.run, work)
@@ -0,0 +1,139 @@
+"""Streaming data export.
+
+Rows are pulled in batches with `yield_per` and written straight into a
+SpooledTemporaryFile (kept in memory while small, rolled to disk past
+EXPORT_SPOOL_MAX_BYTES), so no export ever holds a whole table in RAM.
+The result is a zip bundle with one CSV per table, or a single (optionally
+gzipped) CSV, uploaded to Telegram chunk by chunk via SpooledInputFile.
+"""
+import csv
+import gzip
+import io
+import os
+import zipfile
+from datetime import date, datetime, time
+from tempfile import SpooledTemporaryFile
+from typing import AsyncGenerator, Dict, Optional, Tuple
+
+from aiogram.types import InputFile
+
+from database import DailyEntry, FinancialLedger, InventoryLog, VaccinationRecord, AuditLog
+
+EXPORT_SPOOL_MAX_BYTES = int(os.getenv("EXPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+EXPORT_BATCH_SIZE = 500
+
+# name -> (model, date column, [(header, column), ...])
+EXPORT_TABLES = {
+    "daily_entries": (DailyEntry, DailyEntry.date, [
+        ("Date", DailyEntry.date),
+        ("Eggs Collected", DailyEntry.eggs_collected),
+        ("Eggs Broken", DailyEntry.eggs_broken),
+        ("Feed Used (kg)", DailyEntry.feed_used_kg),
+        ("Feed Cost", DailyEntry.feed_cost),
+        ("Income", DailyEntry.income),
+        ("Mortality", DailyEntry.mortality_count),
+        ("Flock Total", DailyEntry.flock_total),
+        ("Notes", DailyEntry.notes),
+    ]),
+    "ledger": (FinancialLedger, FinancialLedger.date, [
+        ("Date", FinancialLedger.date),
+        ("Direction", FinancialLedger.direction),
+        ("Category", FinancialLedger.category),
+        ("Amount", FinancialLedger.amount),
+        ("Payment Method", FinancialLedger.payment_method),
+        ("Reference", FinancialLedger.transaction_ref),
+        ("Description", FinancialLedger.description),
+        ("Contact ID", FinancialLedger.contact_id),
+    ]),
+    "inventory_logs": (InventoryLog, InventoryLog.date, [
+        ("Date", InventoryLog.date),
+        ("Item", InventoryLog.item_name),
+        ("Item ID", InventoryLog.item_id),
+        ("Quantity Change", InventoryLog.quantity_change),
+        ("Flock", InventoryLog.flock_id),
+        ("Ledger ID", InventoryLog.ledger_id),
+    ]),
+    "vaccinations": (VaccinationRecord, VaccinationRecord.date, [
+        ("Date", VaccinationRecord.date),
+        ("Flock ID", VaccinationRecord.flock_id),
+        ("Vaccine", VaccinationRecord.vaccine_name),
+        ("Doses Used", VaccinationRecord.doses_used),
+        ("Birds Vaccinated", VaccinationRecord.birds_vaccinated),
+        ("Next Due", VaccinationRecord.next_due_date),
+        ("Vaccinator", VaccinationRecord.vaccinator),
+        ("Notes", VaccinationRecord.notes),
+    ]),
+    "audit_log": (AuditLog, AuditLog.timestamp, [
+        ("Timestamp", AuditLog.timestamp),
+        ("User ID", AuditLog.user_id),
+        ("Action", AuditLog.action),
+        ("Details", AuditLog.details),
+    ]),
+}
+
+
+def _spool() -> SpooledTemporaryFile:
+    return SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES, mode="w+b")
+
+
+def write_table_csv(db, name: str, binary_file, start_date: Optional[date] = None) -> int:
+    """Stream one table as CSV into `binary_file`. Returns the row count."""
+    model, date_col, columns = EXPORT_TABLES[name]
+    query = db.query(*[col for _, col in columns]).order_by(date_col.desc(), model.id.desc())
+    if start_date:
+        # AuditLog is keyed by a DateTime; compare from midnight
+        bound = datetime.combine(start_date, time.min) if date_col is AuditLog.timestamp else start_date
+        query = query.filter(date_col >= bound)
+
+    text = io.TextIOWrapper(binary_file, encoding="utf-8", newline="", write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow([header for header, _ in columns])
+        rows = 0
+        for row in query.yield_per(EXPORT_BATCH_SIZE):
+            writer.writerow(["" if v is None else v for v in row])
+            rows += 1
+        text.flush()
+    finally:
+        text.detach()  # Leave the underlying file open for the caller
+    return rows
+
+
+def build_bundle(db, start_date: Optional[date] = None, tables=tuple(EXPORT_TABLES)) -> Tuple[SpooledTemporaryFile, Dict[str, int]]:
+    """Zip bundle with one `<table>.csv` per table. Returns (file at offset 0, row counts)."""
+    spool = _spool()
+    counts = {}
+    with zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        for name in tables:
+            with bundle.open(f"{name}.csv", "w", force_zip64=True) as member:
+                counts[name] = write_table_csv(db, name, member, start_date)
+    spool.seek(0)
+    return spool, counts
+
+
+def build_csv(db, name: str, start_date: Optional[date] = None, compress: bool = False) -> Tuple[SpooledTemporaryFile, int]:
+    """A single table as CSV (gzip when `compress`). Returns (file at offset 0, row count)."""
+    spool = _spool()
+    if compress:
+        with gzip.GzipFile(fileobj=spool, mode="wb") as gz:
+            rows = write_table_csv(db, name, gz, start_date)
+    else:
+        rows = write_table_csv(db, name, spool, start_date)
+    spool.seek(0)
+    return spool, rows
+
+
+class SpooledInputFile(InputFile):
+    """Upload an open (spooled) file in chunks without reading it into memory.
+
+    The caller owns the file and closes it after sending.
+    """
+
+    def __init__(self, file, filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
@@ -0,0 +1,115 @@
+"""Per-feed consumption forecasts.
+
+Each feed's daily burn is an exponentially weighted mean of its
+DailyFeedUsage over the last FORECAST_WINDOW_DAYS: a day's usage counts with
+weight 0.5 ** (age / FORECAST_HALF_LIFE_DAYS), so last week matters more than
+last month and a switch between feeds shows up within a few days. Only days
+that have a daily entry count; a missed entry is missing data, not zero use.
+
+Projections are cached per database engine and dropped when a committed
+transaction writes feed usage, daily entries or inventory (ORM flushes and
+bulk inserts alike), or when the date changes. A computation that raced
+with an invalidation is returned but not cached, like settings_cache.
+"""
+import math
+import os
+import threading
+import time
+import weakref
+from datetime import date, timedelta
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import func
+
+import commit_hooks
+from database import DailyEntry, DailyFeedUsage, InventoryItem, InventoryLog
+
+FORECAST_HALF_LIFE_DAYS = float(os.getenv("FORECAST_HALF_LIFE_DAYS", "7"))  # Age at which a day's usage counts half
+FORECAST_WINDOW_DAYS = int(os.getenv("FORECAST_WINDOW_DAYS", "28"))  # Days of history considered
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", "3600"))  # Seconds; safety net for out-of-band edits
+
+_lock = threading.Lock()
+_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # engine -> (loaded_at, day, {item_id: FeedForecast})
+_generations: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # engine -> invalidation count
+
+
+class FeedForecast(NamedTuple):
+    item_id: int
+    name: str
+    unit: str
+    stock: float
+    daily_usage: float  # Weighted kg/day, 0 when the feed has no recent usage
+    days_left: Optional[float]  # None when not being used
+    stockout_date: Optional[date]
+
+
+def ewma_rate(usage: Dict[date, float], days, today: date, half_life: float = FORECAST_HALF_LIFE_DAYS) -> float:
+    """Exponentially weighted mean of `usage` over the recorded `days` (absent days count as 0)."""
+    total = weight_sum = 0.0
+    for day in days:
+        weight = 0.5 ** ((today - day).days / half_life)
+        total += weight * usage.get(day, 0.0)
+        weight_sum += weight
+    return total / weight_sum if weight_sum else 0.0
+
+
+def compute_forecasts(db, today: Optional[date] = None) -> Dict[int, FeedForecast]:
+    """{item_id: FeedForecast} for every feed item. Three queries."""
+    today = today or date.today()
+    start = today - timedelta(days=FORECAST_WINDOW_DAYS - 1)
+
+    days = [d for (d,) in db.query(DailyEntry.date).filter(DailyEntry.date.between(start, today)).distinct()]
+    usage: Dict[int, Dict[date, float]] = {}
+    rows = (
+        db.query(DailyFeedUsage.feed_item_id, DailyEntry.date, func.sum(DailyFeedUsage.quantity_kg))
+        .join(DailyEntry, DailyFeedUsage.daily_entry_id == DailyEntry.id)
+        .filter(DailyEntry.date.between(start, today))
+        .group_by(DailyFeedUsage.feed_item_id, DailyEntry.date)
+    )
+    for item_id, day, kg in rows:
+        usage.setdefault(item_id, {})[day] = kg or 0.0
+
+    forecasts = {}
+    for item in db.query(InventoryItem).filter(InventoryItem.type == "FEED"):
+        stock = max(item.quantity or 0.0, 0.0)
+        rate = ewma_rate(usage.get(item.id, {}), days, today)
+        days_left = stock / rate if rate > 0 else None
+        stockout = today + timedelta(days=math.floor(days_left)) if days_left is not None else None
+        forecasts[item.id] = FeedForecast(item.id, item.name, item.unit or "kg", stock, rate, days_left, stockout)
+    return forecasts
+
+
+def feed_forecasts(db) -> Dict[int, FeedForecast]:
+    """Cached `compute_forecasts` for today."""
+    engine = db.get_bind()
+    today = date.today()
+    with _lock:
+        cached = _cache.get(engine)
+        if cached and cached[1] == today and time.monotonic() - cached[0] < FORECAST_CACHE_TTL:
+            return cached[2]
+        generation = _generations.setdefault(engine, 0)
+
+    forecasts = compute_forecasts(db, today)
+    with _lock:
+        if _generations.get(engine) == generation:  # Else a feed write committed meanwhile; don't cache old stock
+            _cache[engine] = (time.monotonic(), today, forecasts)
+    return forecasts
+
+
+def invalidate(engine=None):
+    """Forget cached forecasts for one engine, or for all of them."""
+    with _lock:
+        for target in (list(_generations) if engine is None else [engine]):
+            _generations[target] = _generations.get(target, 0) + 1
+        if engine is None:
+            _cache.clear()
+        else:
+            _cache.pop(engine, None)
+
+
+# --- Invalidation on feed writes ---
+# Bulk writes (stock.apply_movements, record_feed_usage) count too (see commit_hooks).
+
+FEED_MODELS = (DailyFeedUsage, DailyEntry, InventoryItem, InventoryLog)
+
+commit_hooks.on_commit(FEED_MODELS, lambda engine, _: invalidate(engine))
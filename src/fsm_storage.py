@@ -0,0 +1,191 @@
+"""SQLite-backed FSM storage for aiogram.
+
+Wizard state survives restarts: every (state, data) pair lives in one row of
+a small side database (FSM_DB_PATH, separate from the farm data so demo mode
+and migrations never touch it), with the data stored as compact JSON.
+
+Writes are coalesced. Handlers only update an in-memory copy and mark the
+key dirty; all dirty keys are written in a single transaction at most every
+FSM_FLUSH_INTERVAL seconds, so the dozen `update_data` calls of one expense
+wizard cost one commit instead of a dozen. Pending writes are flushed on
+`close()`. The in-memory copy is authoritative, so run one bot process per
+database file (as Telegram polling requires anyway).
+
+Conversations untouched for FSM_STATE_TTL seconds are treated as abandoned:
+they read back as empty and are purged on the next flush.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from database import SQLITE_PRAGMAS
+
+logger = logging.getLogger(__name__)
+
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", "avionyx_fsm.db")
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "2"))  # Seconds; 0 writes through
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", str(24 * 3600)))  # Seconds
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm_records (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+_EMPTY = "{}"
+
+
+def _storage_key(key: StorageKey) -> str:
+    parts = [key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny]
+    return ":".join("" if p is None else str(p) for p in parts)
+
+
+def _dumps(data: Mapping[str, Any]) -> str:
+    return json.dumps(dict(data), separators=(",", ":"), ensure_ascii=False)
+
+
+class SQLiteStorage(BaseStorage):
+    """Persistent, write-coalescing FSM storage. See module docstring."""
+
+    def __init__(self, path: str = FSM_DB_PATH, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 ttl: float = FSM_STATE_TTL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        # key -> [state, data json, updated_at]; missing rows are cached as empty too
+        self._records: Dict[str, list] = {}
+        self._dirty: set = set()
+        self._flush_handle: Optional[asyncio.Task] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        # One thread owns the connection, which also serialises reads and writes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+
+    # --- Blocking side (storage thread) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            for name, value in SQLITE_PRAGMAS.items():
+                self._conn.execute(f"PRAGMA {name}={value}")
+            self._conn.execute(_SCHEMA)
+            self._conn.commit()
+        return self._conn
+
+    def _read(self, key: str) -> Optional[tuple]:
+        return self._connect().execute(
+            "SELECT state, data, updated_at FROM fsm_records WHERE key = ?", (key,)
+        ).fetchone()
+
+    def _write(self, upserts: list, deletes: list, expire_before: float):
+        conn = self._connect()
+        with conn:  # One transaction per flush
+            if upserts:
+                conn.executemany(
+                    "INSERT INTO fsm_records (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                    "updated_at = excluded.updated_at",
+                    upserts,
+                )
+            if deletes:
+                conn.executemany("DELETE FROM fsm_records WHERE key = ?", [(k,) for k in deletes])
+            conn.execute("DELETE FROM fsm_records WHERE updated_at < ?", (expire_before,))
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # --- In-memory side ---
+
+    def _expired(self, updated_at: float) -> bool:
+        return self.ttl > 0 and time.time() - updated_at > self.ttl
+
+    async def _record(self, key: StorageKey) -> list:
+        k = _storage_key(key)
+        record = self._records.get(k)
+        if record is None:
+            row = await self._run(self._read, k)
+            # Another coroutine may have written this key while we were reading
+            record = self._records.setdefault(k, list(row) if row else [None, _EMPTY, time.time()])
+        if self._expired(record[2]):
+            record[:] = [None, _EMPTY, time.time()]
+            self._dirty.add(k)
+        return record
+
+    async def _touch(self, key: StorageKey, record: list):
+        record[2] = time.time()
+        self._dirty.add(_storage_key(key))
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._flush_handle is None or self._flush_handle.done():
+            self._flush_handle = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("FSM flush failed; will retry on next write")
+
+    async def flush(self):
+        """Write every dirty key to disk in one transaction."""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for k in keys:
+            state, data, updated_at = self._records[k]
+            if state is None and data == _EMPTY:
+                deletes.append(k)
+                del self._records[k]  # Nothing worth keeping in memory either
+            else:
+                upserts.append((k, state, data, updated_at))
+        for k in [k for k, r in self._records.items() if k not in keys and self._expired(r[2])]:
+            del self._records[k]  # Abandoned; the DELETE below drops the row
+        try:
+            await self._run(self._write, upserts, deletes, time.time() - self.ttl if self.ttl > 0 else 0)
+        except Exception:
+            self._dirty |= keys
+            for k in deletes:
+                self._records.setdefault(k, [None, _EMPTY, time.time()])
+            raise
+
+    # --- BaseStorage API ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        await self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._record(key)
+        record[1] = _dumps(data)  # Serialise now so bad values fail in the handler, not the flush
+        await self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return json.loads((await self._record(key))[1])
+
+    async def close(self) -> None:
+        if self._flush_handle and not self._flush_handle.done():
+            self._flush_handle.cancel()
+        try:
+            await self.flush()
+        finally:
+            await self._run(self._close_connection)
+            self._executor.shutdown(wait=True)
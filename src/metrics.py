@@ -0,0 +1,203 @@
+"""Per-handler latency and query metrics.
+
+`MetricsMiddleware` (see middlewares.py) opens a RequestStats for each
+handled message/callback; the engine-wide cursor listeners below add every
+statement's count and duration to it. `run_db` copies the handler's context
+into the DB thread, so queries run there are attributed to the right handler.
+When the handler returns, its wall time, DB time and query count go into
+per-handler histograms.
+
+The histograms are exposed in Prometheus text format at METRICS_PATH - on
+the webhook server in webhook mode, or on a small server at METRICS_PORT
+when polling - and summarised as p50/p95/p99 by the admin `/perf` command.
+"""
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, List, Optional
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Polling mode only; 0 = no metrics server
+METRICS_SAMPLES = int(os.getenv("METRICS_SAMPLES", "1000"))  # Recent samples kept per histogram for percentiles
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative Prometheus-style buckets plus a window of recent samples."""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "samples")
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)  # Per bucket, made cumulative on export
+        self.sum = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=METRICS_SAMPLES)
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile (0-100) of the recent samples."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+class HandlerMetrics:
+    __slots__ = ("wall", "db", "queries", "errors")
+
+    def __init__(self):
+        self.wall = Histogram(SECONDS_BUCKETS)
+        self.db = Histogram(SECONDS_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.errors = 0
+
+
+class RequestStats:
+    """DB work attributed to one handler call (updated from DB threads)."""
+
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_lock = threading.Lock()
+_handlers: Dict[str, HandlerMetrics] = {}
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "avionyx_request_stats", default=None
+)
+
+
+def begin_request() -> contextvars.Token:
+    """Start attributing queries in this context to a fresh RequestStats."""
+    return current_request.set(RequestStats())
+
+
+def end_request(token: contextvars.Token, handler: str, wall: float, failed: bool = False) -> RequestStats:
+    """Record the finished request under `handler` and restore the context."""
+    stats = current_request.get()
+    current_request.reset(token)
+    with _lock:
+        metrics = _handlers.get(handler)
+        if metrics is None:
+            metrics = _handlers[handler] = HandlerMetrics()
+        metrics.wall.observe(wall)
+        metrics.db.observe(stats.db_time)
+        metrics.queries.observe(stats.queries)
+        if failed:
+            metrics.errors += 1
+    return stats
+
+
+def reset():
+    """Drop all recorded metrics."""
+    with _lock:
+        _handlers.clear()
+
+
+# --- SQL listeners ---
+# Registered on the Engine class so prod, demo and test engines are all
+# covered. Outside a handler (scheduler, scripts) they only do a ContextVar read.
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_request.get() is not None:
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request.get()
+    started = conn.info.get("metrics_started")
+    if stats is not None and started:
+        stats.db_time += time.perf_counter() - started.pop()
+        stats.queries += 1
+
+
+# --- Reporting ---
+
+def summary() -> List[Dict[str, float]]:
+    """Per-handler percentiles (seconds / query counts), slowest p95 first."""
+    with _lock:
+        rows = [
+            {
+                "handler": name,
+                "count": m.wall.count,
+                "errors": m.errors,
+                "p50": m.wall.percentile(50),
+                "p95": m.wall.percentile(95),
+                "p99": m.wall.percentile(99),
+                "db_p95": m.db.percentile(95),
+                "queries_p95": m.queries.percentile(95),
+            }
+            for name, m in _handlers.items()
+        ]
+    return sorted(rows, key=lambda r: r["p95"], reverse=True)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name: str, help_text: str, histograms: Dict[str, Histogram]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for handler, h in histograms.items():
+        label = f'handler="{_label(handler)}"'
+        running = 0
+        for bound, count in zip(h.buckets, h.counts):
+            running += count
+            lines.append(f'{name}_bucket{{{label},le="{bound:g}"}} {running}')
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {h.count}')
+        lines.append(f"{name}_sum{{{label}}} {h.sum:g}")
+        lines.append(f"{name}_count{{{label}}} {h.count}")
+    return lines
+
+
+def render_prometheus() -> str:
+    """All handler metrics in the Prometheus text exposition format."""
+    with _lock:
+        handlers = dict(sorted(_handlers.items()))
+        lines = _histogram_lines("avionyx_handler_seconds", "Handler wall time in seconds.",
+                                 {k: m.wall for k, m in handlers.items()})
+        lines += _histogram_lines("avionyx_handler_db_seconds", "Time spent in SQL per handler call.",
+                                  {k: m.db for k, m in handlers.items()})
+        lines += _histogram_lines("avionyx_handler_queries", "SQL statements per handler call.",
+                                  {k: m.queries for k, m in handlers.items()})
+        lines += ["# HELP avionyx_handler_errors_total Handler calls that raised.",
+                  "# TYPE avionyx_handler_errors_total counter"]
+        lines += [f'avionyx_handler_errors_total{{handler="{_label(k)}"}} {m.errors}' for k, m in handlers.items()]
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_view(request):
+    """aiohttp handler serving `render_prometheus()`."""
+    return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT, path: str = METRICS_PATH):
+    """Serve METRICS_PATH on its own port (polling mode). Returns the AppRunner to clean up."""
+    app = web.Application()
+    app.router.add_get(path, metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,56 @@
+"""Dispatcher middlewares."""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+
+import metrics
+from utils import get_user_role
+
+
+class RoleMiddleware(BaseMiddleware):
+    """Resolve the sender's role once per update and pass it to handlers as `role`.
+
+    Handlers opt in by declaring a `role` parameter; the lookup goes through
+    the cached `get_user_role`, so repeat presses cost no database I/O.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: TelegramUser | None = data.get("event_from_user")
+        if user is not None:
+            data["role"] = await get_user_role(user.id)
+        return await handler(event, data)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Time each handler call and count its SQL (see metrics.py).
+
+    Register as an inner middleware (`dp.message.middleware(...)`) so it
+    only wraps updates a handler actually takes, and `data["handler"]`
+    names it.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        token = metrics.begin_request()
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics.end_request(token, name, time.perf_counter() - started, failed)
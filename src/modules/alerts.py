@@ -1,29 +1,27 @@
 """Alerts & Notifications module for proactive monitoring."""
 from aiogram import Router, types, F
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from database import get_db, DailyEntry, SystemSettings, AuditLog, Flock
+from database import run_db, DailyEntry, AuditLog
+from settings_cache import get_float
+from forecasting import feed_forecasts
+from anomaly import detect
+from vaccinations import due_doses, OVERDUE_DAYS
 from datetime import date, timedelta
 from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
 from utils import get_back_home_keyboard
 
 router = Router()
 
 # Default thresholds
 DEFAULT_FEED_LOW_THRESHOLD = 50.0  # kg
-DEFAULT_EGG_DROP_THRESHOLD = 20  # percentage
-
-# Vaccination Schedule (Day: Vaccine)
-VACCINE_SCHEDULE = {
-    7: "Gumboro (1st Dose)",
-    14: "Gumboro (Booster)",
-    21: "Newcastle (Lasota)",
-    28: "Newcastle (Booster)"
-}
+DEFAULT_EGG_ANOMALY_Z = 3.0  # standard deviations below the trend
+DEFAULT_EGG_SHORTFALL_PCT = 10.0  # laying % points below the age curve
+DEFAULT_FEED_DAYS_LEFT_THRESHOLD = 3.0  # days of projected stock
 
 def get_setting_value(db, key: str, default: float) -> float:
     """Get a setting value or return default."""
-    setting = db.query(SystemSettings).filter_by(key=key).first()
-    return float(setting.value) if setting else default
+    return get_float(db, key, default)
 
 
 def check_low_feed_stock(db) -> str | None:
@@ -41,80 +39,117 @@ def check_low_feed_stock(db) -> str | None:
     return None
 
 
+def _feed_stockout_alerts(db) -> list[tuple[str, str]]:
+    """(dedup key, message) for feeds projected to run out within the threshold."""
+    threshold = get_setting_value(db, "feed_days_left_threshold", DEFAULT_FEED_DAYS_LEFT_THRESHOLD)
+    alerts = []
+    for fc in sorted(feed_forecasts(db).values(), key=lambda fc: fc.days_left or 0):
+        if fc.days_left is None or fc.days_left > threshold:
+            continue
+        alerts.append((
+            f"feed_stockout:{fc.item_id}:{fc.stockout_date}",
+            f"📉 **Feed Running Out!**\n{fc.name}: {fc.stock:g} {fc.unit} left at ~{fc.daily_usage:.1f} {fc.unit}/day.\n"
+            f"Projected to run out in **{fc.days_left:.1f} days** ({fc.stockout_date:%b %d}). Consider restocking."
+        ))
+    return alerts
+
+
+def check_feed_stockout(db) -> list[str]:
+    """Check per-feed stock-out projections. Returns list of alerts."""
+    return [text for _, text in _feed_stockout_alerts(db)]
+
+
 def check_egg_production_anomaly(db) -> str | None:
-    """Check for significant drop in egg production. Returns alert message or None."""
-    threshold_pct = get_setting_value(db, "egg_drop_threshold", DEFAULT_EGG_DROP_THRESHOLD)
+    """Check for a drop or slow decline in laying rate vs. the flock's age curve. Returns alert message or None."""
+    z_threshold = get_setting_value(db, "egg_anomaly_z", DEFAULT_EGG_ANOMALY_Z)
+    shortfall_pct = get_setting_value(db, "egg_shortfall_pct", DEFAULT_EGG_SHORTFALL_PCT)
     
-    today = date.today()
-    yesterday = today - timedelta(days=1)
-    
-    today_entry = db.query(DailyEntry).filter(DailyEntry.date == today).first()
-    yesterday_entry = db.query(DailyEntry).filter(DailyEntry.date == yesterday).first()
-    
-    if not today_entry or not yesterday_entry:
+    anomalies = detect(db, z_threshold=z_threshold, shortfall_pct=shortfall_pct)
+    if not anomalies:
         return None
     
-    if yesterday_entry.eggs_collected == 0:
-        return None  # Avoid division by zero
-    
-    drop_pct = ((yesterday_entry.eggs_collected - today_entry.eggs_collected) / yesterday_entry.eggs_collected) * 100
-    
-    if drop_pct >= threshold_pct:
-        return (
-            f"🚨 **Production Alert!**\n"
-            f"Egg production dropped by **{drop_pct:.0f}%**!\n"
-            f"Yesterday: {yesterday_entry.eggs_collected} → Today: {today_entry.eggs_collected}\n\n"
-            f"_Consider checking flock health._"
-        )
-    
-    return None
+    first = anomalies[0]
+    expected = f" (expected ~{first.expected:.0f}% for flock age)" if first.expected is not None else ""
+    lines = [f"🚨 **Production Alert!**", f"Laying rate today: **{first.rate:.0f}%**{expected}"]
+    for a in anomalies:
+        if a.kind == "drop":
+            lines.append(f"Sharp drop: {abs(a.z):.1f}σ below the recent trend.")
+        else:
+            lines.append(f"Sustained shortfall: running {abs(a.baseline):.0f} points below the expected curve.")
+    lines.append("\n_Consider checking flock health._")
+    return "\n".join(lines)
 
-def check_vaccination_schedule(db) -> list[str]:
-    """Check for vaccination dues for active flocks. Returns list of alerts."""
+def _vaccination_alerts(db) -> list[tuple[str, str]]:
+    """(dedup key, message) for scheduled doses due today, tomorrow or recently missed."""
     alerts = []
-    active_flocks = db.query(Flock).filter_by(status="ACTIVE").all()
     today = date.today()
-    
-    for flock in active_flocks:
-        age_days = (today - flock.hatch_date).days
-        
-        # Check if due today or tomorrow
-        # Today
-        vaccine = VACCINE_SCHEDULE.get(age_days)
-        if vaccine:
-            alerts.append(f"💉 **Vaccination Due TODAY!**\nFlock: {flock.name} (Age: {age_days} days)\nVaccine: {vaccine}")
-            
-        # Tomorrow
-        vaccine_tmr = VACCINE_SCHEDULE.get(age_days + 1)
-        if vaccine_tmr:
-            alerts.append(f"🔔 **Vaccination Reminder**\nFlock: {flock.name} will be {age_days+1} days old tomorrow.\nPrepare for: {vaccine_tmr}")
+    tomorrow = today + timedelta(days=1)
+    
+    # One indexed range query over the precomputed schedule
+    for dose, flock_name in due_doses(db, today - timedelta(days=OVERDUE_DAYS), tomorrow):
+        if dose.due_date == today:
+            alerts.append((
+                f"vaccine_due:{dose.flock_id}:{dose.age_days}",
+                f"💉 **Vaccination Due TODAY!**\nFlock: {flock_name} (Age: {dose.age_days} days)\nVaccine: {dose.vaccine_name}"
+            ))
+        elif dose.due_date == tomorrow:
+            alerts.append((
+                f"vaccine_reminder:{dose.flock_id}:{dose.age_days}",
+                f"🔔 **Vaccination Reminder**\nFlock: {flock_name} will be {dose.age_days} days old tomorrow.\nPrepare for: {dose.vaccine_name}"
+            ))
+        else:
+            alerts.append((
+                f"vaccine_overdue:{dose.flock_id}:{dose.age_days}",
+                f"⏰ **Vaccination Overdue**\nFlock: {flock_name}\n{dose.vaccine_name} was due {dose.due_date:%b %d} ({(today - dose.due_date).days} days ago)."
+            ))
             
     return alerts
 
-def run_all_checks(db) -> list[str]:
-    """Run all alert checks and return list of alert messages."""
+def check_vaccination_schedule(db) -> list[str]:
+    """Check for vaccination dues for active flocks. Returns list of alerts."""
+    return [text for _, text in _vaccination_alerts(db)]
+
+def collect_alerts(db) -> list[tuple[str, str]]:
+    """Run all checks, returning (dedup key, message) pairs.
+
+    Keys identify the condition rather than the wording (one feed alert per
+    day, one reminder per flock and dose) so the scheduler can avoid
+    re-sending an alert whose numbers changed.
+    """
+    today = date.today().isoformat()
     alerts = []
     
     feed_alert = check_low_feed_stock(db)
     if feed_alert:
-        alerts.append(feed_alert)
+        alerts.append((f"feed_low:{today}", feed_alert))
+    
+    alerts.extend(_feed_stockout_alerts(db))
     
     egg_alert = check_egg_production_anomaly(db)
     if egg_alert:
-        alerts.append(egg_alert)
+        alerts.append((f"egg_drop:{today}", egg_alert))
         
-    vaccine_alerts = check_vaccination_schedule(db)
-    alerts.extend(vaccine_alerts)
+    alerts.extend(_vaccination_alerts(db))
     
     return alerts
 
+def run_all_checks(db) -> list[str]:
+    """Run all alert checks and return list of alert messages.
+
+    Commits, so the anomaly baseline the egg check advanced is kept.
+    """
+    alerts = collect_alerts(db)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # A concurrent check created the anomaly state first; its row is kept
+    return [text for _, text in alerts]
+
 
 @router.callback_query(F.data == "menu_alerts")
 async def show_alerts(callback: types.CallbackQuery):
     """Show current alerts status."""
-    db = next(get_db())
-    alerts = run_all_checks(db)
-    db.close()
+    alerts = await run_db(run_all_checks)
     
     if alerts:
         text = "\n\n".join(alerts)
@@ -138,9 +173,7 @@ async def show_alerts(callback: types.CallbackQuery):
 @router.callback_query(F.data == "view_logs")
 async def view_audit_logs(callback: types.CallbackQuery):
     """Show recent audit logs."""
-    db = next(get_db())
-    logs = db.query(AuditLog).order_by(desc(AuditLog.timestamp)).limit(10).all()
-    db.close()
+    logs = await run_db(lambda db: db.query(AuditLog).order_by(desc(AuditLog.timestamp)).limit(10).all())
     
     if logs:
         text = "📜 **Recent Activity Log**\n————————————————\n"
@@ -1,10 +1,11 @@
 from aiogram import Router, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from database import get_db, Contact
-from utils import get_main_menu_keyboard, get_back_home_keyboard
+from database import run_db, Contact
+from utils import get_main_menu_keyboard, get_back_home_keyboard, escape_markdown
+import contact_picker
 
 router = Router()
 
@@ -14,6 +15,7 @@ class ContactStates(StatesGroup):
     phone = State()
     adjust_trust_amount = State()
     adjust_trust_reason = State()
+    search = State()
 
 def get_trust_emoji(score: int) -> str:
     """Return emoji based on trust score tier."""
@@ -46,13 +48,18 @@ async def menu_contacts(callback: types.CallbackQuery):
     )
     await callback.answer()
 
+contact_picker.register("contacts", contact_picker.Picker(
+    role=None,
+    item_prefix="contact_view_",
+    label=lambda c: f"{get_trust_emoji(c.trust_score)} {c.name} ({c.role})",
+    extra_rows=((("🔎 Search", "contacts_search"),), (("⬅️ Back", "menu_contacts"),)),
+))
+
 @router.callback_query(F.data == "contacts_list")
 async def list_contacts(callback: types.CallbackQuery):
-    db = next(get_db())
-    contacts = db.query(Contact).order_by(Contact.name).all()
-    db.close()
+    keyboard, count = await contact_picker.page_keyboard("contacts")
     
-    if not contacts:
+    if not count:
         await callback.message.edit_text(
             "📭 No contacts found.\n\nAdd your first contact to get started.",
             parse_mode="Markdown",
@@ -61,28 +68,69 @@ async def list_contacts(callback: types.CallbackQuery):
         await callback.answer()
         return
 
-    keyboard = []
-    for c in contacts:
-        emoji = get_trust_emoji(c.trust_score)
-        keyboard.append([InlineKeyboardButton(
-            text=f"{emoji} {c.name} ({c.role})",
-            callback_data=f"contact_view_{c.id}"
-        )])
-    keyboard.append([InlineKeyboardButton(text="⬅️ Back", callback_data="menu_contacts")])
-    
     await callback.message.edit_text(
         "📋 **Contact List**\n\nSelect a contact to view details:",
         parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        reply_markup=keyboard
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("cpg:"))
+async def page_contacts(callback: types.CallbackQuery):
+    """Prev/Next for every contact picker; the FSM state of the screen is left alone."""
+    _, name, direction, contact_id = callback.data.split(":")
+    if name not in contact_picker.PICKERS:
+        await callback.answer("This list has expired", show_alert=True)
+        return
+    cursor = int(contact_id)
+    keyboard, _ = await contact_picker.page_keyboard(
+        name, after=cursor if direction == "n" else None, before=cursor if direction == "p" else None)
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data == "contacts_search")
+async def start_contact_search(callback: types.CallbackQuery, state: FSMContext):
+    await callback.message.edit_text(
+        "🔎 **Search Contacts**\n\nType a name (or part of it):",
+        parse_mode="Markdown",
+        reply_markup=get_back_home_keyboard("contacts_list")
     )
+    await state.set_state(ContactStates.search)
     await callback.answer()
 
+async def _answer_search(message: types.Message, text: str):
+    keyboard, count = await contact_picker.search_keyboard("contacts", text)
+    text = escape_markdown(text)
+    if not count:
+        await message.answer(
+            f"🔎 No contacts match “{text}”.",
+            parse_mode="Markdown",
+            reply_markup=get_back_home_keyboard("contacts_list")
+        )
+        return
+    await message.answer(
+        f"🔎 **Contacts matching** “{text}”\n\nSelect a contact to view details:",
+        parse_mode="Markdown",
+        reply_markup=keyboard
+    )
+
+@router.message(ContactStates.search, F.text)
+async def receive_contact_search(message: types.Message, state: FSMContext):
+    await state.set_state(None)
+    await _answer_search(message, message.text.strip())
+
+@router.message(Command("findcontact"))
+async def cmd_find_contact(message: types.Message, command: CommandObject):
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("Usage: `/findcontact <name>`", parse_mode="Markdown")
+        return
+    await _answer_search(message, query)
+
 @router.callback_query(F.data.startswith("contact_view_"))
 async def view_contact(callback: types.CallbackQuery):
     contact_id = int(callback.data.split("_")[2])
-    db = next(get_db())
-    c = db.query(Contact).filter_by(id=contact_id).first()
-    db.close()
+    c = await run_db(lambda db: db.query(Contact).filter_by(id=contact_id).first())
     
     if not c:
         await callback.answer("Contact not found", show_alert=True)
@@ -112,9 +160,7 @@ async def view_contact(callback: types.CallbackQuery):
 @router.callback_query(F.data.startswith("trust_adjust_"))
 async def start_trust_adjust(callback: types.CallbackQuery, state: FSMContext):
     contact_id = int(callback.data.split("_")[2])
-    db = next(get_db())
-    c = db.query(Contact).filter_by(id=contact_id).first()
-    db.close()
+    c = await run_db(lambda db: db.query(Contact).filter_by(id=contact_id).first())
     
     await state.update_data(contact_id=contact_id, contact_name=c.name, current_score=c.trust_score)
     
@@ -151,18 +197,7 @@ async def receive_trust_change(callback: types.CallbackQuery, state: FSMContext)
     await state.set_state(ContactStates.adjust_trust_reason)
     await callback.answer()
 
-@router.message(ContactStates.adjust_trust_reason)
-async def save_trust_adjustment(message: types.Message, state: FSMContext):
-    reason = message.text.strip()
-    if not reason:
-        await message.answer("⚠️ Reason is required. Please enter a reason:")
-        return
-    
-    data = await state.get_data()
-    contact_id = data['contact_id']
-    change = data['trust_change']
-    
-    db = next(get_db())
+def _apply_trust_change(db, contact_id: int, change: int, reason: str) -> int:
     c = db.query(Contact).filter_by(id=contact_id).first()
     
     old_score = c.trust_score
@@ -176,7 +211,20 @@ async def save_trust_adjustment(message: types.Message, state: FSMContext):
     c.notes = (c.notes + "\n" + note) if c.notes else note
     
     db.commit()
-    db.close()
+    return new_score
+
+@router.message(ContactStates.adjust_trust_reason)
+async def save_trust_adjustment(message: types.Message, state: FSMContext):
+    reason = message.text.strip()
+    if not reason:
+        await message.answer("⚠️ Reason is required. Please enter a reason:")
+        return
+    
+    data = await state.get_data()
+    contact_id = data['contact_id']
+    change = data['trust_change']
+    
+    new_score = await run_db(_apply_trust_change, contact_id, change, reason)
     
     await state.clear()
     
@@ -193,9 +241,7 @@ async def save_trust_adjustment(message: types.Message, state: FSMContext):
 
 @router.callback_query(F.data == "contacts_trust_report")
 async def trust_report(callback: types.CallbackQuery):
-    db = next(get_db())
-    contacts = db.query(Contact).all()
-    db.close()
+    contacts = await run_db(lambda db: db.query(Contact).all())
     
     if not contacts:
         await callback.message.edit_text(
@@ -287,16 +333,16 @@ async def process_role(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state(ContactStates.phone)
     await callback.answer()
 
+def _save_contact(db, name: str, role: str, phone: str):
+    db.add(Contact(name=name, role=role, phone=phone))
+    db.commit()
+
 @router.message(ContactStates.phone)
 async def process_phone(message: types.Message, state: FSMContext):
     phone = message.text
     data = await state.get_data()
     
-    db = next(get_db())
-    new_contact = Contact(name=data['name'], role=data['role'], phone=phone)
-    db.add(new_contact)
-    db.commit()
-    db.close()
+    await run_db(_save_contact, data['name'], data['role'], phone)
     
     await state.clear()
     await message.answer(
@@ -2,10 +2,12 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from database import get_db, DailyEntry, SystemSettings, InventoryItem, InventoryLog, AuditLog, DailyFeedUsage
+from database import run_db, SystemSettings, InventoryItem, AuditLog
 from datetime import date, datetime
 from utils import get_back_home_keyboard, get_main_menu_keyboard, format_currency
-from sqlalchemy import desc
+from rollups import sync_daily_entry, get_or_create_daily_entry
+from stock import load_items, apply_movements, record_feed_usage, record_movement
+from money import line_total
 
 router = Router()
 
@@ -119,9 +121,9 @@ async def receive_feed_mode(callback: types.CallbackQuery, state: FSMContext):
 
 async def show_feed_select_menu(message_or_callback, state: FSMContext):
     """Show available feeds to select from."""
-    db = next(get_db())
-    feed_items = db.query(InventoryItem).filter(InventoryItem.type == "FEED", InventoryItem.quantity > 0).all()
-    db.close()
+    feed_items = await run_db(
+        lambda db: db.query(InventoryItem).filter(InventoryItem.type == "FEED", InventoryItem.quantity > 0).all()
+    )
     
     keyboard = []
     if feed_items:
@@ -159,8 +161,7 @@ async def receive_feed_select(callback: types.CallbackQuery, state: FSMContext):
         await start_mortality_step(callback.message, state)
     else:
         item_id = int(choice)
-        db = next(get_db())
-        item = db.query(InventoryItem).filter_by(id=item_id).first()
+        item = await run_db(lambda db: db.query(InventoryItem).filter_by(id=item_id).first())
         
         if item:
             await state.update_data(
@@ -169,7 +170,6 @@ async def receive_feed_select(callback: types.CallbackQuery, state: FSMContext):
                 current_feed_unit=item.unit,
                 current_feed_stock=item.quantity
             )
-        db.close()
         
         await callback.message.edit_text(
             text=f"🍽️ **{item.name}**\n\nStock: {item.quantity:.1f} {item.unit}\n\nHow much did you use (in kg)?",
@@ -388,16 +388,17 @@ async def show_summary(message: types.Message, state: FSMContext):
 @router.callback_query(DailyWizardStates.confirm, F.data == "wizard_save")
 async def save_wizard(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    db = next(get_db())
+    await run_db(_save_wizard_entry, data, callback.from_user.id)
+    
+    await state.clear()
+    await callback.message.edit_text("✅ **Records Updated!**", reply_markup=get_main_menu_keyboard())
+    await callback.answer()
+
+def _save_wizard_entry(db, data: dict, user_id: int):
     today = date.today()
     
-    entry = db.query(DailyEntry).filter(DailyEntry.date == today).first()
-    if not entry:
-        entry = DailyEntry(date=today)
-        last = db.query(DailyEntry).filter(DailyEntry.date < today).order_by(desc(DailyEntry.date)).first()
-        entry.flock_total = last.flock_total if last else 0
-        db.add(entry)
-        
+    entry = get_or_create_daily_entry(db, today)
+
     # Initialization Fixes (Handle None)
     if entry.eggs_collected is None: entry.eggs_collected = 0
     if entry.eggs_broken is None: entry.eggs_broken = 0
@@ -431,8 +432,7 @@ async def save_wizard(callback: types.CallbackQuery, state: FSMContext):
             db.flush()
         
         if good > 0:
-            egg_item.quantity += good
-            db.add(InventoryLog(item_name="Eggs", quantity_change=good))
+            record_movement(db, egg_item, good)
     
     # Mortality
     m_count = data.get('mortality_count', 0)
@@ -452,42 +452,39 @@ async def save_wizard(callback: types.CallbackQuery, state: FSMContext):
     daily_feeds = data.get('daily_feeds', [])
     if not data.get('feed_skipped') and daily_feeds:
         total_kg = 0.0
-        total_cost = 0.0
+        total_cost = 0
         
         # Ensure entry is flushed to get ID for foreign key
         db.flush()
         
+        # All referenced feeds in one query
+        items = load_items(db, [f.get('id') for f in daily_feeds])
+        movements = []
+        usages = []
+        
         for feed_data in daily_feeds:
             feed_id = feed_data.get('id')
             qty_kg = feed_data.get('quantity_kg', 0)
-            feed_name = feed_data.get('name', 'Unknown Feed')
-            
-            # Get the inventory item
-            item = None
-            if feed_id:
-                item = db.query(InventoryItem).filter_by(id=feed_id).first()
+            item = items.get(feed_id)
             
             # Calculate cost
-            cost = 0.0
+            cost = 0
             if item and item.cost_per_unit:
-                cost = qty_kg * item.cost_per_unit
+                cost = line_total(qty_kg, item.cost_per_unit)
             
             total_kg += qty_kg
             total_cost += cost
             
             # Deduct from inventory
             if item:
-                item.quantity -= qty_kg
-                db.add(InventoryLog(item_name=item.name, quantity_change=-qty_kg))
+                movements.append((item, -qty_kg))
             
             # Create DailyFeedUsage record
             if feed_id:
-                usage = DailyFeedUsage(
-                    daily_entry_id=entry.id,
-                    feed_item_id=feed_id,
-                    quantity_kg=qty_kg
-                )
-                db.add(usage)
+                usages.append((feed_id, qty_kg))
+        
+        apply_movements(db, movements)
+        record_feed_usage(db, entry.id, usages)
         
         entry.feed_used_kg += total_kg
         entry.feed_cost += total_cost
@@ -500,18 +497,14 @@ async def save_wizard(callback: types.CallbackQuery, state: FSMContext):
         if item_id:
             item = db.query(InventoryItem).filter_by(id=item_id).first()
             if item:
-                cost = amount * (item.cost_per_unit or 0)
+                cost = line_total(amount, item.cost_per_unit)
                 entry.feed_used_kg += amount
                 entry.feed_cost += cost
-                item.quantity -= amount
-                db.add(InventoryLog(item_name=item.name, quantity_change=-amount))
+                record_movement(db, item, -amount)
     
+    sync_daily_entry(db, entry)
+
     # Audit
-    db.add(AuditLog(user_id=callback.from_user.id, action="daily_wizard", details="Completed Daily Update"))
+    db.add(AuditLog(user_id=user_id, action="daily_wizard", details="Completed Daily Update"))
     
     db.commit()
-    db.close()
-    
-    await state.clear()
-    await callback.message.edit_text("✅ **Records Updated!**", reply_markup=get_main_menu_keyboard())
-    await callback.answer()
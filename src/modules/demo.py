@@ -37,8 +37,8 @@ async def cmd_demo(message: types.Message, command: CommandObject):
             await message.answer("⚠️ Demo mode is already active.", reply_markup=get_main_menu_keyboard())
             return
             
+        database.init_demo_db()  # Before the switch, so no handler sees demo mode without a database
         database.IS_DEMO_MODE = True
-        database.init_demo_db()
         
         await message.answer(
             "🔴 **DEMO MODE ACTIVATED** 🔴\n\n"
@@ -2,10 +2,16 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from database import get_db, FinancialLedger, Contact, InventoryLog, SystemSettings, InventoryItem, DailyEntry, VaccinationRecord, Flock
+from database import run_db, FinancialLedger, Contact, InventoryLog, InventoryItem, DailyEntry, VaccinationRecord, Flock
 from datetime import date, timedelta
 from sqlalchemy import desc
-from utils import get_back_home_keyboard, get_main_menu_keyboard, format_currency
+from utils import get_back_home_keyboard, get_main_menu_keyboard, format_currency, escape_markdown
+from rollups import record_ledger_entry, sync_daily_entry, get_or_create_daily_entry
+from settings_cache import get_float
+from stock import load_items, apply_movements, record_movement
+from vaccinations import generate_schedule
+from money import to_money
+import contact_picker
 import json
 
 router = Router()
@@ -102,29 +108,52 @@ async def start_expense(callback: types.CallbackQuery, state: FSMContext):
     )
     await callback.answer()
 
+contact_picker.register("customers", contact_picker.Picker(
+    role="CUSTOMER",
+    item_prefix="cust_",
+    label=lambda c: f"👤 {c.name}",
+    extra_rows=(
+        (("🚶 Walk-in / Generic", "cust_generic"),),
+        (("➕ Add New Customer", "cust_new"),),
+        (("⬅️ Back", "menu_finance"),),
+    ),
+))
+
+contact_picker.register("suppliers", contact_picker.Picker(
+    role="SUPPLIER",
+    item_prefix="supp_",
+    label=lambda s: f"🏢 {s.name}",
+    extra_rows=(
+        (("🚶 Generic / Unknown", "supp_generic"),),
+        (("➕ Add New Supplier", "menu_add_contact_redirect"),),
+        (("⬅️ Back", "menu_finance"),),
+    ),
+))
+
 @router.callback_query(F.data == "fin_income_start")
 async def start_income(callback: types.CallbackQuery, state: FSMContext):
     # Select Customer
-    db = next(get_db())
-    customers = db.query(Contact).filter_by(role="CUSTOMER").all()
-    db.close()
-    
-    keyboard = []
-    for c in customers:
-        keyboard.append([InlineKeyboardButton(text=f"👤 {c.name}", callback_data=f"cust_{c.id}")])
-    
-    keyboard.append([InlineKeyboardButton(text="🚶 Walk-in / Generic", callback_data="cust_generic")])
-    keyboard.append([InlineKeyboardButton(text="➕ Add New Customer", callback_data="cust_new")])
-    keyboard.append([InlineKeyboardButton(text="⬅️ Back", callback_data="menu_finance")])
+    keyboard, _ = await contact_picker.page_keyboard("customers")
     
     await callback.message.edit_text(
-        text="📈 **Record Income**\n\nSelect Customer:",
+        text="📈 **Record Income**\n\nSelect Customer (or type a name to search):",
         parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        reply_markup=keyboard
     )
     await state.set_state(ExpenseStates.sale_customer)
     await callback.answer()
 
+@router.message(ExpenseStates.sale_customer, F.text)
+async def search_customer(message: types.Message, state: FSMContext):
+    keyboard, count = await contact_picker.search_keyboard("customers", message.text)
+    query = escape_markdown(message.text.strip())
+    await message.answer(
+        text=f"🔎 **Customers matching** “{query}”" if count else
+             f"🔎 No customers match “{query}”.\n\nPick another option or type again:",
+        parse_mode="Markdown",
+        reply_markup=keyboard
+    )
+
 @router.callback_query(F.data.startswith("cat_"))
 async def expense_category(callback: types.CallbackQuery, state: FSMContext):
     category_key = callback.data
@@ -132,26 +161,27 @@ async def expense_category(callback: types.CallbackQuery, state: FSMContext):
     await state.update_data(cat_key=category_key, cat_name=category_name)
     
     # Step 2: Select Supplier
-    db = next(get_db())
-    suppliers = db.query(Contact).filter_by(role="SUPPLIER").all()
-    db.close()
-    
-    keyboard = []
-    for s in suppliers:
-        keyboard.append([InlineKeyboardButton(text=f"🏢 {s.name}", callback_data=f"supp_{s.id}")])
-    
-    keyboard.append([InlineKeyboardButton(text="🚶 Generic / Unknown", callback_data="supp_generic")])
-    keyboard.append([InlineKeyboardButton(text="➕ Add New Supplier", callback_data="menu_add_contact_redirect")])
-    keyboard.append([InlineKeyboardButton(text="⬅️ Back", callback_data="menu_finance")])
+    keyboard, _ = await contact_picker.page_keyboard("suppliers")
     
     await callback.message.edit_text(
-        text=f"🏢 **Select Supplier**\n\nWho are you paying for {category_name}?",
+        text=f"🏢 **Select Supplier**\n\nWho are you paying for {category_name}? (or type a name to search)",
         parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        reply_markup=keyboard
     )
     await state.set_state(ExpenseStates.supplier_id)
     await callback.answer()
 
+@router.message(ExpenseStates.supplier_id, F.text)
+async def search_supplier(message: types.Message, state: FSMContext):
+    keyboard, count = await contact_picker.search_keyboard("suppliers", message.text)
+    query = escape_markdown(message.text.strip())
+    await message.answer(
+        text=f"🔎 **Suppliers matching** “{query}”" if count else
+             f"🔎 No suppliers match “{query}”.\n\nPick another option or type again:",
+        parse_mode="Markdown",
+        reply_markup=keyboard
+    )
+
 @router.callback_query(ExpenseStates.supplier_id, F.data.startswith("supp_"))
 async def select_supplier(callback: types.CallbackQuery, state: FSMContext):
     supp_id = callback.data.split("_")[1]
@@ -159,10 +189,8 @@ async def select_supplier(callback: types.CallbackQuery, state: FSMContext):
         supp_id = None
         supp_name = "Generic Supplier"
     else:
-        db = next(get_db())
-        supp = db.query(Contact).filter_by(id=supp_id).first()
+        supp = await run_db(lambda db: db.query(Contact).filter_by(id=supp_id).first())
         supp_name = supp.name if supp else "Unknown"
-        db.close()
         
     await state.update_data(supplier_id=supp_id, supplier_name=supp_name)
     
@@ -236,6 +264,31 @@ async def select_supplier(callback: types.CallbackQuery, state: FSMContext):
     
     await callback.answer()
 
+def _load_link_items(db, cat_key: str):
+    if cat_key == 'cat_meds':
+        items = db.query(InventoryItem).filter_by(type="MEDICATION").all()
+    elif cat_key == 'cat_birds':
+        items = db.query(InventoryItem).filter_by(type="LIVESTOCK").all()
+    else:
+        items = db.query(InventoryItem).all()
+    
+    # Auto-Select Logic for Birds
+    target_item = None
+    if cat_key == 'cat_birds':
+        # Group by Name
+        unique_names = list(set([i.name for i in items]))
+        if len(unique_names) <= 1:
+            # If 0, create default "Chickens"
+            if len(unique_names) == 0:
+                chickens = InventoryItem(name="Chickens", type="LIVESTOCK", unit="birds", quantity=0)
+                db.add(chickens)
+                db.commit() # Get ID
+                target_item = {'id': chickens.id, 'name': chickens.name, 'unit': chickens.unit}
+            else:
+                item = items[0] # Pick the first one (others are duplicates by name if any)
+                target_item = {'id': item.id, 'name': item.name, 'unit': item.unit}
+    return items, target_item
+
 @router.callback_query(ExpenseStates.link_inventory, F.data.startswith("inv_"))
 async def receive_inv_link(callback: types.CallbackQuery, state: FSMContext):
     choice = callback.data.split("_")[1]
@@ -244,42 +297,19 @@ async def receive_inv_link(callback: types.CallbackQuery, state: FSMContext):
     cat_key = data.get('cat_key')
     
     if choice == "yes":
-        db = next(get_db())
-        if cat_key == 'cat_meds':
-            items = db.query(InventoryItem).filter_by(type="MEDICATION").all()
-        elif cat_key == 'cat_birds':
-            items = db.query(InventoryItem).filter_by(type="LIVESTOCK").all()
-        else:
-            items = db.query(InventoryItem).all()
-        db.close()
+        items, target_item = await run_db(_load_link_items, cat_key)
         
         # Auto-Select Logic for Birds
         if cat_key == 'cat_birds':
-            # Group by Name
-            unique_names = list(set([i.name for i in items]))
-            should_auto = False
-            target_item = None
-            
-            if len(unique_names) <= 1:
-                # If 0, create default "Chickens"
-                if len(unique_names) == 0:
-                    target_item = InventoryItem(name="Chickens", type="LIVESTOCK", unit="birds", quantity=0)
-                    db.add(target_item)
-                    db.flush() # Get ID
-                else:
-                    target_item = items[0] # Pick the first one (others are duplicates by name if any)
-                should_auto = True
-            
-            if should_auto:
+            if target_item:
                 await state.update_data(
-                    inv_item_id=target_item.id,
-                    item_details=target_item.name,
-                    inv_item_unit=target_item.unit,
+                    inv_item_id=target_item['id'],
+                    item_details=target_item['name'],
+                    inv_item_unit=target_item['unit'],
                     inv_item_type="LIVESTOCK"
                 )
-                db.close()
                 await callback.message.edit_text(
-                    text=f"🔢 **Quantity**\n\nHow many **{target_item.unit}** are you buying?",
+                    text=f"🔢 **Quantity**\n\nHow many **{target_item['unit']}** are you buying?",
                     parse_mode="Markdown",
                     reply_markup=get_back_home_keyboard("fin_expense_start")
                 )
@@ -341,9 +371,7 @@ async def receive_feed_mode(callback: types.CallbackQuery, state: FSMContext):
 
 async def show_feed_selection(message: types.Message, state: FSMContext):
     """Show list of existing feeds or option to add new."""
-    db = next(get_db())
-    feeds = db.query(InventoryItem).filter_by(type="FEED").all()
-    db.close()
+    feeds = await run_db(lambda db: db.query(InventoryItem).filter_by(type="FEED").all())
     
     # Group by Name
     grouped = {}
@@ -391,8 +419,7 @@ async def receive_feed_selection(callback: types.CallbackQuery, state: FSMContex
         await state.set_state(ExpenseStates.new_inv_name)
     else:
         # Existing feed selected
-        db = next(get_db())
-        feed = db.query(InventoryItem).filter_by(id=int(selection)).first()
+        feed = await run_db(lambda db: db.query(InventoryItem).filter_by(id=int(selection)).first())
         
         if feed:
             await state.update_data(
@@ -402,7 +429,6 @@ async def receive_feed_selection(callback: types.CallbackQuery, state: FSMContex
                 current_bag_weight=feed.bag_weight or 70.0,
                 is_new_feed=False
             )
-        db.close()
         
         # Ask for number of bags
         await callback.message.edit_text(
@@ -638,14 +664,35 @@ async def receive_feed_payment(callback: types.CallbackQuery, state: FSMContext)
 async def finalize_feed_purchase(message: types.Message, state: FSMContext):
     """Save feed purchase to database with inventory updates."""
     data = await state.get_data()
-    db = next(get_db())
+    inv_updates = await run_db(_save_feed_purchase, data)
     
+    total = data.get('total_expense', 0.0)
+    method = data.get('payment_method', 'CASH')
+    ref = data.get('transaction_ref')
+    supp_name = data.get('supplier_name', 'Unknown')
+    
+    await state.clear()
+    
+    # Success message
+    inv_msg = "\n".join([f"📦 {u}" for u in inv_updates])
+    ref_text = f" (Ref: {ref})" if ref else ""
+    
+    await message.answer(
+        text=f"✅ **Feed Purchase Recorded!**\n\n"
+             f"🏢 From: {supp_name}\n"
+             f"💰 Total: {format_currency(total)} via {method}{ref_text}\n\n"
+             f"**Inventory Updated:**\n{inv_msg}",
+        parse_mode="Markdown",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+
+def _save_feed_purchase(db, data: dict) -> list[str]:
     feed_items = data.get('feed_items', [])
     total = data.get('total_expense', 0.0)
     method = data.get('payment_method', 'CASH')
     ref = data.get('transaction_ref')
     supp_id = data.get('supplier_id')
-    supp_name = data.get('supplier_name', 'Unknown')
     
     # Build description
     desc_parts = []
@@ -665,58 +712,41 @@ async def finalize_feed_purchase(message: types.Message, state: FSMContext):
     )
     db.add(ledger)
     db.flush()
+    record_ledger_entry(db, ledger)
     
-    # 2. Update Inventory for each feed item
+    # 2. Update Inventory for each feed item (existing ones loaded in one query)
+    existing = load_items(db, [item['id'] for item in feed_items if not item.get('is_new')])
+    movements = []
     inv_updates = []
     for item in feed_items:
         if item.get('is_new'):
-            # Create new inventory item
+            # Create new inventory item; stock arrives via the movement below
             inv_item = InventoryItem(
                 name=item['name'],
                 type="FEED",
-                quantity=item['total_kg'],
+                quantity=0,
                 unit="kg",
                 bag_weight=item['bag_weight'],
                 cost_per_unit=item['cost_per_kg']
             )
             db.add(inv_item)
-            db.flush()
             inv_updates.append(f"+{item['total_kg']}kg {item['name']} (NEW)")
         else:
             # Update existing
-            inv_item = db.query(InventoryItem).filter_by(id=item['id']).first()
+            inv_item = existing.get(item['id'])
             if inv_item:
-                inv_item.quantity += item['total_kg']
                 inv_item.cost_per_unit = item['cost_per_kg']  # Update to latest cost
                 if item['bag_weight']:
                     inv_item.bag_weight = item['bag_weight']
                 inv_updates.append(f"+{item['total_kg']}kg {item['name']}")
         
-        # Create inventory log
-        log = InventoryLog(
-            item_name=item['name'],
-            quantity_change=item['total_kg'],
-            ledger_id=ledger.id
-        )
-        db.add(log)
+        if inv_item:
+            movements.append((inv_item, item['total_kg']))
     
+    db.flush()  # Ids for the new items, which their log rows reference
+    apply_movements(db, movements, ledger_id=ledger.id)
     db.commit()
-    db.close()
-    
-    await state.clear()
-    
-    # Success message
-    inv_msg = "\n".join([f"📦 {u}" for u in inv_updates])
-    ref_text = f" (Ref: {ref})" if ref else ""
-    
-    await message.answer(
-        text=f"✅ **Feed Purchase Recorded!**\n\n"
-             f"🏢 From: {supp_name}\n"
-             f"💰 Total: {format_currency(total)} via {method}{ref_text}\n\n"
-             f"**Inventory Updated:**\n{inv_msg}",
-        parse_mode="Markdown",
-        reply_markup=get_main_menu_keyboard()
-    )
+    return inv_updates
 
 
 
@@ -730,13 +760,10 @@ async def receive_inv_item(callback: types.CallbackQuery, state: FSMContext):
     else:
         await state.update_data(inv_item_id=int(item_id))
         # Get item name for details
-        db = next(get_db())
-        from database import InventoryItem
-        item = db.query(InventoryItem).filter_by(id=int(item_id)).first()
+        item = await run_db(lambda db: db.query(InventoryItem).filter_by(id=int(item_id)).first())
         name = item.name if item else "Unknown"
         unit = item.unit if item else "units"
         inv_type = item.type if item else "SUPPLY"
-        db.close()
         
         await state.update_data(item_details=name, inv_item_unit=unit, inv_item_type=inv_type) 
         
@@ -878,13 +905,46 @@ async def receive_ref(message: types.Message, state: FSMContext):
 
 async def finalize_expense(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    db = next(get_db())
-    from database import InventoryItem, Flock
+    inv_msg, created_item_quantity = await run_db(_save_expense, data)
+    
+    cat_key = data.get('cat_key')
+    supp_name = data.get('supplier_name')
+    item_desc = data.get('item_details')
+    amount = data.get('amount')
+    method = data.get('payment_method')
+    ref = data.get('transaction_ref', None) # None if Cash
     
+    ref_text = f"(Ref: {ref})" if ref else ""
+    await message.answer(
+        text=f"✅ **Expense Recorded!**\n\n"
+             f"🛒 Bought: {item_desc}\n"
+             f"🏢 From: {supp_name}\n"
+             f"💰 {format_currency(amount)} via {method} {ref_text}"
+             f"{inv_msg}",
+        parse_mode="Markdown",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+    # Check if Bird Purchase -> Trigger New Flock Flow
+    if cat_key == 'cat_birds' and created_item_quantity > 0:
+        keyboard = [
+            [InlineKeyboardButton(text="🐣 Yes, Create NEW Flock", callback_data="nwflock_yes")],
+            [InlineKeyboardButton(text="➕ Yes, Add to EXISTING Flock", callback_data="nwflock_existing")],
+            [InlineKeyboardButton(text="❌ No (Just Inventory)", callback_data="nwflock_no")]
+        ]
+        await message.answer(
+            text="🐣 **Manage Flock**\n\nYou bought birds. Do you want to track them?",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        )
+        await state.update_data(flock_size_total=created_item_quantity)
+        await state.set_state(ExpenseStates.new_flock_confirm)
+    else:
+        await state.clear()
+
+def _save_expense(db, data: dict):
     cat_name = data.get('cat_name')
     cat_key = data.get('cat_key')
     supp_id = data.get('supplier_id')
-    supp_name = data.get('supplier_name')
     item_desc = data.get('item_details')
     amount = data.get('amount')
     method = data.get('payment_method')
@@ -904,6 +964,7 @@ async def finalize_expense(message: types.Message, state: FSMContext):
     )
     db.add(ledger)
     db.flush()
+    record_ledger_entry(db, ledger)
     
     # 2. Inventory Link
     inv_msg = ""
@@ -950,8 +1011,7 @@ async def finalize_expense(message: types.Message, state: FSMContext):
             # Feed Conversion: If bought in Bags but stored in KG
             if data.get('feed_input_uom') == 'bags' and item.unit == 'kg':
                  # Get Dynamic Weight
-                 setting = db.query(SystemSettings).filter_by(key="feed_bag_weight").first()
-                 bag_weight = float(setting.value) if setting else 70.0
+                 bag_weight = get_float(db, "feed_bag_weight", 70.0)
                  
                  final_qty = qty * bag_weight 
                  # Recalculate cost per unit (per KG)
@@ -959,48 +1019,13 @@ async def finalize_expense(message: types.Message, state: FSMContext):
                  unit_cost = amount / final_qty
                  item.cost_per_unit = unit_cost
                  
-            item.quantity += final_qty
-            
-            # Log
-            log = InventoryLog(
-                item_name=item.name,
-                quantity_change=final_qty,
-                ledger_id=ledger.id
-            )
-            db.add(log)
+            record_movement(db, item, final_qty, ledger_id=ledger.id)
             inv_msg = f"\n📦 Stock Updated: +{final_qty} {item.unit}"
             if data.get('feed_input_uom') == 'bags':
                 inv_msg += f" ({qty} bags)"
 
     db.commit()
-    db.close()
-    
-    ref_text = f"(Ref: {ref})" if ref else ""
-    await message.answer(
-        text=f"✅ **Expense Recorded!**\n\n"
-             f"🛒 Bought: {item_desc}\n"
-             f"🏢 From: {supp_name}\n"
-             f"💰 {format_currency(amount)} via {method} {ref_text}"
-             f"{inv_msg}",
-        parse_mode="Markdown",
-        reply_markup=get_main_menu_keyboard()
-    )
-
-    # Check if Bird Purchase -> Trigger New Flock Flow
-    if cat_key == 'cat_birds' and created_item_quantity > 0:
-        keyboard = [
-            [InlineKeyboardButton(text="🐣 Yes, Create NEW Flock", callback_data="nwflock_yes")],
-            [InlineKeyboardButton(text="➕ Yes, Add to EXISTING Flock", callback_data="nwflock_existing")],
-            [InlineKeyboardButton(text="❌ No (Just Inventory)", callback_data="nwflock_no")]
-        ]
-        await message.answer(
-            text="🐣 **Manage Flock**\n\nYou bought birds. Do you want to track them?",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-        )
-        await state.update_data(flock_size_total=created_item_quantity)
-        await state.set_state(ExpenseStates.new_flock_confirm)
-    else:
-        await state.clear()
+    return inv_msg, created_item_quantity
 
 
 
@@ -1020,11 +1045,8 @@ async def receive_customer_select(callback: types.CallbackQuery, state: FSMConte
         cust_id = None
         cust_name = "Walk-in / Generic"
     else:
-        db = next(get_db())
-        from database import Contact
-        c = db.query(Contact).filter_by(id=int(cust_id)).first()
+        c = await run_db(lambda db: db.query(Contact).filter_by(id=int(cust_id)).first())
         cust_name = c.name if c else "Unknown"
-        db.close()
         
     await state.update_data(customer_id=cust_id, customer_name=cust_name)
     
@@ -1041,18 +1063,18 @@ async def receive_customer_select(callback: types.CallbackQuery, state: FSMConte
     await state.set_state(ExpenseStates.sale_mode)
     await callback.answer()
 
+def _create_customer(db, name: str) -> int:
+    contact = Contact(name=name, role="CUSTOMER")
+    db.add(contact)
+    db.commit()
+    return contact.id
+
 @router.message(ExpenseStates.new_cust_name)
 async def receive_new_customer_name(message: types.Message, state: FSMContext):
     name = message.text.strip()
     if not name: return
     
-    db = next(get_db())
-    from database import Contact
-    contact = Contact(name=name, role="CUSTOMER")
-    db.add(contact)
-    db.commit()
-    cid = contact.id
-    db.close()
+    cid = await run_db(_create_customer, name)
     
     await state.update_data(customer_id=cid, customer_name=name)
 
@@ -1083,9 +1105,7 @@ async def receive_sale_eggs(callback: types.CallbackQuery, state: FSMContext):
 @router.callback_query(ExpenseStates.sale_mode, F.data == "sale_birds")
 async def receive_sale_birds(callback: types.CallbackQuery, state: FSMContext):
     """Handle bird sale - show active flocks to select from."""
-    db = next(get_db())
-    flocks = db.query(Flock).filter_by(status="ACTIVE").filter(Flock.current_count > 0).all()
-    db.close()
+    flocks = await run_db(lambda db: db.query(Flock).filter_by(status="ACTIVE").filter(Flock.current_count > 0).all())
     
     if not flocks:
         await callback.message.edit_text(
@@ -1114,16 +1134,13 @@ async def receive_sale_birds(callback: types.CallbackQuery, state: FSMContext):
 async def receive_flock_for_sale(callback: types.CallbackQuery, state: FSMContext):
     """Receive flock selection for bird sale."""
     flock_id = int(callback.data.split("_")[1])
-    db = next(get_db())
-    flock = db.query(Flock).filter_by(id=flock_id).first()
+    flock = await run_db(lambda db: db.query(Flock).filter_by(id=flock_id).first())
     
     if not flock:
         await callback.answer("Flock not found", show_alert=True)
-        db.close()
         return
     
     await state.update_data(sale_mode="mode_bird", sale_flock_id=flock_id, sale_flock_name=flock.name, sale_flock_count=flock.current_count)
-    db.close()
     
     await callback.message.edit_text(
         f"🔢 **Quantity**\n\nFlock: **{flock.name}** ({flock.current_count} available)\n\nHow many birds to sell?",
@@ -1158,12 +1175,11 @@ async def receive_sale_qty(message: types.Message, state: FSMContext):
     
     # Check Stock
     # Check Stock
-    db = next(get_db())
     today = date.today()
     
     if mode in ['mode_egg', 'mode_crate']:
         # Check Eggs
-        egg_item = db.query(InventoryItem).filter_by(name="Eggs").first()
+        egg_item = await run_db(lambda db: db.query(InventoryItem).filter_by(name="Eggs").first())
         current_stock = egg_item.quantity if egg_item else 0
         
         if current_stock < qty:
@@ -1171,12 +1187,11 @@ async def receive_sale_qty(message: types.Message, state: FSMContext):
                  f"⛔ **Not enough eggs!**\n\nStock: {current_stock} eggs\nTrying to sell: {qty} eggs\n\nTry a lower amount:",
                  reply_markup=get_back_home_keyboard('menu_finance')
              )
-             db.close()
              return
 
     elif mode == 'mode_crate':
         eggs_needed = qty * 30
-        entry = db.query(DailyEntry).filter_by(date=today).first()
+        entry = await run_db(lambda db: db.query(DailyEntry).filter_by(date=today).first())
         current_stock = entry.eggs_good if entry else 0
         
         if current_stock < eggs_needed:
@@ -1184,7 +1199,6 @@ async def receive_sale_qty(message: types.Message, state: FSMContext):
                  f"⛔ **Not enough eggs for crates!**\n\nStock: {current_stock} eggs\nNeeded: {eggs_needed} eggs\n\nTry fewer crates:",
                  reply_markup=get_back_home_keyboard('menu_finance')
              )
-             db.close()
              return
 
     elif mode == 'mode_bird':
@@ -1195,10 +1209,8 @@ async def receive_sale_qty(message: types.Message, state: FSMContext):
                 f"⛔ **Not enough birds!**\n\nFlock: {data.get('sale_flock_name')}\nAvailable: {flock_count}\nTrying to sell: {qty}\n\nTry a lower amount:",
                 reply_markup=get_back_home_keyboard('menu_finance')
             )
-            db.close()
             return
             
-    db.close()
     await state.update_data(sale_qty=qty)
     
     # Calculate or Ask Price
@@ -1208,16 +1220,11 @@ async def receive_sale_qty(message: types.Message, state: FSMContext):
         await message.answer("💸 **Total Price** for these birds:")
         await state.set_state(ExpenseStates.sale_price)
     else:
-        db = next(get_db())
-        # defaults
-        p_egg = 15.0
-        p_crate = 450.0
-        
-        s_egg = db.query(SystemSettings).filter_by(key="price_per_egg").first()
-        s_crate = db.query(SystemSettings).filter_by(key="price_per_crate").first()
-        if s_egg: p_egg = float(s_egg.value)
-        if s_crate: p_crate = float(s_crate.value)
-        db.close()
+        # Cached settings, falling back to defaults
+        p_egg, p_crate = await run_db(lambda db: (
+            get_float(db, "price_per_egg", 15.0),
+            get_float(db, "price_per_crate", 450.0)
+        ))
         
         if mode == 'mode_egg': price = qty * p_egg
         else: price = qty * p_crate
@@ -1248,8 +1255,19 @@ async def ask_payment_input(message, state, amount):
 
 async def finalize_sale(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    db = next(get_db())
+    item_name = await run_db(_save_sale, data)
+    
+    qty = data.get('sale_qty')
+    total = data.get('amount')
+    cust_name = data.get('customer_name')
     
+    await state.clear()
+    await message.answer(
+        text=f"✅ **Sale Recorded!**\n\n👤 {cust_name}\n📦 {qty} {item_name}\n💰 {format_currency(total)}",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+def _save_sale(db, data: dict) -> str:
     mode = data.get('sale_mode')
     qty = data.get('sale_qty')
     total = data.get('amount')
@@ -1261,6 +1279,9 @@ async def finalize_sale(message: types.Message, state: FSMContext):
     if mode == 'mode_crate': item_name = "Egg Crates"
     elif mode == 'mode_bird': item_name = "Birds/Meat"
     
+    # Today's entry first, so a lost race on its date has nothing to roll back
+    entry = get_or_create_daily_entry(db, date.today())
+    
     # 1. Financial Ledger - IN
     ledger = FinancialLedger(
         amount=total,
@@ -1273,17 +1294,12 @@ async def finalize_sale(message: types.Message, state: FSMContext):
     )
     db.add(ledger)
     db.flush()
+    record_ledger_entry(db, ledger)
     
     # 2. Daily Entry
-    today = date.today()
-    entry = db.query(DailyEntry).filter(DailyEntry.date == today).first()
-    if not entry:
-        entry = DailyEntry(date=today)
-        db.add(entry)
-    
-    entry.income += total
-    if mode == 'mode_egg': entry.eggs_sold += qty
-    elif mode == 'mode_crate': entry.crates_sold += qty
+    entry.income = (entry.income or 0) + to_money(total)
+    if mode == 'mode_egg': entry.eggs_sold = (entry.eggs_sold or 0) + qty
+    elif mode == 'mode_crate': entry.crates_sold = (entry.crates_sold or 0) + qty
     elif mode == 'mode_bird':
         if entry.flock_removed is None: entry.flock_removed = 0
         entry.flock_removed += qty
@@ -1297,19 +1313,16 @@ async def finalize_sale(message: types.Message, state: FSMContext):
     # 3. Inventory Deduction
     # Sales decrement inventory as INCOME -> Item leaves farm
     inv_msg = ""
-    # Simple logic
-    inv_log = InventoryLog(item_name=item_name, quantity_change=-qty, ledger_id=ledger.id)
-    db.add(inv_log)
+    # Tracked items (e.g. Eggs) lose stock; others are logged by name only
+    sold_item = db.query(InventoryItem).filter_by(name=item_name).first()
+    if sold_item:
+        record_movement(db, sold_item, -qty, ledger_id=ledger.id)
+    else:
+        db.add(InventoryLog(item_name=item_name, quantity_change=-qty, ledger_id=ledger.id))
     
+    sync_daily_entry(db, entry)
     db.commit()
-    cust_name = data.get('customer_name')
-    db.close()
-    
-    await state.clear()
-    await message.answer(
-        text=f"✅ **Sale Recorded!**\n\n👤 {cust_name}\n📦 {qty} {item_name}\n💰 {format_currency(total)}",
-        reply_markup=get_main_menu_keyboard()
-    )
+    return item_name
 
 # --- NEW FLOCK HANDLERS ---
 @router.callback_query(ExpenseStates.new_flock_confirm, F.data.startswith("nwflock_"))
@@ -1323,10 +1336,7 @@ async def new_flock_decision(callback: types.CallbackQuery, state: FSMContext):
 
     if decision == "existing":
         # logic for existing flock
-        db = next(get_db())
-        from database import Flock
-        flocks = db.query(Flock).filter(Flock.status == 'ACTIVE').all()
-        db.close()
+        flocks = await run_db(lambda db: db.query(Flock).filter(Flock.status == 'ACTIVE').all())
         
         if not flocks:
             await callback.answer("⚠️ No active flocks found! Please create a new one.", show_alert=True)
@@ -1361,10 +1371,7 @@ async def receive_flock_name(message: types.Message, state: FSMContext):
     name = message.text.strip()
     
     # Check Uniqueness
-    db = next(get_db())
-    from database import Flock
-    exists = db.query(Flock).filter(Flock.name.ilike(name)).first()
-    db.close()
+    exists = await run_db(lambda db: db.query(Flock).filter(Flock.name.ilike(name)).first())
     
     if exists:
         await message.answer(f"⚠️ **Name Taken**\n\nA flock named '{name}' already exists.\n\nPlease enter a different name (e.g., '{name} B'):")
@@ -1406,6 +1413,21 @@ async def receive_hens_count(message: types.Message, state: FSMContext):
     )
     await state.set_state(ExpenseStates.new_flock_age)
 
+def _create_purchased_flock(db, data: dict, hatch_date: date):
+    flock = Flock(
+        name=data['new_flock_name'],
+        breed=data.get('item_details', 'Unknown'), # From inventory name
+        hatch_date=hatch_date,
+        initial_count=data['flock_size_total'],
+        current_count=data['flock_size_total'],
+        hens_count=data['flock_hens'],
+        roosters_count=data['flock_roosters'],
+        status="ACTIVE"
+    )
+    db.add(flock)
+    generate_schedule(db, flock)
+    db.commit()
+
 @router.message(ExpenseStates.new_flock_age)
 async def receive_flock_age(message: types.Message, state: FSMContext):
     try:
@@ -1422,31 +1444,15 @@ async def receive_flock_age(message: types.Message, state: FSMContext):
     
     # Save Flock
     data = await state.get_data()
-    db = next(get_db())
-    from database import Flock
-    
-    flock = Flock(
-        name=data['new_flock_name'],
-        breed=data.get('item_details', 'Unknown'), # From inventory name
-        hatch_date=hatch_date,
-        initial_count=data['flock_size_total'],
-        current_count=data['flock_size_total'],
-        hens_count=data['flock_hens'],
-        roosters_count=data['flock_roosters'],
-        status="ACTIVE"
-    )
-    db.add(flock)
-    db.commit()
+    await run_db(_create_purchased_flock, data, hatch_date)
     
     msg_text = (
         f"✅ **Flock Created!**\n\n"
-        f"🐔 Name: {flock.name}\n"
+        f"🐔 Name: {data['new_flock_name']}\n"
         f"🎂 Hatch Date: {hatch_date} ({weeks} wks old)\n"
         f"🚻 {data['flock_hens']} Hens, {data['flock_roosters']} Roosters"
     )
     
-    db.close()
-    
     await message.answer(
         text=msg_text,
         reply_markup=get_main_menu_keyboard()
@@ -1488,31 +1494,36 @@ async def receive_existing_flock_breakdown_count(message: types.Message, state:
     roosters = total - hens
     
     # Update DB
-    db = next(get_db())
-    from database import Flock
-    flock = db.query(Flock).filter_by(id=f_id).first()
+    result = await run_db(_add_birds_to_flock, f_id, total, hens, roosters)
     
-    if flock:
-        old_count = flock.current_count
-        flock.current_count += total
-        # Ensure default values if None
-        if flock.hens_count is None: flock.hens_count = 0
-        if flock.roosters_count is None: flock.roosters_count = 0
-        
-        flock.hens_count += hens
-        flock.roosters_count += roosters
-        
-        db.commit()
-        
+    if result:
+        name, old_count, new_count = result
         await message.answer(
             text=f"✅ **Flock Updated!**\n\n"
-                 f"🐔 Flock: {flock.name}\n"
-                 f"📈 Count: {old_count} ➡️ {flock.current_count}\n"
+                 f"🐔 Flock: {name}\n"
+                 f"📈 Count: {old_count} ➡️ {new_count}\n"
                  f"➕ Added: {hens} Hens, {roosters} Roosters",
             reply_markup=get_main_menu_keyboard()
         )
     else:
         await message.answer("⚠️ Error finding flock.")
         
-    db.close()
     await state.clear()
+
+def _add_birds_to_flock(db, f_id: int, total: int, hens: int, roosters: int):
+    flock = db.query(Flock).filter_by(id=f_id).first()
+    if not flock:
+        return None
+    
+    old_count = flock.current_count
+    flock.current_count += total
+    # Ensure default values if None
+    if flock.hens_count is None: flock.hens_count = 0
+    if flock.roosters_count is None: flock.roosters_count = 0
+    
+    flock.hens_count += hens
+    flock.roosters_count += roosters
+    
+    name, new_count = flock.name, flock.current_count
+    db.commit()
+    return name, old_count, new_count
@@ -1,7 +1,10 @@
 from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from database import get_db, InventoryItem, Flock, VaccinationRecord, InventoryLog
+from database import run_db, InventoryItem, Flock, VaccinationRecord
+from stock import record_movement
+from vaccinations import next_dose, reconcile_record, set_breed_schedule, schedule_for_breed
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from utils import get_back_home_keyboard, get_main_menu_keyboard
 from datetime import date, timedelta
@@ -35,9 +38,7 @@ async def start_health_menu(callback: types.CallbackQuery):
 @router.callback_query(F.data == "health_vacc")
 async def health_vacc_start(callback: types.CallbackQuery, state: FSMContext):
     # Select Flock
-    db = next(get_db())
-    flocks = db.query(Flock).all() # You might want to filter by active status if you have one
-    db.close()
+    flocks = await run_db(lambda db: db.query(Flock).all()) # You might want to filter by active status if you have one
     
     if not flocks:
         await callback.answer("No flocks found! Create a flock first.", show_alert=True)
@@ -60,48 +61,31 @@ async def health_vacc_start(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state(HealthStates.select_flock)
     await callback.answer()
 
-# Kenyan Poultry Vaccination Schedule (Day: Vaccine)
-# From docs/kenyan_poultry_vaccination_guide.md
-VACCINE_SCHEDULE = {
-    7: "Newcastle (1st)",
-    10: "Gumboro (1st)",
-    14: "Newcastle Booster",
-    18: "Gumboro (2nd)",
-    21: "Newcastle (1st) - Kienyeji",  # Week 3
-    28: "Newcastle + IB",
-    42: "Fowl Pox",        # Week 6
-    56: "Fowl Typhoid",    # Week 8
-    112: "Deworming",      # Week 16
-    126: "Newcastle + IB (Layer Boost)" # Week 18+
-}
-
 @router.callback_query(HealthStates.select_flock, F.data.startswith("h_flock_"))
 async def receive_flock(callback: types.CallbackQuery, state: FSMContext):
     flock_id = int(callback.data.split("_")[2])
     
     # Store flock info & Calculate Age
-    db = next(get_db())
-    flock = db.query(Flock).filter_by(id=flock_id).first()
+    def load(db):
+        flock = db.query(Flock).filter_by(id=flock_id).first()
+        return flock, next_dose(db, flock_id, date.today())
+    flock, dose = await run_db(load)
     flock_name = flock.name
     flock_count = getattr(flock, 'current_count', 0)
     
     age_days = (date.today() - flock.hatch_date).days
-    db.close()
     
     await state.update_data(flock_id=flock_id, flock_name=flock_name, flock_count=flock_count, flock_age=age_days)
     
-    # Determine Suggestion
+    # Suggestion: the flock's scheduled dose due within +/- 3 days
     suggestion = ""
-    for day, vac_name in VACCINE_SCHEDULE.items():
-        # Fuzzy match age (+/- 3 days)
-        if abs(age_days - day) <= 3:
-            suggestion = f"\n💡 **Suggested for Age {age_days} days:** _{vac_name}_"
-            break
+    if dose:
+        suggestion = f"\n💡 **Suggested for Age {age_days} days:** _{dose.vaccine_name}_ (due {dose.due_date:%b %d})"
             
     # Select Vaccine from Inventory
-    db = next(get_db())
-    vaccines = db.query(InventoryItem).filter(InventoryItem.type == "MEDICATION", InventoryItem.quantity > 0).all()
-    db.close()
+    vaccines = await run_db(
+        lambda db: db.query(InventoryItem).filter(InventoryItem.type == "MEDICATION", InventoryItem.quantity > 0).all()
+    )
     
     if not vaccines:
          await callback.message.edit_text(
@@ -136,8 +120,7 @@ async def receive_flock(callback: types.CallbackQuery, state: FSMContext):
 async def receive_vaccine(callback: types.CallbackQuery, state: FSMContext):
     vacc_id = int(callback.data.split("_")[2])
     
-    db = next(get_db())
-    item = db.query(InventoryItem).filter_by(id=vacc_id).first()
+    item = await run_db(lambda db: db.query(InventoryItem).filter_by(id=vacc_id).first())
     
     await state.update_data(
         vaccine_id=item.id,
@@ -145,7 +128,6 @@ async def receive_vaccine(callback: types.CallbackQuery, state: FSMContext):
         vaccine_stock=item.quantity,
         vaccine_unit=item.unit
     )
-    db.close()
     
     data = await state.get_data()
     flock_count = data.get('flock_count', 0)
@@ -288,13 +270,21 @@ async def receive_next_due(callback: types.CallbackQuery, state: FSMContext):
 @router.callback_query(HealthStates.confirm, F.data == "health_save")
 async def save_health(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    db = next(get_db())
+    await run_db(_save_vaccination, data)
     
+    await callback.message.edit_text(
+        "✅ **Vaccination Recorded!**\nInventory updated.",
+        reply_markup=get_main_menu_keyboard(),
+        parse_mode="Markdown"
+    )
+    await state.clear()
+    await callback.answer()
+
+def _save_vaccination(db, data: dict):
     # Update Inventory
     inv = db.query(InventoryItem).filter_by(id=data['vaccine_id']).first()
     if inv:
-        inv.quantity -= data['stock_used']
-        db.add(InventoryLog(item_name=inv.name, quantity_change=-data['stock_used'])) 
+        record_movement(db, inv, -data['stock_used'])
         
     # Create Record
     import datetime
@@ -312,13 +302,48 @@ async def save_health(callback: types.CallbackQuery, state: FSMContext):
         next_due_date=next_due
     )
     db.add(rec)
+    db.flush()
+    reconcile_record(db, rec)
     db.commit()
-    db.close()
+
+def _parse_schedule(text: str) -> dict:
+    """'7=Newcastle, 14=Gumboro' -> {7: 'Newcastle', 14: 'Gumboro'}."""
+    schedule = {}
+    for part in text.split(","):
+        day, _, vaccine = part.partition("=")
+        if not vaccine.strip():
+            raise ValueError(part)
+        schedule[int(day)] = vaccine.strip()
+    return schedule
+
+@router.message(Command("breed_schedule"))
+async def cmd_breed_schedule(message: types.Message, role: str, command: CommandObject):
+    """Admin: show or set a breed's vaccination schedule (`/breed_schedule Kenbro | 7=Newcastle, 14=Gumboro`)."""
+    if role != "ADMIN":
+        await message.answer("⛔ Admins only.")
+        return
     
-    await callback.message.edit_text(
-        "✅ **Vaccination Recorded!**\nInventory updated.",
-        reply_markup=get_main_menu_keyboard(),
-        parse_mode="Markdown"
-    )
-    await state.clear()
-    await callback.answer()
+    breed, _, spec = (command.args or "").partition("|")
+    breed = breed.strip()
+    if not breed:
+        await message.answer("Usage: `/breed_schedule <breed> [| 7=Newcastle, 14=Gumboro, ...]`", parse_mode="Markdown")
+        return
+    
+    if not spec.strip():
+        schedule = await run_db(schedule_for_breed, breed)
+        text = f"💉 **{breed} Schedule**\n\n" + "\n".join(f"• Day {day}: {name}" for day, name in sorted(schedule.items()))
+        await message.answer(text, parse_mode="Markdown")
+        return
+    
+    try:
+        schedule = _parse_schedule(spec)
+    except ValueError:
+        await message.answer("⚠️ Invalid schedule. Use `day=vaccine` pairs separated by commas.", parse_mode="Markdown")
+        return
+    
+    def save(db):
+        flocks = set_breed_schedule(db, breed, schedule)
+        db.commit()
+        return flocks
+    flocks = await run_db(save)
+    await message.answer(f"✅ **{breed} Schedule Saved**\n\n{len(schedule)} doses; re-planned {flocks} active flock(s).", parse_mode="Markdown")
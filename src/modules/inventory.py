@@ -1,9 +1,13 @@
 from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from database import get_db, InventoryItem, SystemSettings, InventoryLog
+from database import run_db, InventoryItem
+from settings_cache import get_float
+from stock import record_movement, reconcile
+from rollups import sync_daily_entry
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from utils import get_back_home_keyboard, get_main_menu_keyboard, format_currency
+from utils import get_back_home_keyboard, get_main_menu_keyboard, format_currency, escape_markdown
 from datetime import date
 
 router = Router()
@@ -14,16 +18,18 @@ class InventoryStates(StatesGroup):
     add_quantity = State()
     add_reason = State() # Was add_name
 
-@router.callback_query(F.data == "menu_inventory")
-async def start_inventory(callback: types.CallbackQuery):
-    db = next(get_db())
+def _count_stocked_items(db) -> dict:
     # Get counts for dashboard
     from sqlalchemy import func
     counts = {}
     for t in ["FEED", "MEDICATION", "EQUIPMENT", "LIVESTOCK"]:
         c = db.query(func.count(InventoryItem.id)).filter(InventoryItem.type == t, InventoryItem.quantity > 0).scalar()
         counts[t] = c or 0
-    db.close()
+    return counts
+
+@router.callback_query(F.data == "menu_inventory")
+async def start_inventory(callback: types.CallbackQuery):
+    counts = await run_db(_count_stocked_items)
     
     text = "📦 **Inventory Manager**\n\nSelect a category to view stock or make adjustments."
     
@@ -43,17 +49,19 @@ async def start_inventory(callback: types.CallbackQuery):
     )
     await callback.answer()
 
+def _load_category(db, item_type: str):
+    items = db.query(InventoryItem).filter_by(type=item_type).all()
+    def_bag_weight = get_float(db, "feed_bag_weight", 70.0)
+    return items, def_bag_weight
+
 @router.callback_query(F.data.startswith("inv_view_"))
 async def view_category_inventory(callback: types.CallbackQuery):
     item_type = callback.data.replace("inv_view_", "")
     
-    db = next(get_db())
-    items = db.query(InventoryItem).filter_by(type=item_type).all()
+    items, def_bag_weight = await run_db(_load_category, item_type)
     
     # Group by Name to avoid duplicates in display
     grouped = {}
-    setting = db.query(SystemSettings).filter_by(key="feed_bag_weight").first()
-    def_bag_weight = float(setting.value) if setting else 70.0
     
     for item in items:
         if item.quantity <= 0: continue # Skip empty
@@ -66,8 +74,6 @@ async def view_category_inventory(callback: types.CallbackQuery):
         grouped[name]['qty'] += item.quantity
         grouped[name]['ids'].append(item.id)
         # Unit consistency check? Assuming same unit for same name
-        
-    db.close()
     
     text = f"📋 **{item_type} Stock**\n\n"
     if not grouped:
@@ -119,9 +125,7 @@ async def receive_adjust_type(callback: types.CallbackQuery, state: FSMContext):
     await state.update_data(item_type=item_type)
     
     # Query items for selection
-    db = next(get_db())
-    items = db.query(InventoryItem).filter_by(type=item_type).all()
-    db.close()
+    items = await run_db(lambda db: db.query(InventoryItem).filter_by(type=item_type).all())
     
     if items:
         keyboard = []
@@ -152,12 +156,10 @@ async def receive_adjust_type(callback: types.CallbackQuery, state: FSMContext):
 async def receive_existing_select(callback: types.CallbackQuery, state: FSMContext):
     item_id = int(callback.data.split("_")[2])
     
-    db = next(get_db())
-    item = db.query(InventoryItem).filter_by(id=item_id).first()
+    item = await run_db(lambda db: db.query(InventoryItem).filter_by(id=item_id).first())
     
     if not item:
         await callback.answer("Item not found.", show_alert=True)
-        db.close()
         return
 
     # Pre-fill state
@@ -167,7 +169,6 @@ async def receive_existing_select(callback: types.CallbackQuery, state: FSMConte
         current_qty=item.quantity,
         item_unit=item.unit
     )
-    db.close()
     
     # Jump to Quantity
     await callback.message.edit_text(
@@ -232,56 +233,59 @@ async def receive_reason_text(message: types.Message, state: FSMContext):
 
 async def finalize_adjustment(message_or_callback, state: FSMContext, reason: str):
     data = await state.get_data()
-    db = next(get_db())
-    
-    item_id = data.get('item_id')
     qty = data.get('adjustment_qty')
+    unit = await run_db(_apply_adjustment, data.get('item_id'), qty)
     
+    await state.clear()
+    
+    if isinstance(message_or_callback, types.CallbackQuery):
+        message = message_or_callback.message
+    else:
+        message = message_or_callback
+        
+    await message.answer(
+        f"✅ **Stock Adjusted!**\n\nItem: {data['item_name']}\nChange: {qty:+.1f} {unit}\nReason: {reason}",
+        reply_markup=get_main_menu_keyboard()
+    )
+
+def _apply_adjustment(db, item_id: int, qty: float) -> str:
     item = db.query(InventoryItem).filter_by(id=item_id).first()
     final_qty = 0
     unit = ""
     
     if item:
-        item.quantity += qty
+        # InventoryLog has no notes column, so the reason isn't stored
+        record_movement(db, item, qty)
         final_qty = item.quantity
         unit = item.unit
         
-        # Log
-        log = InventoryLog(
-            item_name=item.name,
-            quantity_change=qty,
-            # notes=f"Adjustment: {reason}" # InventoryLog might not have notes column? 
-            # I checked previously, it MIGHT NOT have notes. 
-            # Wait, previously I removed 'notes' from Daily Wizard because it errored.
-            # Does InventoryLog have notes? 
-            # Let me check database.py quickly or just assume it doesn't from previous error.
-            # The previous error was "TypeError: 'notes' is an invalid keyword argument for InventoryLog"
-            # So I should NOT pass notes.
-        )
-        # But wait, where do I store the reason?
-        # If InventoryLog has no notes, I can't store the reason.
-        # Let me check 'database.py' to be sure about InventoryLog fields.
-        db.add(log)
-        
         # Special: Update Flock Count if LIVESTOCK
         if item.type == "LIVESTOCK":
             from database import DailyEntry
             today = date.today()
             daily = db.query(DailyEntry).filter_by(date=today).first()
             if daily:
-                daily.flock_total = max(0, daily.flock_total + int(qty))
+                daily.flock_total = max(0, (daily.flock_total or 0) + int(qty))
+                sync_daily_entry(db, daily)
     
     db.commit()
-    db.close()
+    return unit
+
+@router.message(Command("reconcile_stock"))
+async def cmd_reconcile_stock(message: types.Message, role: str, command: CommandObject):
+    """Admin: compare item quantities with the inventory log (`/reconcile_stock fix` repairs them)."""
+    if role != "ADMIN":
+        await message.answer("⛔ Admins only.")
+        return
     
-    await state.clear()
+    fix = (command.args or "").strip().lower() == "fix"
+    drift = await run_db(reconcile, fix)
+    if not drift:
+        await message.answer("✅ **Stock Reconciled**\n\nAll items match the inventory log.", parse_mode="Markdown")
+        return
     
-    if isinstance(message_or_callback, types.CallbackQuery):
-        message = message_or_callback.message
-    else:
-        message = message_or_callback
-        
-    await message.answer(
-        f"✅ **Stock Adjusted!**\n\nItem: {data['item_name']}\nChange: {qty:+.1f} {unit}\nReason: {reason}",
-        reply_markup=get_main_menu_keyboard()
-    )
+    text = f"⚠️ **Stock Drift** ({len(drift)} items)\n\n"
+    for d in drift:
+        text += f"• {escape_markdown(d.name)}: recorded {d.recorded:g}, log {d.derived:g}\n"
+    text += "\n✅ Reset to the log." if fix else "\nSend `/reconcile_stock fix` to reset them to the log."
+    await message.answer(text, parse_mode="Markdown")
@@ -2,10 +2,12 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from database import get_db, SystemSettings, Flock, DailyEntry, AuditLog, InventoryItem
+from database import run_db, Flock, AuditLog, InventoryItem
+from settings_cache import get_setting, get_float, set_setting
 from utils import get_back_home_keyboard, get_main_menu_keyboard
+from rollups import sync_daily_entry, get_or_create_daily_entry
+from vaccinations import generate_schedule
 from datetime import date, datetime
-from sqlalchemy import desc
 
 router = Router()
 
@@ -47,9 +49,7 @@ async def start_feed_setting_select(callback: types.CallbackQuery, state: FSMCon
     action = callback.data
     
     # Get Feeds
-    db = next(get_db())
-    feeds = db.query(InventoryItem).filter_by(type="FEED").all()
-    db.close()
+    feeds = await run_db(lambda db: db.query(InventoryItem).filter_by(type="FEED").all())
     
     if not feeds:
         await callback.answer("No feeds found in inventory.", show_alert=True)
@@ -75,19 +75,19 @@ async def start_feed_setting_select(callback: types.CallbackQuery, state: FSMCon
         await state.set_state(SettingsStates.select_feed_cost)
     await callback.answer()
 
+def _load_feed_setting(db, feed_id: int, key: str):
+    feed = db.query(InventoryItem).filter_by(id=feed_id).first()
+    return feed, get_setting(db, key)
+
 @router.callback_query(SettingsStates.select_feed_weight, F.data.startswith("feedset_"))
 async def receive_feed_for_weight(callback: types.CallbackQuery, state: FSMContext):
     feed_id = int(callback.data.split("_")[1])
     await state.update_data(target_feed_id=feed_id)
     
-    db = next(get_db())
-    feed = db.query(InventoryItem).filter_by(id=feed_id).first()
-    
     # Check existing setting
     key = f"weight_{feed_id}"
-    setting = db.query(SystemSettings).filter_by(key=key).first()
-    val = setting.value if setting else "Not Set (Using Global 70.0)"
-    db.close()
+    feed, value = await run_db(_load_feed_setting, feed_id, key)
+    val = value if value is not None else "Not Set (Using Global 70.0)"
     
     await callback.message.edit_text(
         f"⚖️ **Edit Bag Weight: {feed.name}**\n\nCurrent: {val}\nEnter new weight (kg):",
@@ -96,6 +96,13 @@ async def receive_feed_for_weight(callback: types.CallbackQuery, state: FSMConte
     await state.set_state(SettingsStates.edit_feed_weight)
     await callback.answer()
 
+def _save_feed_weight(db, key: str, val: float, user_id: int):
+    set_setting(db, key, val)
+    
+    # Log
+    db.add(AuditLog(user_id=user_id, action="update_setting", details=f"Set {key} to {val}"))
+    db.commit()
+
 @router.message(SettingsStates.edit_feed_weight)
 async def save_feed_weight(message: types.Message, state: FSMContext):
     try:
@@ -104,18 +111,7 @@ async def save_feed_weight(message: types.Message, state: FSMContext):
         feed_id = data['target_feed_id']
         key = f"weight_{feed_id}"
         
-        db = next(get_db())
-        setting = db.query(SystemSettings).filter_by(key=key).first()
-        if not setting:
-            setting = SystemSettings(key=key, value=str(val))
-            db.add(setting)
-        else:
-            setting.value = str(val)
-        
-        # Log
-        db.add(AuditLog(user_id=message.from_user.id, action="update_setting", details=f"Set {key} to {val}"))
-        db.commit()
-        db.close()
+        await run_db(_save_feed_weight, key, val, message.from_user.id)
         
         await state.clear()
         await message.answer("✅ **Weight Updated!**", reply_markup=get_main_menu_keyboard())
@@ -127,14 +123,10 @@ async def receive_feed_for_cost(callback: types.CallbackQuery, state: FSMContext
     feed_id = int(callback.data.split("_")[1])
     await state.update_data(target_feed_id=feed_id)
     
-    db = next(get_db())
-    feed = db.query(InventoryItem).filter_by(id=feed_id).first()
-    
     # Check existing setting
     key = f"cost_bag_{feed_id}"
-    setting = db.query(SystemSettings).filter_by(key=key).first()
-    val = setting.value if setting else "Not Set"
-    db.close()
+    feed, value = await run_db(_load_feed_setting, feed_id, key)
+    val = value if value is not None else "Not Set"
     
     await callback.message.edit_text(
         f"💸 **Edit Bag Cost: {feed.name}**\n\nCurrent: {val}\nEnter new cost per bag:",
@@ -148,45 +140,33 @@ async def save_feed_cost(message: types.Message, state: FSMContext):
     try:
         cost = float(message.text)
         data = await state.get_data()
-        feed_id = data['target_feed_id']
-        key_cost = f"cost_bag_{feed_id}"
-        key_weight = f"weight_{feed_id}"
-        
-        db = next(get_db())
-        
-        # Save Bag Cost Setting
-        s_cost = db.query(SystemSettings).filter_by(key=key_cost).first()
-        if not s_cost:
-            s_cost = SystemSettings(key=key_cost, value=str(cost))
-            db.add(s_cost)
-        else:
-            s_cost.value = str(cost)
-            
-        # Get Weight to Calc Per KG
-        s_weight = db.query(SystemSettings).filter_by(key=key_weight).first()
-        if s_weight:
-            weight = float(s_weight.value)
-        else:
-            # Fallback global
-            g_weight = db.query(SystemSettings).filter_by(key="feed_bag_weight").first()
-            weight = float(g_weight.value) if g_weight else 70.0
-            
-        # Update Inventory Item
-        feed = db.query(InventoryItem).filter_by(id=feed_id).first()
-        if feed:
-            cost_kg = cost / weight if weight > 0 else 0
-            feed.cost_per_unit = cost_kg
-        
-        # Log
-        db.add(AuditLog(user_id=message.from_user.id, action="update_setting", details=f"Set {key_cost} to {cost} (Updated Item Cost/KG to {feed.cost_per_unit:.2f})"))
-        db.commit()
-        db.close()
+        await run_db(_save_feed_cost, data['target_feed_id'], cost, message.from_user.id)
         
         await state.clear()
         await message.answer("✅ **Cost Updated!**\nInventory unit cost recalculated.", reply_markup=get_main_menu_keyboard())
     except ValueError:
         await message.answer("Invalid number.")
 
+def _save_feed_cost(db, feed_id: int, cost: float, user_id: int):
+    key_cost = f"cost_bag_{feed_id}"
+    key_weight = f"weight_{feed_id}"
+    
+    # Save Bag Cost Setting
+    set_setting(db, key_cost, cost)
+        
+    # Get Weight to Calc Per KG (per-feed, else global fallback)
+    weight = get_float(db, key_weight, get_float(db, "feed_bag_weight", 70.0))
+        
+    # Update Inventory Item
+    feed = db.query(InventoryItem).filter_by(id=feed_id).first()
+    if feed:
+        cost_kg = cost / weight if weight > 0 else 0
+        feed.cost_per_unit = cost_kg
+    
+    # Log
+    db.add(AuditLog(user_id=user_id, action="update_setting", details=f"Set {key_cost} to {cost} (Updated Item Cost/KG to {feed.cost_per_unit:.2f})"))
+    db.commit()
+
 @router.callback_query(F.data.startswith("set_"))
 async def start_edit_setting(callback: types.CallbackQuery, state: FSMContext):
     # This handles generic/global settings (Price per Egg, etc)
@@ -201,10 +181,7 @@ async def start_edit_setting(callback: types.CallbackQuery, state: FSMContext):
     
     db_key, label = key_map[callback.data]
     
-    db = next(get_db())
-    setting = db.query(SystemSettings).filter_by(key=db_key).first()
-    current_value = setting.value if setting else "Not Set"
-    db.close()
+    current_value = await run_db(get_setting, db_key, "Not Set")
     
     await callback.message.edit_text(
         f"✏️ **Edit {label}**\n\nCurrent Value: {current_value}\n\nEnter new value:",
@@ -215,6 +192,10 @@ async def start_edit_setting(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state(SettingsStates.edit_value)
     await callback.answer()
 
+def _save_setting(db, key: str, new_value: str):
+    set_setting(db, key, new_value)
+    db.commit()
+
 @router.message(SettingsStates.edit_value)
 async def save_setting(message: types.Message, state: FSMContext):
     data = await state.get_data()
@@ -228,16 +209,7 @@ async def save_setting(message: types.Message, state: FSMContext):
         await message.answer("⚠️ Please enter a valid number.")
         return
         
-    db = next(get_db())
-    setting = db.query(SystemSettings).filter_by(key=key).first()
-    if not setting:
-        setting = SystemSettings(key=key, value=new_value)
-        db.add(setting)
-    else:
-        setting.value = new_value
-        
-    db.commit()
-    db.close()
+    await run_db(_save_setting, key, new_value)
     
     await state.clear()
     await message.answer(
@@ -320,8 +292,15 @@ async def receive_new_initial_count(message: types.Message, state: FSMContext):
 @router.callback_query(SettingsStates.new_confirm, F.data == "confirm_new_flock")
 async def confirm_new_flock(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    db = next(get_db())
+    await run_db(_create_flock, data, callback.from_user.id)
     
+    await state.clear()
+    await callback.message.edit_text("✅ **Flock Created!**", reply_markup=get_main_menu_keyboard())
+    await callback.answer()
+
+def _create_flock(db, data: dict, user_id: int):
+    entry = get_or_create_daily_entry(db, date.today())  # First, so a lost race has nothing to roll back
+
     flock = Flock(
         name=data.get('new_name'),
         breed=data.get('new_breed'),
@@ -330,26 +309,15 @@ async def confirm_new_flock(callback: types.CallbackQuery, state: FSMContext):
         status="ACTIVE"
     )
     db.add(flock)
+    generate_schedule(db, flock)
     
     # Update Daily Entry
-    today = date.today()
-    entry = db.query(DailyEntry).filter(DailyEntry.date == today).first()
-    if not entry:
-        entry = DailyEntry(date=today)
-        last = db.query(DailyEntry).filter(DailyEntry.date < today).order_by(desc(DailyEntry.date)).first()
-        entry.flock_total = last.flock_total if last else 0
-        db.add(entry)
-    
     if entry.flock_added is None: entry.flock_added = 0
     if entry.flock_total is None: entry.flock_total = 0
     
     entry.flock_added += flock.initial_count
     entry.flock_total += flock.initial_count
+    sync_daily_entry(db, entry)
 
-    db.add(AuditLog(user_id=callback.from_user.id, action="new_flock", details=f"Created {flock.name}"))
+    db.add(AuditLog(user_id=user_id, action="new_flock", details=f"Created {flock.name}"))
     db.commit()
-    db.close()
-    
-    await state.clear()
-    await callback.message.edit_text("✅ **Flock Created!**", reply_markup=get_main_menu_keyboard())
-    await callback.answer()
@@ -0,0 +1,51 @@
+"""Exact currency amounts.
+
+Money columns are stored as integer minor units (cents) and read back as
+2-place Decimals, so ledger sums and rollups add up exactly both in SQL
+(integer SUM) and in Python. Floats coming from user input or settings are
+converted with `to_money` at the point they meet a stored amount.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy.types import Integer, TypeDecorator
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def to_decimal(value) -> Decimal:
+    """Exact Decimal for a number; floats go via their shortest repr (0.1 -> 0.1, not 0.1000000000000000055)."""
+    if value is None:
+        return ZERO
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def to_money(value) -> Decimal:
+    """Round a number to cents (half up). None becomes 0.00."""
+    return to_decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def line_total(quantity, unit_price) -> Decimal:
+    """quantity x unit_price, rounded to cents once at the end."""
+    return to_money(to_decimal(quantity) * to_decimal(unit_price))
+
+
+class Money(TypeDecorator):
+    """Currency column: INTEGER cents in the database, Decimal('12.34') in Python."""
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_money(value).scaleb(2))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Decimal(int(value)).scaleb(-2)
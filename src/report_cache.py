@@ -0,0 +1,138 @@
+"""Rendered report screens, cached until the data behind them changes.
+
+Each tracked table has a version counter per database engine. A committed
+transaction that wrote to a table (ORM flush or bulk statement) bumps its
+counter. A cached screen remembers the versions of the tables it was built
+from and is served only while they are unchanged, so tapping between report
+screens re-runs no queries until someone records something.
+
+Versions are read *before* the report is built: a write committed while it
+is being built leaves the entry stale on arrival rather than caching old
+data as new. Keys carry the report's dates, so screens also roll over at
+midnight; REPORT_CACHE_TTL is a safety net for out-of-band edits.
+"""
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import commit_hooks
+import database
+from database import (
+    DailyEntry, DailyFeedUsage, FinancialLedger, Flock, InventoryItem, InventoryLog,
+    LedgerRollup, ProductionRollup, VaccinationRecord,
+)
+
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "600"))  # Seconds; safety net for out-of-band edits
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "128"))  # Screens kept per engine (least recently used dropped)
+
+TRACKED_MODELS = (
+    DailyEntry, FinancialLedger, InventoryItem, VaccinationRecord,
+    DailyFeedUsage, InventoryLog, Flock, ProductionRollup, LedgerRollup,
+)
+
+
+class _EngineCache:
+    __slots__ = ("versions", "entries", "hits", "misses")
+
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+        self.entries: "OrderedDict[Hashable, Tuple[float, tuple, Any]]" = OrderedDict()  # key -> (built_at, versions, payload)
+        self.hits = 0
+        self.misses = 0
+
+
+_lock = threading.Lock()
+_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # engine -> _EngineCache
+
+
+def _state(engine) -> _EngineCache:
+    state = _caches.get(engine)
+    if state is None:
+        state = _caches[engine] = _EngineCache()
+    return state
+
+
+def current_engine():
+    """Engine `run_db` would use right now (prod or demo), or None before demo init."""
+    factory = database.DemoSessionLocal if database.IS_DEMO_MODE else database.ProdSessionLocal
+    return factory.kw.get("bind") if factory is not None else None
+
+
+def versions(engine, tables: Iterable[str]) -> tuple:
+    """Current version of each table, in the given order."""
+    with _lock:
+        state = _state(engine)
+        return tuple(state.versions.get(t, 0) for t in tables)
+
+
+def _table_names(models) -> Tuple[str, ...]:
+    return tuple(m if isinstance(m, str) else m.__tablename__ for m in models)
+
+
+async def cached(key: Hashable, models: Iterable, build: Callable[[], Awaitable[Any]]) -> Any:
+    """`await build()`, or its earlier result if none of `models`' tables changed since.
+
+    `key` must identify everything the result depends on besides those
+    tables (report type, dates, page). The result is shared between callers
+    and must not be mutated.
+    """
+    engine = current_engine()
+    if engine is None or REPORT_CACHE_SIZE <= 0:
+        return await build()
+
+    tables = _table_names(models)
+    stamp = versions(engine, tables)
+    with _lock:
+        state = _state(engine)
+        entry = state.entries.get(key)
+        if entry and entry[1] == stamp and time.monotonic() - entry[0] < REPORT_CACHE_TTL:
+            state.entries.move_to_end(key)
+            state.hits += 1
+            return entry[2]
+        state.misses += 1
+
+    payload = await build()
+    with _lock:
+        state = _state(engine)
+        state.entries[key] = (time.monotonic(), stamp, payload)
+        state.entries.move_to_end(key)
+        while len(state.entries) > REPORT_CACHE_SIZE:
+            state.entries.popitem(last=False)
+    return payload
+
+
+def bump(engine, tables: Iterable[str]):
+    """Mark tables as changed: every screen built from them is stale."""
+    with _lock:
+        state = _state(engine)
+        for table in tables:
+            state.versions[table] = state.versions.get(table, 0) + 1
+
+
+def invalidate(engine=None):
+    """Drop cached screens for one engine, or for all of them."""
+    with _lock:
+        targets = list(_caches.values()) if engine is None else [_caches.get(engine)]
+        for state in targets:
+            if state is not None:
+                state.entries.clear()
+
+
+def stats(engine=None) -> Dict[str, int]:
+    """Hit/miss counters and cached screen count for an engine (default: current)."""
+    engine = engine if engine is not None else current_engine()
+    with _lock:
+        state = _caches.get(engine) if engine is not None else None
+        if state is None:
+            return {"hits": 0, "misses": 0, "entries": 0}
+        return {"hits": state.hits, "misses": state.misses, "entries": len(state.entries)}
+
+
+# --- Version bumps on writes ---
+# Bumped once a transaction that wrote the tables commits or rolls back,
+# bulk statements included (see commit_hooks).
+
+commit_hooks.on_commit(TRACKED_MODELS, bump)
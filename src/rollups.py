@@ -0,0 +1,187 @@
+"""Materialized DAY / WEEK / MONTH rollups for daily entries and the ledger.
+
+Writers call `sync_daily_entry` after changing a DailyEntry and
+`record_ledger_entry` after adding a FinancialLedger row, inside the same
+transaction. Reports then read one rollup row per period instead of
+rescanning `daily_entries` / `financial_ledger`.
+
+If the rollups are ever out of step (e.g. an old database, or rows edited by
+hand) run `python src/rollups.py` or the admin `/rebuild_rollups` command.
+"""
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import DailyEntry, FinancialLedger, ProductionRollup, LedgerRollup
+from money import ZERO
+
+PERIODS = ("DAY", "WEEK", "MONTH")
+
+# DailyEntry columns mirrored (summed) into ProductionRollup
+PRODUCTION_FIELDS = (
+    "eggs_collected", "eggs_broken", "feed_used_kg", "feed_cost",
+    "income", "mortality_count", "flock_total",
+)
+
+
+def period_start(period: str, day: date) -> date:
+    """First day of the bucket that `day` falls in."""
+    if period == "WEEK":
+        return day - timedelta(days=day.weekday())
+    if period == "MONTH":
+        return day.replace(day=1)
+    return day
+
+
+def get_or_create_daily_entry(db, day: date) -> DailyEntry:
+    """The DailyEntry for `day`, added and flushed if there is none yet.
+
+    A new entry starts from the latest earlier flock_total. Call this
+    before adding anything else to the session: when two first saves of a
+    day race on the unique date, the loser rolls its transaction back and
+    re-reads the winner's row.
+    """
+    entry = db.query(DailyEntry).filter(DailyEntry.date == day).first()
+    if entry is not None:
+        return entry
+    last = (db.query(DailyEntry.flock_total).filter(DailyEntry.date < day)
+            .order_by(DailyEntry.date.desc()).first())
+    entry = DailyEntry(date=day, flock_total=(last[0] or 0) if last else 0)
+    db.add(entry)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        entry = db.query(DailyEntry).filter(DailyEntry.date == day).one()
+    return entry
+
+
+def _production_row(db, period: str, start: date) -> ProductionRollup:
+    row = db.query(ProductionRollup).filter_by(period=period, period_start=start).first()
+    if not row:
+        row = ProductionRollup(period=period, period_start=start, days=0)
+        for field in PRODUCTION_FIELDS:
+            setattr(row, field, 0)
+        db.add(row)
+        db.flush()  # Visible to the next lookup even with autoflush off
+    return row
+
+
+def _ledger_row(db, period: str, start: date, direction: str, category: str) -> LedgerRollup:
+    row = db.query(LedgerRollup).filter_by(
+        period=period, period_start=start, direction=direction, category=category
+    ).first()
+    if not row:
+        row = LedgerRollup(
+            period=period, period_start=start, direction=direction,
+            category=category, amount=0.0, entries=0
+        )
+        db.add(row)
+        db.flush()
+    return row
+
+
+def sync_daily_entry(db, entry: DailyEntry):
+    """Fold the current state of `entry` into its DAY/WEEK/MONTH rollups.
+
+    The DAY row doubles as the last-seen snapshot of the entry, so only the
+    difference is added to the week and month rows. Calling this twice for
+    the same state is a no-op.
+    """
+    day_row = _production_row(db, "DAY", entry.date)
+    is_new_day = not day_row.days
+    deltas = {
+        field: (getattr(entry, field) or 0) - (getattr(day_row, field) or 0)
+        for field in PRODUCTION_FIELDS
+    }
+
+    for period in PERIODS:
+        row = day_row if period == "DAY" else _production_row(db, period, period_start(period, entry.date))
+        for field, delta in deltas.items():
+            setattr(row, field, (getattr(row, field) or 0) + delta)
+        if is_new_day:
+            row.days = (row.days or 0) + 1
+
+
+def record_ledger_entry(db, ledger: FinancialLedger):
+    """Add a new ledger row's amount to its DAY/WEEK/MONTH buckets."""
+    day = ledger.date or date.today()
+    category = ledger.category or "Other"
+    for period in PERIODS:
+        row = _ledger_row(db, period, period_start(period, day), ledger.direction, category)
+        row.amount = (row.amount or 0) + (ledger.amount or 0)
+        row.entries = (row.entries or 0) + 1
+
+
+def rebuild_rollups(db) -> Dict[str, int]:
+    """Drop and recompute every rollup from the source tables. Commits."""
+    db.query(ProductionRollup).delete()
+    db.query(LedgerRollup).delete()
+    db.flush()
+
+    entries = 0
+    for entry in db.query(DailyEntry).order_by(DailyEntry.date).all():
+        sync_daily_entry(db, entry)
+        entries += 1
+
+    ledgers = 0
+    for ledger in db.query(FinancialLedger).order_by(FinancialLedger.id).all():
+        record_ledger_entry(db, ledger)
+        ledgers += 1
+
+    db.commit()
+    return {"daily_entries": entries, "ledger_entries": ledgers}
+
+
+# --- Read side ---
+
+def production_totals(db, period: str, day: date) -> Optional[ProductionRollup]:
+    """The rollup row for the bucket containing `day`, or None if nothing was recorded."""
+    return db.query(ProductionRollup).filter_by(period=period, period_start=period_start(period, day)).first()
+
+
+def ledger_totals(db, period: str, day: Optional[date] = None) -> dict:
+    """{'in', 'out', 'cats'} for the bucket containing `day`, or every `period` bucket summed when `day` is None.
+
+    Amounts are Decimal; cats are expenses only, matching the P&L layout.
+    """
+    query = db.query(LedgerRollup.direction, LedgerRollup.category, func.sum(LedgerRollup.amount)).filter(
+        LedgerRollup.period == period)
+    if day is not None:
+        query = query.filter(LedgerRollup.period_start == period_start(period, day))
+    totals = {'in': ZERO, 'out': ZERO, 'cats': {}}
+    for direction, category, amount in query.group_by(LedgerRollup.direction, LedgerRollup.category):
+        amount = amount or ZERO
+        if direction == "IN":
+            totals['in'] += amount
+        else:
+            totals['out'] += amount
+            totals['cats'][category] = totals['cats'].get(category, ZERO) + amount
+    return totals
+
+
+def daily_series(db, field: str, start: date, end: date) -> Dict[date, float]:
+    """`field` per day for start..end, zero-filled for days without an entry."""
+    rows = db.query(ProductionRollup.period_start, getattr(ProductionRollup, field)).filter(
+        ProductionRollup.period == "DAY",
+        ProductionRollup.period_start >= start,
+        ProductionRollup.period_start <= end,
+    ).all()
+    series = {start + timedelta(days=i): 0 for i in range((end - start).days + 1)}
+    for day, value in rows:
+        series[day] = value or 0
+    return series
+
+
+if __name__ == "__main__":
+    from database import get_db
+
+    gen = get_db()
+    session = next(gen)
+    try:
+        counts = rebuild_rollups(session)
+    finally:
+        gen.close()
+    print(f"Rebuilt rollups from {counts['daily_entries']} daily entries and {counts['ledger_entries']} ledger rows.")
@@ -0,0 +1,102 @@
+"""Background jobs: alert pushes and inventory snapshots.
+
+Every ALERT_CHECK_INTERVAL seconds the alert checks run in a single DB
+session, alerts not seen before are recorded in `sent_alerts` and pushed to
+the admins. Set ALERT_CHECK_INTERVAL=0 to disable.
+
+Every INVENTORY_SNAPSHOT_INTERVAL seconds items with a long tail of
+inventory log rows get a fresh snapshot (see stock.take_snapshots).
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramAPIError
+
+import database
+from database import run_db, SentAlert
+from modules.alerts import collect_alerts
+from stock import take_snapshots
+
+logger = logging.getLogger(__name__)
+
+ALERT_CHECK_INTERVAL = int(os.getenv("ALERT_CHECK_INTERVAL", "900"))  # seconds
+INVENTORY_SNAPSHOT_INTERVAL = int(os.getenv("INVENTORY_SNAPSHOT_INTERVAL", "3600"))  # seconds
+SENT_ALERT_RETENTION_DAYS = 30
+
+
+def claim_new_alerts(db) -> list[tuple[str, str]]:
+    """Evaluate all checks and mark the unseen alerts as sent, in one transaction.
+
+    Claiming before sending means a crash mid-send drops an alert rather than
+    repeating it on every tick.
+    """
+    alerts = collect_alerts(db)
+    fresh = []
+    if alerts:
+        keys = [key for key, _ in alerts]
+        seen = {key for (key,) in db.query(SentAlert.alert_key).filter(SentAlert.alert_key.in_(keys))}
+        fresh = [(key, text) for key, text in alerts if key not in seen]
+        for key, text in fresh:
+            db.add(SentAlert(alert_key=key, message=text))
+
+    # Keys embed dates/ages, so old rows can never match again
+    cutoff = datetime.now() - timedelta(days=SENT_ALERT_RETENTION_DAYS)
+    db.query(SentAlert).filter(SentAlert.sent_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return fresh
+
+
+async def run_alert_tick(bot, admin_ids) -> int:
+    """One scheduler pass. Returns the number of alerts pushed."""
+    if database.IS_DEMO_MODE:
+        return 0  # Don't push sandbox data to admins
+
+    fresh = await run_db(claim_new_alerts)
+    for _, text in fresh:
+        for chat_id in admin_ids:
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+            except TelegramAPIError as e:
+                logger.warning("Could not deliver alert to %s: %s", chat_id, e)
+    return len(fresh)
+
+
+async def alert_loop(bot, admin_ids, interval: int = ALERT_CHECK_INTERVAL):
+    """Run alert ticks forever, surviving individual failures."""
+    while True:
+        try:
+            sent = await run_alert_tick(bot, admin_ids)
+            if sent:
+                logger.info("Pushed %d alert(s) to admins", sent)
+        except Exception:
+            logger.exception("Alert check failed")
+        await asyncio.sleep(interval)
+
+
+def start_alert_scheduler(bot, admin_ids) -> asyncio.Task | None:
+    """Start the alert loop on the running event loop (None if disabled)."""
+    if ALERT_CHECK_INTERVAL <= 0 or not admin_ids:
+        logger.info("Alert scheduler disabled")
+        return None
+    return asyncio.create_task(alert_loop(bot, admin_ids), name="alert-scheduler")
+
+
+async def snapshot_loop(interval: int = INVENTORY_SNAPSHOT_INTERVAL):
+    """Snapshot inventory items with long event tails, forever."""
+    while True:
+        try:
+            taken = await run_db(take_snapshots)
+            if taken:
+                logger.info("Snapshotted %d inventory item(s)", taken)
+        except Exception:
+            logger.exception("Inventory snapshot failed")
+        await asyncio.sleep(interval)
+
+
+def start_snapshot_scheduler() -> asyncio.Task | None:
+    """Start the snapshot loop on the running event loop (None if disabled)."""
+    if INVENTORY_SNAPSHOT_INTERVAL <= 0:
+        return None
+    return asyncio.create_task(snapshot_loop(), name="inventory-snapshots")
@@ -0,0 +1,97 @@
+"""In-process cache for the `settings` table.
+
+The whole table is loaded with one query and kept in memory per database
+engine (so prod and demo never mix), then served from the dict until it
+expires or a committed transaction touches a SystemSettings row.
+
+Reads take the handler's session as their first argument like every other
+helper run through `run_db`; the session is only used on a cache miss.
+A load that raced with an invalidation (its query may predate the commit)
+is returned to its caller but not cached: each engine has a generation
+counter, read before the query and bumped by every invalidation.
+"""
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+import commit_hooks
+from database import SystemSettings
+
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "300"))  # Seconds; safety net for out-of-band edits
+
+_lock = threading.Lock()
+_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # engine -> (loaded_at, {key: value})
+_generations: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # engine -> invalidation count
+
+
+def _engine(db):
+    return db.get_bind()
+
+
+def load_settings(db) -> Dict[str, str]:
+    """All settings as {key: raw string value}, from cache when fresh."""
+    engine = _engine(db)
+    with _lock:
+        cached = _cache.get(engine)
+        if cached and time.monotonic() - cached[0] < SETTINGS_CACHE_TTL:
+            return cached[1]
+        generation = _generations.setdefault(engine, 0)
+
+    values = _query_settings(db)
+    with _lock:
+        if _generations.get(engine) == generation:  # Else a commit landed meanwhile; don't cache old rows
+            _cache[engine] = (time.monotonic(), values)
+    return values
+
+
+def _query_settings(db) -> Dict[str, str]:
+    return {s.key: s.value for s in db.query(SystemSettings).all()}
+
+
+def get_setting(db, key: str, default: Optional[str] = None) -> Optional[str]:
+    """Raw string value of a setting, or `default` when unset."""
+    return load_settings(db).get(key, default)
+
+
+def get_float(db, key: str, default: float) -> float:
+    """Numeric setting; falls back to `default` when unset or not a number."""
+    value = load_settings(db).get(key)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def set_setting(db, key: str, value) -> SystemSettings:
+    """Insert or update a setting in the caller's transaction.
+
+    The cache is dropped once that transaction commits (see commit_hooks).
+    """
+    setting = db.query(SystemSettings).filter_by(key=key).first()
+    if not setting:
+        setting = SystemSettings(key=key, value=str(value))
+        db.add(setting)
+    else:
+        setting.value = str(value)
+    return setting
+
+
+def invalidate(engine=None):
+    """Forget cached settings for one engine, or for all of them."""
+    with _lock:
+        for target in (list(_generations) if engine is None else [engine]):
+            _generations[target] = _generations.get(target, 0) + 1
+        if engine is None:
+            _cache.clear()
+        else:
+            _cache.pop(engine, None)
+
+
+# --- Write-through invalidation ---
+# Dropped once a transaction that wrote a settings row commits or rolls back (see commit_hooks).
+
+commit_hooks.on_commit((SystemSettings,), lambda engine, _: invalidate(engine))
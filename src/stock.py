@@ -0,0 +1,289 @@
+"""Event-sourced inventory.
+
+InventoryLog is the source of truth for stock: every change to an item is a
+log row keyed by `item_id`, and `InventoryItem.quantity` is only a running
+total kept in step by the helpers below. Handlers should never touch
+`quantity` directly - use `record_movement` (one item) or `apply_movements`
+(many items; one IN query and one executemany INSERT instead of a
+SELECT + INSERT per line item).
+
+Each log row also stores `balance_after`, the item's stock once it is
+applied, so "stock on date X" is one seek on (item_id, date) and usage
+between two dates is one range scan of the same index (`balances`,
+`consumption`, `balance_series`).
+
+Independently of those stored balances, stock can be re-derived from the
+events alone: the latest InventorySnapshot plus the short tail of logs
+after it (`stock_levels`). `take_snapshots` folds long tails into new
+snapshots (run periodically by the scheduler), and `reconcile` compares the
+cached quantities with the derived ones and reports or fixes drift:
+
+    python src/stock.py --reconcile [--fix]
+    python src/stock.py --snapshot
+
+A log row's position in an item's history is its (date, id) order, the
+order of the (item_id, date) index: `balance_after` is the balance after
+every row before it in that order, and the balance readers take the last
+row on or before a date by it. New rows are written with today's date, so
+they always come last; rows dated earlier (the migration's opening
+balances) sort by their date, not by when they were inserted.
+"""
+import os
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, insert, or_, tuple_
+
+from database import InventoryItem, InventoryLog, InventorySnapshot, DailyFeedUsage
+
+INVENTORY_SNAPSHOT_EVERY = int(os.getenv("INVENTORY_SNAPSHOT_EVERY", "100"))  # Events per item between snapshots
+DRIFT_TOLERANCE = 1e-6
+
+
+def load_items(db, item_ids: Iterable[int]) -> Dict[int, InventoryItem]:
+    """{id: InventoryItem} for the given ids in a single query (missing ids are absent)."""
+    ids = {i for i in item_ids if i}
+    if not ids:
+        return {}
+    return {item.id: item for item in db.query(InventoryItem).filter(InventoryItem.id.in_(ids))}
+
+
+def record_movement(db, item: InventoryItem, delta: float, ledger_id: Optional[int] = None,
+                    flock_id: Optional[str] = None) -> InventoryLog:
+    """Apply one quantity change to a (flushed) item and append its log row."""
+    item.quantity = (item.quantity or 0) + delta
+    log = InventoryLog(item_id=item.id, item_name=item.name, quantity_change=delta,
+                       balance_after=item.quantity, ledger_id=ledger_id, flock_id=flock_id)
+    db.add(log)
+    return log
+
+
+def apply_movements(db, movements: List[Tuple[InventoryItem, float]], ledger_id: Optional[int] = None) -> int:
+    """Apply (item, quantity delta) pairs and insert one InventoryLog per movement.
+
+    Items must have ids (flush new ones first). Quantity changes are flushed
+    with the caller's commit (one batched UPDATE); the logs go out now as a
+    single INSERT. Returns the number of logs.
+    """
+    rows = []
+    for item, delta in movements:
+        item.quantity = (item.quantity or 0) + delta
+        rows.append({"item_id": item.id, "item_name": item.name, "quantity_change": delta,
+                     "balance_after": item.quantity, "ledger_id": ledger_id})
+    if rows:
+        db.execute(insert(InventoryLog), rows)
+    return len(rows)
+
+
+def record_feed_usage(db, daily_entry_id: int, usages: List[Tuple[int, float]]) -> int:
+    """Insert (feed_item_id, kg) usage rows for a daily entry in one statement."""
+    rows = [
+        {"daily_entry_id": daily_entry_id, "feed_item_id": feed_id, "quantity_kg": qty}
+        for feed_id, qty in usages
+    ]
+    if rows:
+        db.execute(insert(DailyFeedUsage), rows)
+    return len(rows)
+
+
+# --- Read side: running balances ---
+
+def balances(db, as_of: Optional[date] = None, item_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """{item_id: stock} at the end of `as_of` (default: now) from the running balance.
+
+    Takes each item's last log in (date, id) order, like `stock_at`: one
+    index seek per item. Items with no log on or before that date are
+    absent (stock 0).
+    """
+    last = _last_logs(db, as_of, item_ids)
+    rows = db.query(InventoryLog.item_id, InventoryLog.balance_after).join(last, InventoryLog.id == last.c.id)
+    return {item_id: balance or 0.0 for item_id, balance in rows}
+
+
+def _last_logs(db, as_of: Optional[date] = None, item_ids: Optional[Iterable[int]] = None):
+    """Subquery: the id of each item's last log in (date, id) order (on or before `as_of`)."""
+    latest = db.query(InventoryLog.id).filter(InventoryLog.item_id == InventoryItem.id)
+    if as_of:
+        latest = latest.filter(InventoryLog.date <= as_of)
+    latest = (latest.order_by(InventoryLog.date.desc(), InventoryLog.id.desc()).limit(1)
+              .correlate(InventoryItem).scalar_subquery())
+    last = db.query(latest.label("id")).select_from(InventoryItem)
+    if item_ids is not None:
+        last = last.filter(InventoryItem.id.in_(list(item_ids)))
+    return last.subquery()
+
+
+def stock_at(db, item_id: int, as_of: Optional[date] = None) -> float:
+    """Stock of one item at the end of `as_of` (default: now): the latest balance on or before it."""
+    query = db.query(InventoryLog.balance_after).filter(InventoryLog.item_id == item_id)
+    if as_of:
+        query = query.filter(InventoryLog.date <= as_of)
+    row = query.order_by(InventoryLog.date.desc(), InventoryLog.id.desc()).first()
+    return (row[0] or 0.0) if row else 0.0
+
+
+def consumption(db, start: date, end: date, item_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """{item_id: quantity taken out} between start and end inclusive (usage, sales, write-offs)."""
+    query = db.query(InventoryLog.item_id, func.sum(-InventoryLog.quantity_change)).filter(
+        InventoryLog.item_id.isnot(None),
+        InventoryLog.date >= start,
+        InventoryLog.date <= end,
+        InventoryLog.quantity_change < 0,
+    )
+    if item_ids is not None:
+        query = query.filter(InventoryLog.item_id.in_(list(item_ids)))
+    return {item_id: used or 0.0 for item_id, used in query.group_by(InventoryLog.item_id)}
+
+
+def balance_series(db, item_id: int, start: date, end: date) -> Dict[date, float]:
+    """End-of-day stock of one item for every day in start..end (e.g. a feed burn curve)."""
+    current = stock_at(db, item_id, start - timedelta(days=1))
+    closing = dict(
+        db.query(InventoryLog.date, InventoryLog.balance_after)
+        .filter(InventoryLog.item_id == item_id, InventoryLog.date >= start, InventoryLog.date <= end)
+        .order_by(InventoryLog.date, InventoryLog.id)
+    )  # Later rows of a day overwrite earlier ones
+    series = {}
+    for i in range((end - start).days + 1):
+        day = start + timedelta(days=i)
+        current = closing.get(day, current) or 0.0
+        series[day] = current
+    return series
+
+
+# --- Read side: derived from events ---
+
+def _latest_snapshots(db, as_of: Optional[date] = None):
+    """Subquery: each item's newest snapshot (on or before `as_of`) in (date, last_log_id) order."""
+    latest = db.query(InventorySnapshot.id).filter(InventorySnapshot.item_id == InventoryItem.id)
+    if as_of:
+        latest = latest.filter(InventorySnapshot.date <= as_of)
+    latest = (latest.order_by(InventorySnapshot.date.desc(), InventorySnapshot.last_log_id.desc()).limit(1)
+              .correlate(InventoryItem).scalar_subquery())
+    newest = db.query(latest.label("id")).select_from(InventoryItem).subquery()
+    return (
+        db.query(InventorySnapshot.item_id, InventorySnapshot.date, InventorySnapshot.last_log_id,
+                 InventorySnapshot.quantity)
+        .join(newest, InventorySnapshot.id == newest.c.id)
+        .subquery()
+    )
+
+
+def _after_snapshot(snaps):
+    """Log rows past their item's snapshot position in (date, id) order (every row when there is none)."""
+    return or_(snaps.c.item_id.is_(None),
+               tuple_(InventoryLog.date, InventoryLog.id) > tuple_(snaps.c.date, snaps.c.last_log_id))
+
+
+def stock_levels(db, as_of: Optional[date] = None, item_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """{item_id: stock} derived from the log, at the end of `as_of` (default: now).
+
+    Two queries regardless of item count: the latest snapshots, then the
+    tail of each item's events after its snapshot.
+    """
+    snaps = _latest_snapshots(db, as_of)
+    levels = {}
+    base = db.query(snaps.c.item_id, snaps.c.quantity)
+    if item_ids is not None:
+        item_ids = list(item_ids)
+        base = base.filter(snaps.c.item_id.in_(item_ids))
+    for item_id, quantity in base:
+        levels[item_id] = quantity
+
+    tail = (
+        db.query(InventoryLog.item_id, func.sum(InventoryLog.quantity_change))
+        .outerjoin(snaps, snaps.c.item_id == InventoryLog.item_id)
+        .filter(InventoryLog.item_id.isnot(None), _after_snapshot(snaps))
+    )
+    if as_of:
+        tail = tail.filter(InventoryLog.date <= as_of)
+    if item_ids is not None:
+        tail = tail.filter(InventoryLog.item_id.in_(item_ids))
+    for item_id, change in tail.group_by(InventoryLog.item_id):
+        levels[item_id] = levels.get(item_id, 0.0) + (change or 0.0)
+    return levels
+
+
+# --- Maintenance ---
+
+def take_snapshots(db, min_events: int = INVENTORY_SNAPSHOT_EVERY) -> int:
+    """Snapshot every item with at least `min_events` logs since its last snapshot. Commits.
+
+    A snapshot's position is the (date, id) of the item's last log in
+    that order, i.e. the newest row it covers rather than the highest id,
+    so back-dated rows such as opening balances fall on the right side.
+    """
+    snaps = _latest_snapshots(db)
+    tails = (
+        db.query(
+            InventoryLog.item_id,
+            func.count(InventoryLog.id),
+            func.sum(InventoryLog.quantity_change),
+            func.coalesce(func.max(snaps.c.quantity), 0.0),
+        )
+        .outerjoin(snaps, snaps.c.item_id == InventoryLog.item_id)
+        .filter(InventoryLog.item_id.isnot(None), _after_snapshot(snaps))
+        .group_by(InventoryLog.item_id)
+        .having(func.count(InventoryLog.id) >= min_events)
+        .all()
+    )
+    if not tails:
+        return 0
+
+    last = _last_logs(db, item_ids=[t[0] for t in tails])
+    positions = {item_id: (log_id, day) for item_id, log_id, day in
+                 db.query(InventoryLog.item_id, InventoryLog.id, InventoryLog.date)
+                 .join(last, InventoryLog.id == last.c.id)}
+    db.execute(insert(InventorySnapshot), [
+        {"item_id": item_id, "last_log_id": positions[item_id][0], "date": positions[item_id][1] or date.today(),
+         "quantity": base + (change or 0.0)}
+        for item_id, _, change, base in tails
+    ])
+    db.commit()
+    return len(tails)
+
+
+class Drift(NamedTuple):
+    item_id: int
+    name: str
+    recorded: float  # InventoryItem.quantity
+    derived: float  # From the log
+
+
+def reconcile(db, fix: bool = False) -> List[Drift]:
+    """Items whose cached quantity disagrees with their log. With `fix`, reset them to the log and commit."""
+    levels = stock_levels(db)
+    drift = []
+    for item in db.query(InventoryItem).order_by(InventoryItem.id):
+        derived = levels.get(item.id, 0.0)
+        if abs((item.quantity or 0.0) - derived) > DRIFT_TOLERANCE:
+            drift.append(Drift(item.id, item.name, item.quantity or 0.0, derived))
+            if fix:
+                item.quantity = derived
+    if fix and drift:
+        db.commit()
+    return drift
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import get_db
+
+    parser = argparse.ArgumentParser(description="Inventory log maintenance")
+    parser.add_argument("--reconcile", action="store_true", help="report items whose quantity drifted from the log")
+    parser.add_argument("--fix", action="store_true", help="with --reconcile, reset drifted quantities to the log")
+    parser.add_argument("--snapshot", action="store_true", help="snapshot items with long event tails")
+    args = parser.parse_args()
+
+    gen = get_db()
+    session = next(gen)
+    try:
+        if args.snapshot:
+            print(f"Snapshotted {take_snapshots(session)} item(s).")
+        if args.reconcile or not args.snapshot:
+            drift = reconcile(session, fix=args.fix)
+            for d in drift:
+                print(f"{d.name} (#{d.item_id}): recorded {d.recorded:g}, log says {d.derived:g}")
+            print(f"{len(drift)} item(s) drifted{' - fixed' if args.fix and drift else ''}.")
+    finally:
+        gen.close()
@@ -0,0 +1,166 @@
+"""Keyed worker pool for update processing.
+
+aiogram normally starts one task per incoming update, so two quick taps from
+the same user can race through the FSM, while one slow report holds nothing
+back but also has no bound. KeyedDispatcher instead routes every update to
+one of UPDATE_WORKERS worker tasks by chat (falling back to user) id:
+
+- updates from the same chat always land on the same worker and run strictly
+  in arrival order, so FSM state is read and written in sequence;
+- different chats spread over the workers and run concurrently;
+- each worker keeps queue-depth and latency counters (see `stats()`).
+
+Blocking work already leaves the event loop through `run_db`, so workers are
+asyncio tasks rather than processes (the FSM and the caches are in-process).
+Set UPDATE_WORKERS=0 to fall back to aiogram's task-per-update behaviour.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+
+logger = logging.getLogger(__name__)
+
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "4"))
+
+
+class WorkerStats:
+    """Counters for one worker. Latency = queue wait + handling, in seconds."""
+
+    __slots__ = ("processed", "errors", "wait_total", "run_total", "max_latency", "max_depth")
+
+    def __init__(self):
+        self.processed = 0
+        self.errors = 0
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.max_latency = 0.0
+        self.max_depth = 0
+
+    def as_dict(self, depth: int) -> Dict[str, Any]:
+        n = self.processed or 1
+        return {
+            "queue_depth": depth,
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "errors": self.errors,
+            "avg_wait": self.wait_total / n,
+            "avg_run": self.run_total / n,
+            "max_latency": self.max_latency,
+        }
+
+
+class UpdateWorkerPool:
+    """N asyncio workers, each draining its own FIFO queue."""
+
+    def __init__(self, workers: int = UPDATE_WORKERS):
+        self.size = workers
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._stats = [WorkerStats() for _ in range(workers)]
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Spawn the workers on the running loop (idempotent)."""
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue() for _ in range(self.size)]
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"update-worker-{i}") for i in range(self.size)
+        ]
+
+    def submit(self, key: int, fn, *args, **kwargs) -> asyncio.Future:
+        """Queue `await fn(*args, **kwargs)` on the worker owning `key`; returns its future."""
+        self.start()
+        index = hash(key) % self.size
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues[index]
+        queue.put_nowait((time.monotonic(), future, fn, args, kwargs))
+        stats = self._stats[index]
+        stats.max_depth = max(stats.max_depth, queue.qsize())
+        return future
+
+    async def _worker(self, index: int):
+        queue, stats = self._queues[index], self._stats[index]
+        while True:
+            enqueued, future, fn, args, kwargs = await queue.get()
+            started = time.monotonic()
+            try:
+                if not future.cancelled():
+                    result = await fn(*args, **kwargs)
+                    if not future.done():
+                        future.set_result(result)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                stats.errors += 1
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                done = time.monotonic()
+                stats.processed += 1
+                stats.wait_total += started - enqueued
+                stats.run_total += done - started
+                stats.max_latency = max(stats.max_latency, done - enqueued)
+                queue.task_done()
+
+    async def stop(self, timeout: float = 10):
+        """Let queued updates finish (up to `timeout` seconds), then stop the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping update workers with %d update(s) still queued",
+                           sum(q.qsize() for q in self._queues))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-worker counters, in worker order."""
+        return [
+            s.as_dict(self._queues[i].qsize() if self._queues else 0)
+            for i, s in enumerate(self._stats)
+        ]
+
+
+def update_key(update) -> Optional[int]:
+    """Ordering key for an update: its chat id, else its user id."""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat:
+        return context.chat.id
+    if context.user:
+        return context.user.id
+    return None
+
+
+class KeyedDispatcher(Dispatcher):
+    """Dispatcher that runs updates through an UpdateWorkerPool (see module docstring).
+
+    Polling and webhooks both end in `feed_update`, so routing there covers
+    both. Updates with no chat or user are spread by update id.
+    """
+
+    def __init__(self, *args, workers: int = UPDATE_WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = UpdateWorkerPool(workers) if workers > 0 else None
+        if self.pool:
+            self.shutdown.register(self.pool.stop)
+
+    async def feed_update(self, bot, update, **kwargs):
+        if not self.pool:
+            return await super().feed_update(bot, update, **kwargs)
+        key = update_key(update)
+        return await self.pool.submit(
+            update.update_id if key is None else key, super().feed_update, bot, update, **kwargs
+        )
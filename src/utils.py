@@ -1,5 +1,10 @@
+import os
+import threading
+import time
+import commit_hooks
 import database
-from database import get_db, User
+from database import run_db, User
+from money import to_money
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 # Role-based permissions
@@ -9,20 +14,56 @@ ROLE_PERMISSIONS = {
     "STAFF": ["daily_wizard", "health"]  # Basic access only
 }
 
-def get_user_role(telegram_id: int) -> str:
+# Role cache: (demo mode, telegram_id) -> (resolved_at, role)
+ROLE_CACHE_TTL = float(os.getenv("ROLE_CACHE_TTL", "300"))
+_role_cache = {}
+_role_lock = threading.Lock()
+_role_generation = 0  # Bumped by every invalidation; a lookup that raced one is not cached
+
+def _load_user_role(db, telegram_id: int) -> str | None:
+    user = db.query(User).filter_by(telegram_id=telegram_id, is_active=True).first()
+    return user.role if user else None
+
+def invalidate_user_role(telegram_id: int | None = None):
+    """Drop cached roles for one user, or for everyone."""
+    global _role_generation
+    with _role_lock:
+        _role_generation += 1
+        if telegram_id is None:
+            _role_cache.clear()
+        else:
+            for key in [k for k in _role_cache if k[1] == telegram_id]:
+                del _role_cache[key]
+
+async def get_user_role(telegram_id: int) -> str:
     """Get user role from database, default to ADMIN for ADMIN_IDS, STAFF otherwise."""
     from config import cfg
+    key = (database.IS_DEMO_MODE, telegram_id)
+    with _role_lock:
+        cached = _role_cache.get(key)
+        generation = _role_generation
+    if cached and time.monotonic() - cached[0] < ROLE_CACHE_TTL:
+        return cached[1]
+    
     try:
-        db = next(get_db())
-        user = db.query(User).filter_by(telegram_id=telegram_id, is_active=True).first()
-        db.close()
-        if user:
-            return user.role
+        role = await run_db(_load_user_role, telegram_id)
     except Exception:
-        pass  # Table doesn't exist yet or other DB error
+        return "ADMIN" if telegram_id in cfg.ADMIN_IDS else "STAFF"  # Table doesn't exist yet or other DB error; don't cache
     
     # Fallback: ADMIN_IDS get ADMIN role, others get STAFF
-    return "ADMIN" if telegram_id in cfg.ADMIN_IDS else "STAFF"
+    if not role:
+        role = "ADMIN" if telegram_id in cfg.ADMIN_IDS else "STAFF"
+    with _role_lock:
+        if generation == _role_generation:  # Else a User change committed meanwhile; it may predate our read
+            _role_cache[key] = (time.monotonic(), role)
+    return role
+
+# Invalidate after COMMIT (or ROLLBACK) of any session that added, changed or removed a User
+def _invalidate_changed_users(engine, telegram_ids):
+    for telegram_id in telegram_ids:
+        invalidate_user_role(telegram_id)
+
+commit_hooks.on_commit((User,), _invalidate_changed_users, note=lambda user: user.telegram_id, bulk=False)
 
 def get_main_menu_keyboard(role: str = "ADMIN"):
     """Generate role-filtered main menu keyboard."""
@@ -75,6 +116,15 @@ def get_back_home_keyboard(back_callback: str = 'main_menu'):
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def format_currency(amount: float) -> str:
-    return f"Ksh {amount:,.0f}"
+def format_currency(amount) -> str:
+    """Whole shillings from a Decimal money value, float or int (None shows as 0)."""
+    return f"Ksh {to_money(amount):,.0f}"
+
+def escape_markdown(text: str) -> str:
+    """Backslash-escape user text for parse_mode="Markdown" (legacy) messages.
+
+    Legacy Markdown does not allow escapes inside an entity, so the result
+    must sit outside any _italic_ or *bold* markers.
+    """
+    return "".join(f"\\{ch}" if ch in "\\_*`[" else ch for ch in text)
  # Adjustable currency
@@ -0,0 +1,153 @@
+"""Per-flock vaccination schedule.
+
+When a flock is created its doses are written to `vaccination_schedule`
+with absolute due dates, so "what is due today / tomorrow / overdue" is one
+range query on (status, due_date) instead of recomputing every active
+flock's age against the schedule on each check.
+
+The schedule comes from DEFAULT_SCHEDULE unless the breed has its own,
+stored as JSON in the settings table under `vaccine_schedule:<breed>`
+(e.g. {"7": "Newcastle", "14": "Gumboro"}) - see `set_breed_schedule`.
+Saving a VaccinationRecord marks the matching pending dose DONE
+(`reconcile_record`).
+"""
+import json
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from database import Flock, VaccinationRecord, VaccinationSchedule
+from settings_cache import get_setting, set_setting
+
+# Kenyan Poultry Vaccination Schedule (Day: Vaccine)
+# From docs/kenyan_poultry_vaccination_guide.md
+DEFAULT_SCHEDULE = {
+    7: "Newcastle (1st)",
+    10: "Gumboro (1st)",
+    14: "Newcastle Booster",
+    18: "Gumboro (2nd)",
+    21: "Newcastle (1st) - Kienyeji",  # Week 3
+    28: "Newcastle + IB",
+    42: "Fowl Pox",        # Week 6
+    56: "Fowl Typhoid",    # Week 8
+    112: "Deworming",      # Week 16
+    126: "Newcastle + IB (Layer Boost)" # Week 18+
+}
+
+OVERDUE_DAYS = 14  # Pending doses older than this are no longer reported
+MATCH_WINDOW_DAYS = 7  # A record counts for a dose due within this many days of it
+_GENERIC_WORDS = {"1st", "2nd", "booster", "boost", "layer", "kienyeji", "vaccine", "dose"}
+
+
+def _setting_key(breed: str) -> str:
+    return f"vaccine_schedule:{(breed or '').strip().lower()}"
+
+
+def schedule_for_breed(db, breed: str) -> Dict[int, str]:
+    """{age in days: vaccine} for a breed, falling back to DEFAULT_SCHEDULE."""
+    raw = get_setting(db, _setting_key(breed))
+    if raw:
+        try:
+            return {int(day): name for day, name in json.loads(raw).items()}
+        except (ValueError, AttributeError):
+            pass  # Malformed setting: use the default rather than no schedule
+    return DEFAULT_SCHEDULE
+
+
+def set_breed_schedule(db, breed: str, schedule: Dict[int, str]) -> int:
+    """Store a breed's schedule and re-plan the pending doses of its active flocks.
+
+    Returns the number of flocks re-planned. Changes are left in the caller's
+    transaction.
+    """
+    set_setting(db, _setting_key(breed), json.dumps({str(d): n for d, n in sorted(schedule.items())}))
+    flocks = db.query(Flock).filter(Flock.status == "ACTIVE", func.lower(Flock.breed) == breed.strip().lower()).all()
+    for flock in flocks:
+        db.query(VaccinationSchedule).filter_by(flock_id=flock.id, status="PENDING").delete(synchronize_session=False)
+        generate_schedule(db, flock, schedule, replan=True)
+    return len(flocks)
+
+
+def generate_schedule(db, flock: Flock, schedule: Optional[Dict[int, str]] = None,
+                      replan: bool = False) -> List[VaccinationSchedule]:
+    """Add the flock's doses to the caller's transaction.
+
+    Doses already past on creation (e.g. a bought-in flock) are stored as
+    SKIPPED rather than reported overdue. With `replan`, doses that are
+    already DONE/SKIPPED for the flock are left alone.
+    """
+    if flock.id is None:
+        db.flush()
+    schedule = schedule if schedule is not None else schedule_for_breed(db, flock.breed)
+    existing = set()
+    if replan:
+        existing = {age for (age,) in db.query(VaccinationSchedule.age_days).filter_by(flock_id=flock.id)}
+    today = date.today()
+    rows = []
+    for age, vaccine in sorted(schedule.items()):
+        if age in existing:
+            continue
+        due = flock.hatch_date + timedelta(days=age)
+        rows.append(VaccinationSchedule(
+            flock_id=flock.id, vaccine_name=vaccine, age_days=age, due_date=due,
+            status="PENDING" if due >= today else "SKIPPED",
+        ))
+    db.add_all(rows)
+    return rows
+
+
+def due_doses(db, start: date, end: date) -> List[Tuple[VaccinationSchedule, str]]:
+    """(pending dose, flock name) due between start and end inclusive, for active flocks."""
+    return (
+        db.query(VaccinationSchedule, Flock.name)
+        .join(Flock, VaccinationSchedule.flock_id == Flock.id)
+        .filter(
+            VaccinationSchedule.status == "PENDING",
+            VaccinationSchedule.due_date.between(start, end),
+            Flock.status == "ACTIVE",
+        )
+        .order_by(VaccinationSchedule.due_date, VaccinationSchedule.flock_id)
+        .all()
+    )
+
+
+def next_dose(db, flock_id: int, around: date, days: int = 3) -> Optional[VaccinationSchedule]:
+    """The flock's pending dose due closest to `around`, within +/- `days`."""
+    doses = db.query(VaccinationSchedule).filter(
+        VaccinationSchedule.flock_id == flock_id,
+        VaccinationSchedule.status == "PENDING",
+        VaccinationSchedule.due_date.between(around - timedelta(days=days), around + timedelta(days=days)),
+    ).all()
+    return min(doses, key=lambda d: abs((d.due_date - around).days), default=None)
+
+
+def _keywords(name: str) -> set:
+    return {w for w in re.findall(r"[a-z0-9]+", (name or "").lower()) if len(w) >= 3} - _GENERIC_WORDS
+
+
+def reconcile_record(db, record: VaccinationRecord) -> Optional[VaccinationSchedule]:
+    """Mark the pending dose this record fulfils as DONE (record must be flushed).
+
+    The dose must be for the same flock, due within MATCH_WINDOW_DAYS of the
+    record, and share a word with its vaccine name ("Newcastle Lasota"
+    fulfils "Newcastle Booster"); the closest due date wins.
+    """
+    day = record.date or date.today()
+    words = _keywords(record.vaccine_name)
+    candidates = [
+        dose for dose in db.query(VaccinationSchedule).filter(
+            VaccinationSchedule.flock_id == record.flock_id,
+            VaccinationSchedule.status == "PENDING",
+            VaccinationSchedule.due_date.between(day - timedelta(days=MATCH_WINDOW_DAYS),
+                                                 day + timedelta(days=MATCH_WINDOW_DAYS)),
+        )
+        if words & _keywords(dose.vaccine_name)
+    ]
+    if not candidates:
+        return None
+    dose = min(candidates, key=lambda d: abs((d.due_date - day).days))
+    dose.status = "DONE"
+    dose.record_id = record.id
+    return dose
@@ -0,0 +1,68 @@
+"""Webhook delivery as an alternative to long polling.
+
+Set WEBHOOK_URL (the public HTTPS base URL, e.g. behind a reverse proxy) to
+switch `bot.py` from polling to webhook mode. An aiohttp server listens on
+WEBHOOK_HOST:WEBHOOK_PORT, Telegram POSTs each update to WEBHOOK_PATH, and
+the update is acknowledged at once and handled in the background. Requests
+without the WEBHOOK_SECRET token header are rejected with 401. The same
+server answers Prometheus scrapes on METRICS_PATH.
+"""
+import asyncio
+import logging
+import os
+import secrets
+
+from aiohttp import web
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from tenacity import retry, stop_never, wait_exponential, retry_if_exception_type, before_sleep_log
+
+from metrics import METRICS_PATH, metrics_view
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token; random per run if unset
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+
+
+def build_webhook_app(dp, bot, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                      handle_in_background: bool = True) -> web.Application:
+    """aiohttp app that feeds POSTed updates on `path` into `dp`."""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=handle_in_background
+    ).register(app, path=path)
+    app.router.add_get(METRICS_PATH, metrics_view)  # Prometheus scrape target
+    setup_application(app, dp, bot=bot)  # Runs dp startup/shutdown hooks with the server
+    return app
+
+
+@retry(
+    stop=stop_never,
+    wait=wait_exponential(multiplier=1, min=4, max=60),
+    retry=retry_if_exception_type((TelegramNetworkError, ConnectionError, OSError)),
+    before_sleep=before_sleep_log(logger, logging.WARNING)
+)
+async def register_webhook(bot, url: str, secret: str, allowed_updates):
+    """Point Telegram at our endpoint, retrying on network errors."""
+    await bot.set_webhook(url, secret_token=secret, allowed_updates=allowed_updates)
+
+
+async def run_webhook(dp, bot, url: str = WEBHOOK_URL, path: str = WEBHOOK_PATH,
+                      host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, secret: str = WEBHOOK_SECRET):
+    """Register the webhook with Telegram and serve until cancelled."""
+    app = build_webhook_app(dp, bot, path, secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        await register_webhook(bot, f"{url}{path}", secret, dp.resolve_used_update_types())
+        logger.info("Webhook listening on %s:%s%s (public %s%s)", host, port, path, url, path)
+        await asyncio.Event().wait()  # Serve forever
+    finally:
+        await runner.cleanup()
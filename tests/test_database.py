@@ -1,6 +1,6 @@
 """Tests for database models and CRUD operations."""
 from datetime import date
-from database import DailyEntry, SystemSettings
+from database import DailyEntry, SystemSettings, AuditLog
 
 
 class TestDailyEntry:
@@ -78,3 +78,454 @@ class TestSystemSettings:
 
         result = db_session.query(SystemSettings).filter_by(key="egg_price").first()
         assert result.value == "35"
+
+
+class TestRunDb:
+    """Tests for the thread-pool session helper used by handlers."""
+
+    def test_run_db_uses_fresh_session_off_loop(self, tmp_path, monkeypatch):
+        """run_db runs the callable in a worker thread and closes its session."""
+        import asyncio
+        import threading
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        import database
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'run_db.db'}")
+        database.Base.metadata.create_all(engine)
+        monkeypatch.setattr(database, "ProdSessionLocal", sessionmaker(bind=engine))
+
+        def work(db, value):
+            db.add(SystemSettings(key="price_per_egg", value=value))
+            db.commit()
+            return threading.current_thread().name, db
+
+        thread_name, session = asyncio.run(database.run_db(work, "20"))
+
+        assert thread_name.startswith("avionyx-db")
+        assert not session.in_transaction()
+        check = sessionmaker(bind=engine)()
+        assert check.query(SystemSettings).filter_by(key="price_per_egg").one().value == "20"
+        check.close()
+
+
+class TestEngineConfig:
+    """Tests for the SQLite engine configuration layer."""
+
+    def test_tuned_engine_applies_pragmas(self, tmp_path):
+        """A tuned file engine runs in WAL mode with the configured pragmas."""
+        from sqlalchemy import text
+        from database import create_db_engine
+
+        engine = create_db_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        engine.dispose()
+
+    def test_untuned_engine_keeps_defaults(self, tmp_path):
+        """tuned=False leaves SQLite's rollback journal in place (benchmark baseline)."""
+        from sqlalchemy import text
+        from database import create_db_engine
+
+        engine = create_db_engine(f"sqlite:///{tmp_path / 'default.db'}", tuned=False)
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+        engine.dispose()
+
+
+class TestQueryPlans:
+    """EXPLAIN QUERY PLAN checks that hot handler lookups hit an index."""
+
+    @staticmethod
+    def _plan(session, query):
+        compiled = query.statement.compile(dialect=session.get_bind().dialect)
+        params = tuple(str(compiled.params[k]) for k in compiled.positiontup)
+        rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+        return " | ".join(row[-1] for row in rows)
+
+    def test_hot_queries_use_indexes(self, db_session):
+        """Every filter/sort path used by the modules resolves through an index."""
+        from datetime import timedelta
+        from sqlalchemy import desc, tuple_
+        from database import (
+            FinancialLedger, InventoryLog, InventoryItem, Flock, Contact,
+            VaccinationRecord, DailyFeedUsage, VaccinationSchedule,
+        )
+
+        today = date.today()
+        nocase = Contact.name.collate("NOCASE")
+        hot_queries = {
+            "ledger by date": db_session.query(FinancialLedger).filter(FinancialLedger.date >= today),
+            "ledger by direction/category": db_session.query(FinancialLedger).filter(
+                FinancialLedger.direction == "IN", FinancialLedger.category == "Sales"),
+            "ledger by contact": db_session.query(FinancialLedger).filter(FinancialLedger.contact_id == 1),
+            "inv log by item": db_session.query(InventoryLog).filter(
+                InventoryLog.item_name == "Eggs", InventoryLog.date >= today),
+            "inv log by date": db_session.query(InventoryLog).filter(InventoryLog.date >= today),
+            "inv log by ledger": db_session.query(InventoryLog).filter(InventoryLog.ledger_id == 1),
+            "stock at date": db_session.query(InventoryLog.balance_after).filter(
+                InventoryLog.item_id == 1, InventoryLog.date <= today).order_by(
+                desc(InventoryLog.date), desc(InventoryLog.id)).limit(1),
+            "consumption range": db_session.query(InventoryLog).filter(
+                InventoryLog.item_id == 1, InventoryLog.date.between(today - timedelta(days=7), today)),
+            "items in stock": db_session.query(InventoryItem).filter(
+                InventoryItem.type == "FEED", InventoryItem.quantity > 0),
+            "item by name": db_session.query(InventoryItem).filter_by(name="Eggs"),
+            "active flocks": db_session.query(Flock).filter_by(status="ACTIVE"),
+            "contacts by role": db_session.query(Contact).filter_by(role="CUSTOMER").order_by(Contact.name),
+            "contact page by role": db_session.query(Contact).filter(
+                Contact.role == "CUSTOMER", tuple_(nocase, Contact.id) > ("Bob", 2)).order_by(
+                nocase, Contact.id).limit(9),
+            "contact page": db_session.query(Contact).filter(
+                tuple_(nocase, Contact.id) > ("Bob", 2)).order_by(nocase, Contact.id).limit(9),
+            "contact prefix by role": db_session.query(Contact).filter(
+                Contact.role == "CUSTOMER", nocase >= "bo", nocase < "bo\U0010ffff").order_by(
+                nocase, Contact.id).limit(8),
+            "contact prefix": db_session.query(Contact).filter(
+                nocase >= "bo", nocase < "bo\U0010ffff").order_by(nocase, Contact.id).limit(8),
+            "recent audit": db_session.query(AuditLog).order_by(desc(AuditLog.timestamp)).limit(10),
+            "vaccinations by flock": db_session.query(VaccinationRecord).filter_by(flock_id=1),
+            "vaccinations due": db_session.query(VaccinationRecord).filter(
+                VaccinationRecord.next_due_date.between(today, today + timedelta(days=7))),
+            "recent vaccinations": db_session.query(VaccinationRecord).order_by(
+                desc(VaccinationRecord.date)).limit(5),
+            "feed usage by entry": db_session.query(DailyFeedUsage).filter_by(daily_entry_id=1),
+            "schedule due range": db_session.query(VaccinationSchedule).filter(
+                VaccinationSchedule.status == "PENDING",
+                VaccinationSchedule.due_date.between(today - timedelta(days=14), today + timedelta(days=1))),
+        }
+
+        for name, query in hot_queries.items():
+            plan = self._plan(db_session, query)
+            assert "USING INDEX" in plan or "USING COVERING INDEX" in plan, f"{name}: {plan}"
+            assert "TEMP B-TREE" not in plan, f"{name}: {plan}"
+
+
+class TestDemoDatabase:
+    """Tests for the lazily created demo database."""
+
+    def test_concurrent_first_use_creates_one_engine(self, tmp_path, monkeypatch):
+        from concurrent.futures import ThreadPoolExecutor
+        import database
+
+        monkeypatch.setattr(database, "DEMO_DB_PATH", f"sqlite:///{tmp_path / 'demo.db'}")
+        monkeypatch.setattr(database, "DEMO_FILE", str(tmp_path / "demo.db"))
+        monkeypatch.setattr(database, "IS_DEMO_MODE", True)
+        created = []
+        real_create = database.create_db_engine
+
+        def counting_create(url, *args, **kwargs):
+            created.append(url)
+            return real_create(url, *args, **kwargs)
+        monkeypatch.setattr(database, "create_db_engine", counting_create)
+
+        def use(_):
+            gen = database.get_db()
+            db = next(gen)
+            gen.close()
+            return db.get_bind()
+
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                binds = set(pool.map(use, range(16)))
+            assert len(created) == 1 and binds == {database.demo_engine}
+        finally:
+            database.wipe_demo_db()
+        assert database.DemoSessionLocal is None and not database.IS_DEMO_MODE
+
+
+class TestCommitHooks:
+    """Tests for the shared write tracking behind the in-process caches."""
+
+    def test_callback_runs_after_commit_and_rollback(self, db_session, monkeypatch):
+        """Flushed rows and bulk statements are reported once the transaction ends, not before."""
+        from sqlalchemy import update
+        import commit_hooks
+        from database import InventoryItem
+
+        monkeypatch.setattr(commit_hooks, "_trackers", [])
+        calls = []
+        commit_hooks.on_commit((SystemSettings,), lambda engine, notes: calls.append(("table", notes)))
+        commit_hooks.on_commit((SystemSettings,), lambda engine, notes: calls.append(("key", notes)),
+                               note=lambda setting: setting.key, bulk=False)
+
+        db_session.add(SystemSettings(key="price_per_egg", value="15"))
+        db_session.flush()
+        assert calls == []
+        db_session.commit()
+        assert calls == [("table", {"settings"}), ("key", {"price_per_egg"})]
+
+        calls.clear()
+        db_session.execute(update(SystemSettings).values(value="18"))
+        db_session.rollback()
+        assert calls == [("table", {"settings"})]  # Bulk statements only for trackers that want them
+
+        calls.clear()
+        db_session.add(InventoryItem(name="Layers Mash", type="FEED", quantity=1))
+        db_session.commit()
+        assert calls == []
+
+
+class TestSettingsCache:
+    """Tests for the in-memory settings cache."""
+
+    def test_reads_are_served_from_memory(self, db_session):
+        """After the first load, repeated reads issue no SQL."""
+        from sqlalchemy import event
+        from settings_cache import get_float, invalidate
+
+        db_session.add(SystemSettings(key="price_per_egg", value="18"))
+        db_session.commit()
+        invalidate()
+
+        statements = []
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        assert get_float(db_session, "price_per_egg", 15.0) == 18.0
+        assert get_float(db_session, "price_per_crate", 450.0) == 450.0
+        assert get_float(db_session, "price_per_egg", 15.0) == 18.0
+        assert len(statements) == 1
+
+    def test_commit_invalidates(self, db_session):
+        """A committed write is visible on the next read; a rollback is not."""
+        from settings_cache import get_setting, set_setting
+
+        assert get_setting(db_session, "feed_bag_weight") is None
+        set_setting(db_session, "feed_bag_weight", 50.0)
+        db_session.commit()
+        assert get_setting(db_session, "feed_bag_weight") == "50.0"
+
+        set_setting(db_session, "feed_bag_weight", 25.0)
+        db_session.flush()
+        assert get_setting(db_session, "feed_bag_weight") == "50.0"  # Still cached
+        db_session.rollback()
+        assert get_setting(db_session, "feed_bag_weight") == "50.0"
+
+    def test_read_racing_a_commit_is_not_cached(self, tmp_path, monkeypatch):
+        """A load whose query ran before a commit must not re-cache the old values after it."""
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        import settings_cache
+        from settings_cache import get_setting, set_setting
+        from database import Base
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'settings.db'}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        reader, writer = Session(), Session()
+        set_setting(writer, "price_per_egg", "15")
+        writer.commit()
+        settings_cache.invalidate()
+
+        real_query = settings_cache._query_settings
+
+        def query_then_commit(db):
+            values = real_query(db)  # Old value read...
+            set_setting(writer, "price_per_egg", "18")
+            writer.commit()  # ...then the write commits and invalidates
+            return values
+        monkeypatch.setattr(settings_cache, "_query_settings", query_then_commit)
+        assert get_setting(reader, "price_per_egg") == "15"
+
+        monkeypatch.setattr(settings_cache, "_query_settings", real_query)
+        assert get_setting(reader, "price_per_egg") == "18"
+
+
+class TestRoleCache:
+    """Tests for cached role lookups and the role middleware."""
+
+    def test_role_cached_until_user_changes(self, tmp_path, monkeypatch):
+        """Repeat lookups skip the database; committing a User change invalidates."""
+        import asyncio
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        import database
+
+        monkeypatch.setenv("TELEGRAM_TOKEN", "123:abc")
+        import utils
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'roles.db'}")
+        database.Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        monkeypatch.setattr(database, "ProdSessionLocal", Session)
+        utils.invalidate_user_role()
+
+        lookups = []
+        real_load = utils._load_user_role
+        monkeypatch.setattr(utils, "_load_user_role", lambda db, tid: lookups.append(tid) or real_load(db, tid))
+
+        session = Session()
+        user = database.User(telegram_id=42, name="Wanjiru", role="MANAGER")
+        session.add(user)
+        session.commit()
+
+        assert asyncio.run(utils.get_user_role(42)) == "MANAGER"
+        assert asyncio.run(utils.get_user_role(42)) == "MANAGER"
+        assert lookups == [42]
+
+        user.is_active = False
+        session.commit()
+        session.close()
+        assert asyncio.run(utils.get_user_role(42)) == "STAFF"
+        assert lookups == [42, 42]
+
+    def test_lookup_racing_a_demotion_is_not_cached(self, tmp_path, monkeypatch):
+        """A role read before a demotion commits is not cached past that commit."""
+        import asyncio
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        import database
+
+        monkeypatch.setenv("TELEGRAM_TOKEN", "123:abc")
+        import utils
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'roles.db'}")
+        database.Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        monkeypatch.setattr(database, "ProdSessionLocal", Session)
+        utils.invalidate_user_role()
+
+        writer = Session()
+        user = database.User(telegram_id=42, name="Wanjiru", role="ADMIN")
+        writer.add(user)
+        writer.commit()
+
+        real_load = utils._load_user_role
+
+        def load_then_demote(db, tid):
+            role = real_load(db, tid)  # Old role read...
+            user.role = "STAFF"
+            writer.commit()  # ...then the demotion commits and invalidates
+            return role
+        monkeypatch.setattr(utils, "_load_user_role", load_then_demote)
+        assert asyncio.run(utils.get_user_role(42)) == "ADMIN"
+
+        monkeypatch.setattr(utils, "_load_user_role", real_load)
+        assert asyncio.run(utils.get_user_role(42)) == "STAFF"
+        writer.close()
+
+    def test_middleware_injects_role(self, monkeypatch):
+        """RoleMiddleware adds `role` to handler data for the update's sender."""
+        import asyncio
+        from types import SimpleNamespace
+        monkeypatch.setenv("TELEGRAM_TOKEN", "123:abc")
+        import middlewares
+
+        async def fake_role(telegram_id):
+            return "ADMIN" if telegram_id == 1 else "STAFF"
+        monkeypatch.setattr(middlewares, "get_user_role", fake_role)
+
+        async def handler(event, data):
+            return data.get("role")
+
+        mw = middlewares.RoleMiddleware()
+        assert asyncio.run(mw(handler, object(), {"event_from_user": SimpleNamespace(id=1)})) == "ADMIN"
+        assert asyncio.run(mw(handler, object(), {})) is None
+
+
+class TestFSMStorage:
+    """Tests for the persistent, write-coalescing FSM storage."""
+
+    @staticmethod
+    def _key(user_id=7):
+        from aiogram.fsm.storage.base import StorageKey
+        return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+    @staticmethod
+    def _rows(path):
+        import sqlite3
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT key, state, data FROM fsm_records").fetchall()
+        finally:
+            conn.close()
+
+    def test_state_survives_restart(self, tmp_path):
+        """Data written before close() is read back by a fresh storage."""
+        import asyncio
+        from fsm_storage import SQLiteStorage
+        path = str(tmp_path / "fsm.db")
+
+        async def first():
+            storage = SQLiteStorage(path, flush_interval=60)
+            await storage.set_state(self._key(), "ExpenseStates:amount")
+            for i in range(10):
+                await storage.update_data(self._key(), {f"field_{i}": i, "category": "Feed"})
+            assert self._rows(path) == []  # Coalesced: nothing written yet
+            await storage.close()
+
+        async def second():
+            storage = SQLiteStorage(path)
+            try:
+                return await storage.get_state(self._key()), await storage.get_data(self._key())
+            finally:
+                await storage.close()
+
+        asyncio.run(first())
+        rows = self._rows(path)
+        assert len(rows) == 1 and rows[0][1] == "ExpenseStates:amount"
+        assert " " not in rows[0][2]  # Compact JSON
+
+        state, data = asyncio.run(second())
+        assert state == "ExpenseStates:amount"
+        assert data["field_9"] == 9 and data["category"] == "Feed" and len(data) == 11
+
+    def test_clear_deletes_and_abandoned_state_expires(self, tmp_path):
+        """Cleared conversations are removed; stale ones read back empty."""
+        import asyncio
+        import sqlite3
+        from fsm_storage import SQLiteStorage
+        path = str(tmp_path / "fsm.db")
+
+        async def run():
+            storage = SQLiteStorage(path, flush_interval=0, ttl=3600)
+            await storage.set_state(self._key(1), "DailyWizardStates:eggs")
+            await storage.set_data(self._key(2), {"x": 1})
+            await storage.set_state(self._key(1), None)
+            await storage.close()
+
+            conn = sqlite3.connect(path)
+            conn.execute("UPDATE fsm_records SET updated_at = updated_at - 7200")
+            conn.commit()
+            conn.close()
+
+            storage = SQLiteStorage(path, flush_interval=0, ttl=3600)
+            try:
+                return await storage.get_data(self._key(2))
+            finally:
+                await storage.close()
+
+        assert asyncio.run(run()) == {}
+        assert self._rows(path) == []
+
+
+class TestMoney:
+    """Tests for integer-cent money columns."""
+
+    def test_amounts_round_trip_and_sum_exactly(self, db_session):
+        """Cents are stored as integers and SQL sums come back as exact Decimals."""
+        from decimal import Decimal
+        from sqlalchemy import func
+        from database import FinancialLedger
+
+        for amount in (0.1, 0.2, "1234.565"):
+            db_session.add(FinancialLedger(amount=amount, direction="IN", category="Egg Sales"))
+        db_session.commit()
+
+        raw = db_session.connection().exec_driver_sql("SELECT amount FROM financial_ledger ORDER BY id").fetchall()
+        assert [r[0] for r in raw] == [10, 20, 123457]
+        assert db_session.query(func.sum(FinancialLedger.amount)).scalar() == Decimal("1234.87")
+
+    def test_assigned_floats_are_decimals_before_flush(self, db_session):
+        """Handler arithmetic can mix fresh and loaded amounts without a flush."""
+        from decimal import Decimal
+        from database import DailyEntry
+        from money import line_total
+
+        entry = DailyEntry(income=300.5)
+        assert entry.income == Decimal("300.50")
+        entry.income += line_total(3, 12.25)
+        assert entry.income == Decimal("337.25")